@@ -0,0 +1,250 @@
+"""本地任务准入队列：按优先级排队，限制每个后端和每个调用方同时在ComfyUI中的任务数
+
+ComfyUI自身的队列是先进先出的，一次大批量提交会让之后的交互请求排在最后。任务先进入本地队列，
+只有后端的负载低于上限时才按优先级放行；后端达到上限后，要等负载降到低水位以下才继续放行，
+避免每结束一个任务就立刻补一个、始终把队列塞满。
+
+后端的负载取本服务的在途任务数（已放行、尚未结束）与后端池缓存的队列深度中较大的一个，后者包含
+其他客户端直接提交到ComfyUI的任务。队列深度在两次健康检查之间按本服务的提交和结束增减，是近似值。
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from metrics import ADMISSION_QUEUE_SECONDS, ADMISSION_QUEUED, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 优先级名称 -> 排序值（越小越先放行）
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+
+class QueueFullError(Exception):
+    """本地队列已满"""
+
+
+class Ticket:
+    """本地队列中的一个任务"""
+
+    def __init__(self, prompt_id, workflow_name, workflow_data, priority='normal', client=None, models=()):
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        self.prompt_id = prompt_id
+        self.workflow_name = workflow_name
+        self.workflow_data = workflow_data
+        self.priority = priority
+        self.client = client
+        self.models = models
+        self.enqueued_at = time.monotonic()
+        self.seq = None
+        # 提交失败后重新排队的次数，以及最早可以再次放行的时间
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+class AdmissionQueue:
+    """优先级队列加每个后端、每个调用方的在途任务计数"""
+
+    def __init__(self, backend_pool, max_inflight=4, watermark=None, max_per_client=0, max_queued=1000):
+        self.backend_pool = backend_pool
+        self.max_inflight = max(1, max_inflight)
+        self.watermark = self.max_inflight if watermark is None else min(max(1, watermark), self.max_inflight)
+        # 0 表示不限制单个调用方
+        self.max_per_client = max_per_client
+        self.max_queued = max_queued
+        self._heap = []
+        self._queued = {}
+        self._seq = itertools.count()
+        self._inflight = {}
+        self._client_inflight = {}
+        # 已放行、尚未结束的任务：prompt_id -> (backend, client)
+        self._released = {}
+        # 达到上限、等待降到低水位的后端
+        self._saturated = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._dispatch = None
+        self._poll = None
+        REGISTRY.add_collector(self._collect_metrics)
+
+    def start(self, dispatch, poll=None, poll_interval=2.0):
+        """启动放行线程
+
+        dispatch(ticket, backend) 把任务提交到ComfyUI；poll(prompt_ids) 在队列被阻塞时定期调用，
+        用于在事件流离线时补全在途任务的状态。
+        """
+        with self._cond:
+            self._dispatch = dispatch
+            self._poll = poll
+            self._poll_interval = poll_interval
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='admission', daemon=True)
+                self._thread.start()
+
+    def _load(self, backend):
+        return max(self._inflight.get(backend.base_url, 0), backend.queue_depth)
+
+    def _backend_ready(self, backend):
+        load = self._load(backend)
+        if backend.base_url in self._saturated:
+            if load >= self.watermark:
+                return False
+            self._saturated.discard(backend.base_url)
+        if load >= self.max_inflight:
+            self._saturated.add(backend.base_url)
+            return False
+        return True
+
+    def _client_ready(self, client):
+        return self.max_per_client <= 0 or self._client_inflight.get(client, 0) < self.max_per_client
+
+    def _choose_backend(self, ticket):
+        # 负载包含后端的队列深度，只有一个后端时也需要后台刷新
+        self.backend_pool.start(track_queue=True)
+        full = [b.base_url for b in self.backend_pool.backends if not self._backend_ready(b)]
+        if len(full) == len(self.backend_pool.backends):
+            return None
+        return self.backend_pool.choose(ticket.models, exclude=full).base_url
+
+    def _reserve(self, ticket, backend):
+        self._inflight[backend] = self._inflight.get(backend, 0) + 1
+        if self._load(self.backend_pool.get(backend)) >= self.max_inflight:
+            self._saturated.add(backend)
+        self._client_inflight[ticket.client] = self._client_inflight.get(ticket.client, 0) + 1
+        self._released[ticket.prompt_id] = (backend, ticket.client)
+
+    def submit(self, ticket):
+        """有空闲名额且没有同级或更高优先级的任务在排队时，立即占用名额并返回后端；否则排队返回 None"""
+        with self._cond:
+            rank = PRIORITIES[ticket.priority]
+            if not (self._heap and self._heap[0][0] <= rank) and self._client_ready(ticket.client):
+                backend = self._choose_backend(ticket)
+                if backend is not None:
+                    self._reserve(ticket, backend)
+                    ADMISSION_QUEUE_SECONDS.observe(0, priority=ticket.priority)
+                    return backend
+            if len(self._queued) >= self.max_queued:
+                raise QueueFullError(f'Local job queue is full ({self.max_queued} jobs)')
+            ticket.seq = next(self._seq)
+            heapq.heappush(self._heap, (rank, ticket.seq, ticket))
+            self._queued[ticket.prompt_id] = ticket
+            self._cond.notify_all()
+            return None
+
+    def _pick(self):
+        """按优先级找到第一个可以放行的任务，返回 (ticket, backend)"""
+        now = time.monotonic()
+        for entry in sorted(self._heap):
+            ticket = entry[2]
+            if ticket.not_before > now or not self._client_ready(ticket.client):
+                continue
+            backend = self._choose_backend(ticket)
+            if backend is None:
+                return None
+            self._heap.remove(entry)
+            heapq.heapify(self._heap)
+            del self._queued[ticket.prompt_id]
+            self._reserve(ticket, backend)
+            return ticket, backend
+        return None
+
+    def _wait_timeout(self):
+        """等待到下一个重新排队的任务可以放行，最长 poll_interval"""
+        now = time.monotonic()
+        return min([self._poll_interval] + [
+            ticket.not_before - now for _, _, ticket in self._heap if ticket.not_before > now
+        ])
+
+    def _run(self):
+        while True:
+            with self._cond:
+                picked = self._pick()
+                while picked is None:
+                    if not self._cond.wait(self._wait_timeout()) and self._heap and self._poll is not None:
+                        # 队列被阻塞且长时间没有任务结束，可能是事件流离线
+                        released = list(self._released)
+                        self._cond.release()
+                        try:
+                            self._poll(released)
+                        except Exception:
+                            logger.exception('Admission poll failed')
+                        finally:
+                            self._cond.acquire()
+                    picked = self._pick()
+            ticket, backend = picked
+            ADMISSION_QUEUE_SECONDS.observe(time.monotonic() - ticket.enqueued_at, priority=ticket.priority)
+            try:
+                self._dispatch(ticket, backend)
+            except Exception as e:
+                logger.warning('Queued prompt could not be submitted: %s', e,
+                               extra={'prompt_id': ticket.prompt_id, 'workflow': ticket.workflow_name})
+
+    def moved(self, prompt_id, backend):
+        """提交时切换了后端（原后端连接失败），把名额记到实际的后端上"""
+        with self._cond:
+            entry = self._released.get(prompt_id)
+            if entry is None or entry[0] == backend:
+                return
+            self._inflight[entry[0]] -= 1
+            self._inflight[backend] = self._inflight.get(backend, 0) + 1
+            self._released[prompt_id] = (backend, entry[1])
+            self._cond.notify_all()
+
+    def _unreserve(self, prompt_id):
+        entry = self._released.pop(prompt_id, None)
+        if entry is None:
+            return
+        backend, client = entry
+        self._inflight[backend] -= 1
+        self._client_inflight[client] -= 1
+        if not self._client_inflight[client]:
+            del self._client_inflight[client]
+
+    def release(self, prompt_id):
+        """任务结束后归还名额，重复调用无影响"""
+        with self._cond:
+            self._unreserve(prompt_id)
+            self._cond.notify_all()
+
+    def retry(self, ticket, delay):
+        """提交失败（后端暂时不可用）时归还名额，delay 秒后按原来的优先级和顺序重新放行"""
+        with self._cond:
+            self._unreserve(ticket.prompt_id)
+            ticket.attempts += 1
+            ticket.not_before = time.monotonic() + delay
+            if ticket.seq is None:
+                ticket.seq = next(self._seq)
+            heapq.heappush(self._heap, (PRIORITIES[ticket.priority], ticket.seq, ticket))
+            self._queued[ticket.prompt_id] = ticket
+            self._cond.notify_all()
+
+    def is_queued(self, prompt_id):
+        return prompt_id in self._queued
+
+    def position(self, prompt_id):
+        """任务在本地队列中的位置（从1开始），已放行或未知任务返回 None"""
+        with self._cond:
+            ticket = self._queued.get(prompt_id)
+            if ticket is None:
+                return None
+            key = (PRIORITIES[ticket.priority], ticket.seq)
+            return 1 + sum(1 for rank, seq, _ in self._heap if (rank, seq) < key)
+
+    def stats(self):
+        with self._cond:
+            queued = {name: 0 for name in PRIORITIES}
+            for _, _, ticket in self._heap:
+                queued[ticket.priority] += 1
+            return {
+                'queued': queued,
+                'inflight': {backend: count for backend, count in self._inflight.items() if count},
+                'max_inflight': self.max_inflight,
+                'watermark': self.watermark,
+                'max_per_client': self.max_per_client,
+            }
+
+    def _collect_metrics(self):
+        for priority, count in self.stats()['queued'].items():
+            ADMISSION_QUEUED.set(count, priority=priority)
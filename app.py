@@ -1,66 +1,118 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context, url_for
+from flask.json.provider import DefaultJSONProvider
 import requests
+import json_codec
 from config import Config
+from http_compression import compress, compress_stream, compressible, negotiate
+from app_logging import LazyJSON, configure_logging
+from metrics import CONTENT_TYPE, HTTP_REQUEST_SECONDS, HTTP_REQUESTS, REGISTRY
+from comfy_client import get_client
+from comfy_events import is_stream_connected
+from admission import PRIORITIES, QueueFullError, Ticket
+from service import (
+    CLIENT_ID, APIError, admission_queue, apply_input_image, attach_uploads, backend_for, backend_pool,
+    batch_registry, batch_status, build_batch_workflows, build_workflow, cached_history, choose_backend,
+    claim_duplicate, dedup_key, extract_images, fetch_history, fetch_upstream_json, fetch_upstream_raw, history_query,
+    input_images,
+    is_random_seeded, iter_history_json, job_result, job_store, job_tracker, load_template, new_prompt_payload,
+    output_cache, output_image, output_rendition, parse_rendition, prepare_input_image, prompt_models,
+    proxy_request_headers, proxy_response_headers, queue_item_prompt_id, record_prompt_response, rendition_pool,
+    stored_history, tracked_outputs, tracked_task_status, upload_input_image, view_params, workflow_registry,
+    workflow_schema, workflow_seed
+)
 import json
+import logging
 import os
-from pathlib import Path
+import random
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from output_cache import cache_key
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify 和 request.get_json 使用 json_codec（orjson 或标准库），响应体直接是编码后的字节"""
+
+    def _indent(self):
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_codec.dumps(obj, default=self.default, sort_keys=self.sort_keys).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = json_codec.dumps(obj, default=self.default, indent=self._indent(), sort_keys=self.sort_keys)
+        return self._app.response_class(body, mimetype=self.mimetype)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
-# 工作流目录
-WORKFLOWS_DIR = Path(__file__).parent / 'workflows'
-WORKFLOWS_DIR.mkdir(exist_ok=True)
-
-def get_comfyui_url(endpoint):
-    """构建ComfyUI API URL"""
-    url = f"{Config.COMFYUI_BASE_URL}/{endpoint.lstrip('/')}"
-    print(f"ComfyUI URL: {url}")  # 打印实际使用的URL
-    return url
-
-def make_comfyui_request(method, endpoint, **kwargs):
-    """发送请求到ComfyUI，带有重试机制"""
-    url = get_comfyui_url(endpoint)
-    max_retries = 3
-    retry_delay = 1  # 初始延迟1秒
-    
-    for attempt in range(max_retries):
-        try:
-            response = requests.request(method, url, **kwargs)
-            response.raise_for_status()
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """记录每个接口的请求次数和处理时间（SSE响应只计到开始推送为止）"""
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    started = g.get('request_started')
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """JSON 和文本响应按 Accept-Encoding 压缩；流式响应（如 /api/history）边生成边压缩"""
+    if request.method == 'HEAD' or response.status_code in (204, 206, 304) \
+            or 'Content-Encoding' in response.headers or not compressible(response.mimetype):
+        return response
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < Config.COMPRESS_MIN_BYTES:
             return response
-        except requests.exceptions.HTTPError as e:
-            if response.status_code == 500:
-                if attempt < max_retries - 1:
-                    print(f"Attempt {attempt + 1} failed, retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # 指数退避
-                    continue
-            raise e
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                print(f"Attempt {attempt + 1} failed, retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retry_delay *= 2
-                continue
-            raise e
-
-def load_workflow(workflow_name):
-    """加载指定的工作流文件"""
-    workflow_path = WORKFLOWS_DIR / f"{workflow_name}.json"
-    if not workflow_path.exists():
-        raise FileNotFoundError(f"Workflow {workflow_name} not found")
-    
-    with open(workflow_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # 压缩后的字节与原来不同，强校验的 ETag 改为弱校验
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 格式的指标"""
+    return Response(REGISTRY.render(), headers={'Content-Type': CONTENT_TYPE})
+
+def get_comfyui_url(endpoint, backend=None):
+    """构建ComfyUI API URL，backend 为空时使用默认后端"""
+    return get_client(backend or backend_pool.default.base_url).url(endpoint)
+
+def make_comfyui_request(method, endpoint, backend=None, **kwargs):
+    """通过共享连接池发送请求到ComfyUI，带有重试机制；backend 为空时使用默认后端"""
+    return get_client(backend or backend_pool.default.base_url).request(method, endpoint, **kwargs)
 
 @app.route('/api/test_comfy', methods=['GET'])
 def test_comfy_connection():
     """测试ComfyUI连接"""
     try:
         url = get_comfyui_url('/system_stats')
-        print(f"Testing ComfyUI connection at: {url}")
+        logger.info('Testing ComfyUI connection at %s', url)
         response = make_comfyui_request('GET', '/system_stats')
         return jsonify({
             'status': 'success',
@@ -76,128 +128,286 @@ def test_comfy_connection():
 
 @app.route('/api/workflows', methods=['GET'])
 def list_workflows():
-    """列出所有可用的工作流"""
-    workflows = [f.stem for f in WORKFLOWS_DIR.glob('*.json')]
+    """列出所有可用的工作流，格式错误的模板（如界面导出格式）单独列出原因"""
+    invalid = workflow_registry.errors()
+    return jsonify({
+        'workflows': [name for name in workflow_registry.names() if name not in invalid],
+        'invalid': invalid
+    })
+
+@app.route('/api/workflows/<workflow_name>/params', methods=['GET'])
+def get_workflow_params(workflow_name):
+    """工作流参数清单中的命名参数：类型、默认值、取值范围和对应的节点输入"""
+    try:
+        template = load_template(workflow_name)
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    if template.params is None:
+        return jsonify({'error': f'Workflow {workflow_name} has no parameter manifest'}), 404
+    return jsonify({
+        'workflow': workflow_name,
+        'params': {name: param.describe() for name, param in template.params.items()}
+    })
+
+@app.route('/api/workflows/<workflow_name>/schema', methods=['GET'])
+def get_workflow_schema(workflow_name):
+    """工作流中每个节点可覆盖的输入及其类型"""
+    try:
+        return jsonify(workflow_schema(workflow_name))
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+
+def submit_prompt(workflow_name, workflow_data, log_payload=True, backend=None, prompt_id=None):
+    """选择后端提交工作流并登记到任务状态表，返回ComfyUI的响应数据
+
+    后端连接失败时将其剔除，并改投下一个负载最低的后端。批量提交时
+    log_payload=False，不打印完整的工作流JSON。准入队列放行的任务带有
+    已分配的 backend 和 prompt_id。
+    """
+    tried = []
+    while True:
+        if backend is None or tried:
+            backend, models = choose_backend(workflow_name, workflow_data, exclude=tried)
+        else:
+            models = prompt_models(workflow_name, workflow_data)
+        payload = new_prompt_payload(workflow_name, workflow_data, backend, prompt_id)
+        
+        # 提交工作流到prompt接口，完整请求体只在 DEBUG 级别输出
+        if log_payload:
+            logger.debug('Request to ComfyUI: %s', LazyJSON(payload),
+                         extra={'prompt_id': payload['prompt_id'], 'workflow': workflow_name, 'backend': backend})
+        
+        try:
+            prompt_response = make_comfyui_request('POST', '/prompt', backend, json=payload)
+            break
+        except requests.exceptions.RequestException as e:
+            job_tracker.forget(payload['prompt_id'])
+            tried.append(backend)
+            if not isinstance(e, requests.exceptions.ConnectionError) or len(tried) >= len(backend_pool.backends):
+                raise
+            backend_pool.mark_failed(backend, e)
+            logger.warning('ComfyUI backend unavailable, trying another one: %s', e, extra={'backend': backend})
+    
+    if log_payload:
+        logger.debug('Prompt response (%d): %s', prompt_response.status_code, prompt_response.text,
+                     extra={'prompt_id': payload['prompt_id']})
+    
+    prompt_data = json_codec.loads(prompt_response.content)
+    record_prompt_response(payload, prompt_data, workflow_name, backend, models)
+    return prompt_data
+
+# 后端暂时不可用时返回的状态码：请求没有被ComfyUI处理，可以稍后重新提交
+UNAVAILABLE_STATUS_CODES = {502, 503, 504}
+
+def retryable_submit_error(e):
+    """提交失败是否可以稍后重试：连接失败或网关类 5xx；读超时和ComfyUI自身的错误不重试"""
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return True
+    response = getattr(e, 'response', None)
+    return response is not None and response.status_code in UNAVAILABLE_STATUS_CODES
+
+def dispatch_ticket(ticket, backend, log_payload=False):
+    """把准入队列放行的任务提交到ComfyUI
+
+    后端暂时不可用时任务按指数退避重新进入本地队列并返回 None，最多尝试 COMFYUI_MAX_RETRIES 次；
+    其他失败把任务标记为失败（同时归还名额）后重新抛出异常。
+    """
+    try:
+        prompt_data = submit_prompt(ticket.workflow_name, ticket.workflow_data, log_payload,
+                                    backend=backend, prompt_id=ticket.prompt_id)
+    except Exception as e:
+        if retryable_submit_error(e) and ticket.attempts + 1 < Config.COMFYUI_MAX_RETRIES:
+            delay = random.uniform(0, Config.COMFYUI_RETRY_BACKOFF * (2 ** ticket.attempts))
+            logger.warning('Submit failed, requeueing in %.2f seconds: %s', delay, e,
+                           extra={'prompt_id': ticket.prompt_id, 'workflow': ticket.workflow_name})
+            # 提交失败时 submit_prompt 已移除任务状态，重新登记为排队中
+            job_tracker.register(ticket.prompt_id, ticket.workflow_name, None, len(ticket.workflow_data))
+            admission_queue.retry(ticket, delay)
+            return None
+        message = f'Failed to submit to ComfyUI: {e}'
+        if getattr(e, 'response', None) is not None:
+            # ComfyUI校验失败时响应体中有 node_errors
+            message = f'{message}: {e.response.text}'
+        job_tracker.fail(ticket.prompt_id, message)
+        raise
+    job = job_tracker.get(ticket.prompt_id)
+    if job is not None and job.backend:
+        admission_queue.moved(ticket.prompt_id, job.backend)
+    return prompt_data
+
+def poll_released_jobs(prompt_ids):
+    """准入队列阻塞时，补全事件流离线后端上的在途任务，避免名额一直不归还"""
+    for prompt_id in prompt_ids:
+        job = job_tracker.get(prompt_id)
+        if job is not None and not job.finished and job.backend and not is_stream_connected(job.backend):
+            sync_job_from_history(job)
+
+admission_queue.start(dispatch_ticket, poll_released_jobs, Config.RUN_OFFLINE_POLL_INTERVAL)
+
+def request_priority(default='normal'):
+    """从 ?priority= 查询参数读取优先级"""
+    priority = request.args.get('priority', default)
+    if priority not in PRIORITIES:
+        raise APIError(f"priority must be one of {', '.join(PRIORITIES)}")
+    return priority
+
+def request_client():
+    """调用方标识：X-Client-Id 请求头，没有时使用客户端IP"""
+    return request.headers.get('X-Client-Id') or request.remote_addr
+
+def admit_prompt(workflow_name, workflow_data, priority, client, log_payload=True, prompt_id=None):
+    """经过准入队列提交任务，返回 (prompt_id, ComfyUI的响应数据)
+
+    有空闲名额时在当前线程立即提交；否则任务在本地排队，响应数据为 None，之后由放行线程提交。
+    立即提交时后端暂时不可用，任务同样重新排队并返回 None，请求线程不等待退避。
+    本地队列已满时抛出 QueueFullError。
+    """
+    prompt_id = prompt_id or str(uuid.uuid4())
+    if not Config.ADMISSION_ENABLED:
+        prompt_data = submit_prompt(workflow_name, workflow_data, log_payload, prompt_id=prompt_id)
+        return prompt_data.get('prompt_id'), prompt_data
+    
+    ticket = Ticket(prompt_id, workflow_name, workflow_data, priority, client,
+                    prompt_models(workflow_name, workflow_data))
+    # 先登记再入队，放行线程随时可能提交该任务
+    job_tracker.register(prompt_id, workflow_name, None, len(workflow_data))
+    try:
+        backend = admission_queue.submit(ticket)
+    except QueueFullError:
+        job_tracker.forget(prompt_id)
+        raise
+    if backend is None:
+        logger.info('Prompt queued locally with priority %s', priority,
+                    extra={'prompt_id': prompt_id, 'workflow': workflow_name})
+        return prompt_id, None
+    return prompt_id, dispatch_ticket(ticket, backend, log_payload)
+
+def request_dedup_key(workflow_name, workflow_data):
+    """请求带有 X-No-Dedup 头、要求随机种子或关闭去重时返回 None"""
+    if not Config.DEDUP_ENABLED or request.headers.get('X-No-Dedup', '').lower() not in ('', '0', 'false'):
+        return None
+    if is_random_seeded(request.get_json(silent=True)):
+        return None
+    return dedup_key(workflow_name, workflow_data)
+
+def admit_unique_prompt(workflow_name, workflow_data, priority, client):
+    """相同工作流+输入的任务已完成或正在进行时直接复用，否则经过准入队列提交
+
+    返回 (prompt_id, ComfyUI的响应数据, 复用的任务)。
+    """
+    prompt_id = str(uuid.uuid4())
+    key = request_dedup_key(workflow_name, workflow_data)
+    if key is not None:
+        duplicate = claim_duplicate(key, prompt_id, workflow_name, len(workflow_data))
+        if duplicate is not None:
+            logger.info('Duplicate submission, reusing %s task', duplicate.status,
+                        extra={'prompt_id': duplicate.prompt_id, 'workflow': workflow_name})
+            return duplicate.prompt_id, None, duplicate
+    try:
+        prompt_id, prompt_data = admit_prompt(workflow_name, workflow_data, priority, client, prompt_id=prompt_id)
+    except Exception as e:
+        if key is not None:
+            # 已经复用该 prompt_id 的重复请求看到失败，之后的请求重新提交
+            job_tracker.fail(prompt_id, f'Failed to submit to ComfyUI: {e}')
+        raise
+    return prompt_id, prompt_data, None
+
+def output_images(prompt_id, outputs, backend, query=None):
+    """任务输出图片的响应数据：图床地址和通过本服务转发图片内容的 content_url"""
+    images = attach_uploads(prompt_id, extract_images(outputs, backend))
+    for index, image in enumerate(images):
+        image['content_url'] = url_for('get_image_content', prompt_id=prompt_id, index=index, _external=True,
+                                       **(query or {}))
+    return images
+
+def duplicate_response(job):
+    """重复提交的响应：已完成时直接带上图片，否则与正在进行的任务共用同一个 prompt_id"""
+    body = {
+        'status': 'success',
+        'prompt_id': job.prompt_id,
+        'deduplicated': True,
+        'task_status': job.status,
+        'node_errors': {},
+        'error': None,
+        'client_id': CLIENT_ID
+    }
+    if job.status == 'completed':
+        body['images'] = output_images(job.prompt_id, job.outputs, job.backend)
+    elif admission_queue.is_queued(job.prompt_id):
+        body['status'] = 'queued'
+        body['local_queue_position'] = admission_queue.position(job.prompt_id)
+    return body
+
+def comfyui_error_response(e):
+    """把与ComfyUI通信时的异常转换为502响应"""
+    body = {
+        'error': f'Failed to communicate with ComfyUI: {str(e)}',
+        'exception_type': type(e).__name__
+    }
+    if getattr(e, 'response', None) is not None:
+        # ComfyUI校验失败时会在响应体中返回 node_errors
+        body['status_code'] = e.response.status_code
+        body['response'] = e.response.text
+    return jsonify(body), 502
+
+def workflow_submission_response(workflow_name, workflow_data, **extra):
+    """经过去重和准入队列提交工作流，返回给客户端的响应；extra 为附加到响应中的字段"""
+    priority = request_priority()
+    try:
+        prompt_id, prompt_data, duplicate = admit_unique_prompt(
+            workflow_name, workflow_data, priority, request_client())
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429
+    except requests.exceptions.RequestException as e:
+        return comfyui_error_response(e)
+    
+    if duplicate is not None:
+        return jsonify(dict(duplicate_response(duplicate), **extra))
+    seed = workflow_seed(workflow_name, workflow_data)
+    if prompt_data is None:
+        # 后端繁忙，任务在本地排队，稍后由放行线程提交
+        return jsonify({
+            'status': 'queued',
+            'prompt_id': prompt_id,
+            'seed': seed,
+            **extra,
+            'priority': priority,
+            'local_queue_position': admission_queue.position(prompt_id),
+            'client_id': CLIENT_ID
+        }), 202
     return jsonify({
-        'workflows': workflows
+        'status': 'success',
+        'prompt_id': prompt_id,
+        'seed': seed,
+        **extra,
+        'node_errors': prompt_data.get('node_errors'),
+        'error': prompt_data.get('error'),
+        'client_id': CLIENT_ID
     })
 
 @app.route('/api/workflow/<workflow_name>', methods=['POST'])
 def run_workflow(workflow_name):
     """运行指定的工作流"""
     try:
-        # 打印请求信息用于调试
-        print(f"Received request for workflow: {workflow_name}")
-        print(f"Request Content-Type: {request.headers.get('Content-Type')}")
-        print(f"Request body: {request.get_data(as_text=True)}")
-        print(f"ComfyUI Base URL: {Config.COMFYUI_BASE_URL}")
-        
         # 检查请求体
         if not request.is_json:
             return jsonify({
                 'error': 'Request must be JSON. Check Content-Type header and request body format.'
             }), 400
-            
-        # 加载基础工作流
-        workflow_data = load_workflow(workflow_name)
         
         # 获取请求中的参数
         request_data = request.get_json()
-        print(f"Parsed request data: {request_data}")
+        logger.debug('Request data: %s', LazyJSON(request_data), extra={'workflow': workflow_name})
         
-        # 处理请求数据
-        if isinstance(request_data, dict) and 'prompt' in request_data:
-            # 新格式：{"prompt": "text", "target_node": "node_id"}
-            prompt_text = request_data['prompt']
-            target_node = request_data.get('target_node')
-            
-            if target_node and target_node in workflow_data:
-                # 如果指定了目标节点且存在，直接更新该节点
-                if workflow_data[target_node].get('class_type') in ['Text Multiline', 'CLIPTextEncode']:
-                    workflow_data[target_node]['inputs']['text'] = prompt_text
-                else:
-                    return jsonify({
-                        'error': f'Target node {target_node} is not a text input node'
-                    }), 400
-            else:
-                # 如果没有指定目标节点，查找第一个合适的文本节点
-                text_nodes = {
-                    node_id: node_data 
-                    for node_id, node_data in workflow_data.items()
-                    if node_data.get('class_type') in ['Text Multiline', 'CLIPTextEncode']
-                }
-                
-                if not text_nodes:
-                    return jsonify({
-                        'error': 'No suitable text input node found in workflow'
-                    }), 400
-                
-                # 使用找到的第一个文本节点
-                text_node_id = next(iter(text_nodes))
-                workflow_data[text_node_id]['inputs']['text'] = prompt_text
-                
-        elif isinstance(request_data, dict):
-            # 保持对原有格式的支持：直接的节点更新
-            for node_id, node_data in request_data.items():
-                if node_id in workflow_data:
-                    if 'inputs' in node_data:
-                        workflow_data[node_id]['inputs'].update(node_data['inputs'])
-                    else:
-                        workflow_data[node_id]['inputs'].update(node_data)
-        else:
-            return jsonify({
-                'error': 'Invalid request format. Expected either {"prompt": "text", "target_node": "node_id"} or node updates object'
-            }), 400
-        
-        # 打印最终的工作流数据
-        print("\n=== Final Workflow JSON ===")
-        print(json.dumps(workflow_data, indent=2, ensure_ascii=False))
-        print("=== End of Workflow JSON ===\n")
-        
-        try:
-            # 1. 先提交客户端ID
-            client_id = f"my-api-{int(time.time())}"
-            
-            # 2. 提交工作流到prompt接口
-            prompt_url = get_comfyui_url('/prompt')
-            print(f"\nSubmitting workflow to ComfyUI at: {prompt_url}")
-            print("\n=== Request to ComfyUI ===")
-            print(json.dumps({
-                "prompt": workflow_data,
-                "client_id": client_id
-            }, indent=2, ensure_ascii=False))
-            print("=== End of Request ===\n")
-            
-            prompt_response = make_comfyui_request('POST', '/prompt', json={
-                "prompt": workflow_data,
-                "client_id": client_id
-            })
-            
-            print(f"Prompt Response Status: {prompt_response.status_code}")
-            print(f"Prompt Response Content: {prompt_response.text}")
-            
-            if prompt_response.status_code == 200:
-                prompt_data = prompt_response.json()
-                return jsonify({
-                    'status': 'success',
-                    'prompt_id': prompt_data.get('prompt_id'),
-                    'node_errors': prompt_data.get('node_errors'),
-                    'error': prompt_data.get('error'),
-                    'client_id': client_id
-                })
-            else:
-                return jsonify({
-                    'error': 'Failed to submit workflow',
-                    'status_code': prompt_response.status_code,
-                    'response': prompt_response.text
-                }), 502
-                
-        except requests.exceptions.RequestException as e:
-            return jsonify({
-                'error': f'Failed to communicate with ComfyUI: {str(e)}',
-                'exception_type': type(e).__name__
-            }), 502
+        workflow_data = build_workflow(workflow_name, request_data)
+        return workflow_submission_response(workflow_name, workflow_data)
             
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except json.JSONDecodeError as e:
         return jsonify({
             'error': f'Invalid JSON format: {str(e)}',
@@ -206,65 +416,296 @@ def run_workflow(workflow_name):
     except FileNotFoundError as e:
         return jsonify({'error': str(e)}), 404
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
+        logger.exception('Error processing request', extra={'workflow': workflow_name})
         return jsonify({'error': str(e)}), 500
 
+def request_image():
+    """读取 multipart 请求中的 image 文件字段，返回 (FileStorage, 文件名, sha256, 大小)
+
+    werkzeug 把较大的上传写入临时文件，这里只分块读取一遍计算哈希，不在内存中保存整张图片。
+    """
+    if request.content_length and request.content_length > Config.INPUT_IMAGE_MAX_BYTES + 64 * 1024:
+        raise APIError(f'Image too large, at most {Config.INPUT_IMAGE_MAX_BYTES} bytes allowed', 413)
+    upload = request.files.get('image')
+    if upload is None:
+        raise APIError('Request must be multipart/form-data with an "image" file field')
+    name, digest, size = prepare_input_image(upload.stream, upload.filename, upload.mimetype)
+    return upload, name, digest, size
+
+@app.route('/api/upload/image', methods=['POST'])
+def upload_image():
+    """上传输入图片到ComfyUI，相同内容只上传一次，返回可以写入 LoadImage 节点的文件名"""
+    try:
+        upload, name, digest, size = request_image()
+        backends = upload_input_image(upload.stream, name, size, upload.mimetype)
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except requests.exceptions.RequestException as e:
+        return comfyui_error_response(e)
+    return jsonify({
+        'status': 'success',
+        'image': input_images.reference(name),
+        'sha256': digest,
+        'size': size,
+        'backends': backends
+    })
+
+@app.route('/api/workflow/<workflow_name>/image', methods=['POST'])
+def run_workflow_with_image(workflow_name):
+    """上传输入图片、写入工作流的 LoadImage 节点并提交（图生图）
+
+    multipart 字段：image 为图片文件；target_node 为可选的 LoadImage 节点ID；request 为可选的JSON请求体，
+    格式与 /api/workflow/<workflow_name> 相同。
+    """
+    try:
+        upload, name, digest, size = request_image()
+        request_data = json.loads(request.form.get('request') or '{}')
+        workflow_data = build_workflow(workflow_name, request_data)
+        image = input_images.reference(name)
+        apply_input_image(load_template(workflow_name), workflow_data, image, request.form.get('target_node'))
+        # 工作流参数全部校验通过后才上传图片
+        upload_input_image(upload.stream, name, size, upload.mimetype)
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except json.JSONDecodeError as e:
+        return jsonify({'error': f'Invalid JSON in request field: {str(e)}'}), 400
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except requests.exceptions.RequestException as e:
+        return comfyui_error_response(e)
+    return workflow_submission_response(workflow_name, workflow_data, image=image)
+
+def sync_job_from_history(job):
+    """事件流离线时，用 /history 补全任务状态"""
+    try:
+        history = fetch_history(job.prompt_id, job.backend)
+    except requests.exceptions.RequestException as e:
+        logger.warning('Error checking history: %s', e, extra={'prompt_id': job.prompt_id})
+        return
+    if job.prompt_id in history:
+        job_tracker.complete_from_history(job.prompt_id, history[job.prompt_id])
+
+def iter_job_updates(prompt_id, timeout):
+    """每当任务状态变化时产出一次任务状态，直到任务结束或超时
+
+    长时间没有变化时产出 None，供SSE发送心跳。
+    """
+    deadline = time.monotonic() + timeout
+    version = None
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        job = job_tracker.get(prompt_id)
+        if job is None:
+            return
+        # 在本地排队的任务由放行线程提交，不需要查询ComfyUI
+        online = job.backend is None or is_stream_connected(job.backend)
+        if not online and not job.finished:
+            sync_job_from_history(job)
+        wait = Config.RUN_HEARTBEAT_INTERVAL if online else Config.RUN_OFFLINE_POLL_INTERVAL
+        job = job_tracker.wait_for_change(prompt_id, version, min(remaining, wait))
+        if job is None:
+            return
+        if job.version == version and not job.finished:
+            yield None
+            continue
+        version = job.version
+        yield job
+        if job.finished:
+            return
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json_codec.dumps(data).decode('utf-8')}\n\n"
+
+def stream_job_events(prompt_id, timeout):
+    """以SSE推送 queued -> running -> progress -> completed/failed 事件"""
+    job = job_tracker.get(prompt_id)
+    yield sse_event('queued', {
+        'prompt_id': prompt_id,
+        'local_queue_position': admission_queue.position(prompt_id),
+        'queue_position': job_tracker.queue_position(job) if job else None
+    })
+    last_status = 'pending'
+    for update in iter_job_updates(prompt_id, timeout):
+        if update is None:
+            yield ': keep-alive\n\n'
+            continue
+        job = update
+        # 任务状态会被事件线程并发修改，先取一份当前值
+        status = job.status
+        if status == 'running':
+            if last_status != 'running':
+                yield sse_event('running', {'prompt_id': prompt_id})
+            yield sse_event('progress', {'prompt_id': prompt_id, **job.progress()})
+        elif status in ('completed', 'failed'):
+            yield sse_event(status, job_result(job))
+        last_status = status
+    if last_status not in ('completed', 'failed'):
+        yield sse_event('timeout', job_result(job) if job else {'prompt_id': prompt_id})
+
+@app.route('/api/workflow/<workflow_name>/run', methods=['POST'])
+def run_workflow_and_wait(workflow_name):
+    """运行工作流并等待结果；Accept: text/event-stream 时以SSE推送进度"""
+    if not request.is_json:
+        return jsonify({
+            'error': 'Request must be JSON. Check Content-Type header and request body format.'
+        }), 400
+    try:
+        timeout = min(float(request.args.get('timeout', Config.RUN_WAIT_TIMEOUT)), Config.RUN_WAIT_MAX_TIMEOUT)
+    except ValueError:
+        return jsonify({'error': 'timeout must be a number'}), 400
+    
+    try:
+        workflow_data = build_workflow(workflow_name, request.get_json())
+        # 重复提交时等待（或直接返回）已有任务的结果
+        prompt_id, _, _ = admit_unique_prompt(workflow_name, workflow_data, request_priority(), request_client())
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429
+    except requests.exceptions.RequestException as e:
+        return comfyui_error_response(e)
+    
+    if request.accept_mimetypes.best == 'text/event-stream' or request.args.get('stream') == '1':
+        return Response(
+            stream_with_context(stream_job_events(prompt_id, timeout)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    job = None
+    for update in iter_job_updates(prompt_id, timeout):
+        job = update or job
+    job = job or job_tracker.get(prompt_id)
+    if job is None:
+        return jsonify({'status': 'unknown', 'prompt_id': prompt_id}), 202
+    return jsonify(job_result(job)), 200 if job.finished else 202
+
+def submit_batch_item(workflow_name, workflow_data, priority, client):
+    """提交批量任务中的一项，返回 (prompt_id, error)；后端繁忙时在本地排队，不算错误"""
+    try:
+        prompt_id, prompt_data = admit_prompt(workflow_name, workflow_data, priority, client, log_payload=False)
+    except QueueFullError as e:
+        return None, str(e)
+    except requests.exceptions.RequestException as e:
+        return None, f'Failed to communicate with ComfyUI: {str(e)}'
+    if prompt_data is not None and prompt_data.get('error'):
+        return prompt_id, prompt_data['error']
+    return prompt_id, None
+
+@app.route('/api/workflow/<workflow_name>/batch', methods=['POST'])
+def run_workflow_batch(workflow_name):
+    """批量运行同一个工作流：先生成全部变体，再以有限并发提交"""
+    if not request.is_json:
+        return jsonify({
+            'error': 'Request must be JSON. Check Content-Type header and request body format.'
+        }), 400
+    
+    try:
+        # 任何一项参数有误时整批拒绝，不提交任何任务
+        workflows = build_batch_workflows(workflow_name, request.get_json())
+        # 批量任务默认低优先级，不挤占交互请求
+        priority = request_priority('low')
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    client = request_client()
+    parallel = max(1, min(Config.BATCH_MAX_PARALLEL, len(workflows)))
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(lambda data: submit_batch_item(workflow_name, data, priority, client), workflows))
+    
+    prompt_ids = [prompt_id for prompt_id, _ in results]
+    errors = {index: error for index, (_, error) in enumerate(results) if error}
+    batch_id = batch_registry.create(workflow_name, prompt_ids, errors)
+    logger.info('Batch submitted %d/%d prompts', len(workflows) - len(errors), len(workflows),
+                extra={'batch_id': batch_id, 'workflow': workflow_name})
+    
+    body = {
+        'status': 'success' if not errors else 'partial',
+        'batch_id': batch_id,
+        'prompt_ids': prompt_ids,
+        'seeds': [workflow_seed(workflow_name, data) for data in workflows],
+        'submitted': len(workflows) - len(errors),
+        'failed': len(errors),
+        'errors': errors,
+        'client_id': CLIENT_ID
+    }
+    if len(errors) == len(workflows):
+        body['status'] = 'error'
+        return jsonify(body), 502
+    return jsonify(body)
+
+@app.route('/api/batch/<batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    """一次返回整批任务的状态和已完成任务的图片"""
+    batch = batch_registry.get(batch_id)
+    if batch is None:
+        return jsonify({'error': f'Batch {batch_id} not found'}), 404
+    
+    # 事件流离线时用 /history 补全尚未结束的任务
+    for prompt_id in batch['prompt_ids']:
+        job = job_tracker.get(prompt_id) if prompt_id else None
+        if job is not None and not job.finished and job.backend and not is_stream_connected(job.backend):
+            sync_job_from_history(job)
+    return jsonify(batch_status(batch))
+
 @app.route('/api/history', methods=['GET'])
 def get_all_history():
-    """获取所有历史记录"""
+    """分页、过滤的历史记录
+
+    启用持久化存储时逐页读取本服务提交的任务并流式输出；否则原样转发ComfyUI的历史记录字节流，
+    不解析再重新序列化。
+    """
     try:
-        response = make_comfyui_request('GET', '/history')
-        if response.status_code == 200:
-            return jsonify(response.json())
-        else:
-            return jsonify({
-                'error': 'Failed to fetch history',
-                'status_code': response.status_code,
-                'response': response.text
-            }), 502
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        query = history_query(request.args)
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    if job_store is not None:
+        return Response(iter_history_json(**query), mimetype='application/json')
+    
+    params = {'max_items': query['limit']} if query['limit'] is not None else None
+    try:
+        upstream = make_comfyui_request('GET', '/history', params=params, headers={'Accept-Encoding': 'identity'},
+                                        stream=True)
+    except requests.exceptions.RequestException as e:
+        return comfyui_error_response(e)
+    
+    def generate():
+        try:
+            yield from upstream.raw.stream(Config.IMAGE_PROXY_CHUNK_SIZE, decode_content=False)
+        finally:
+            upstream.close()
+    
+    return Response(generate(), status=upstream.status_code, headers=proxy_response_headers(upstream.headers),
+                    direct_passthrough=True)
 
 @app.route('/api/history/<prompt_id>', methods=['GET'])
 def get_history(prompt_id):
     """获取指定prompt_id的历史记录"""
     try:
-        # 构建历史记录URL
-        history_url = get_comfyui_url(f'/history/{prompt_id}')
-        print(f"Fetching history from: {history_url}")
-        
-        response = make_comfyui_request('GET', f'/history/{prompt_id}')
-        print(f"History Response Status: {response.status_code}")
-        print(f"History Response Content: {response.text}")
-        
-        if response.status_code == 200:
-            history_data = response.json()
-            return jsonify(history_data)
-        else:
-            return jsonify({
-                'error': 'Failed to fetch history',
-                'status_code': response.status_code,
-                'response': response.text
-            }), 502
-            
+        # 本服务跟踪的任务来自任务状态表（持久化存储），其他已完成任务的历史记录来自缓存
+        return jsonify(stored_history(prompt_id) or fetch_history(prompt_id, backend_for(prompt_id)))
+    except requests.exceptions.RequestException as e:
+        return comfyui_error_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/image/<prompt_id>', methods=['GET'])
 def get_image(prompt_id):
-    """获取指定prompt_id生成的图片"""
+    """获取指定prompt_id生成的图片；带 format/quality/max_size 时 content_url 指向对应的转码版本"""
     try:
-        # 1. 先获取历史记录以找到图片路径
-        history_url = get_comfyui_url(f'/history/{prompt_id}')
-        history_response = make_comfyui_request('GET', f'/history/{prompt_id}')
-        
-        if history_response.status_code != 200:
-            return jsonify({
-                'error': 'Failed to fetch history',
-                'status_code': history_response.status_code
-            }), 502
-            
-        history_data = history_response.json()
+        rendition = parse_rendition(request.args)
+        # 1. 先获取历史记录以找到图片路径（本服务跟踪的任务不访问ComfyUI）
+        backend = backend_for(prompt_id)
+        try:
+            history_data = stored_history(prompt_id) or fetch_history(prompt_id, backend)
+        except requests.exceptions.RequestException as e:
+            return comfyui_error_response(e)
         
         # 2. 从历史记录中提取图片信息
         if not history_data:
@@ -275,18 +716,8 @@ def get_image(prompt_id):
         if not outputs:
             return jsonify({'error': 'No outputs found in history'}), 404
             
-        # 找到SaveImage节点的输出
-        images = []
-        for node_id, node_output in outputs.items():
-            if 'images' in node_output:
-                for image_data in node_output['images']:
-                    image_url = get_comfyui_url(f"/view?filename={image_data['filename']}&subfolder={image_data.get('subfolder', '')}&type=temp")
-                    images.append({
-                        'url': image_url,
-                        'filename': image_data['filename'],
-                        'subfolder': image_data.get('subfolder', ''),
-                        'type': 'temp'
-                    })
+        # 找到SaveImage节点的输出；content_url 通过本服务转发图片内容，客户端无需直接访问ComfyUI
+        images = output_images(prompt_id, outputs, backend, rendition.query() if rendition is not None else None)
         
         if not images:
             return jsonify({'error': 'No images found in output'}), 404
@@ -296,16 +727,118 @@ def get_image(prompt_id):
             'images': images
         })
         
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def find_output_image(prompt_id, index):
+    """找到任务的第 index 张输出图片，返回 (backend, image_data)"""
+    tracked = tracked_outputs(prompt_id)
+    if tracked is not None:
+        backend, outputs = tracked
+    else:
+        backend = backend_for(prompt_id)
+        history_data = fetch_history(prompt_id, backend)
+        if prompt_id not in history_data:
+            raise APIError('History not found', 404)
+        outputs = history_data[prompt_id].get('outputs') or {}
+    return backend, output_image(outputs, index)
+
+def send_rendition(prompt_id, index, rendition):
+    """发送一张输出图片的转码版本，首次请求时下载原图并在转码线程池中编码"""
+    try:
+        source = output_cache.get_by_index(prompt_id, index)
+        if source is not None:
+            cached = rendition_pool.render(source, rendition)
+        else:
+            backend, image_data = find_output_image(prompt_id, index)
+            cached = output_rendition(prompt_id, backend, image_data, rendition, index).result()
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except requests.exceptions.RequestException as e:
+        return comfyui_error_response(e)
+    except (OSError, ValueError) as e:
+        logger.warning('Failed to render image %d: %s', index, e, extra={'prompt_id': prompt_id})
+        return jsonify({'error': f'Failed to render image: {str(e)}'}), 422
+    return send_file(cached.path, mimetype=cached.content_type, conditional=True, etag=cached.digest)
+
+@app.route('/api/image/<prompt_id>/<int:index>/content', methods=['GET'])
+def get_image_content(prompt_id, index):
+    """以流的方式转发图片内容，支持 Range、ETag 条件请求和 HEAD；已缓存的图片直接从本地磁盘发送"""
+    try:
+        rendition = parse_rendition(request.args)
+    except APIError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    if rendition is not None:
+        return send_rendition(prompt_id, index, rendition)
+    
+    cached = output_cache.get_by_index(prompt_id, index) if output_cache is not None else None
+    if cached is None:
+        try:
+            backend, image_data = find_output_image(prompt_id, index)
+        except APIError as e:
+            return jsonify({'error': str(e)}), e.status_code
+        except requests.exceptions.RequestException as e:
+            return comfyui_error_response(e)
+        if output_cache is not None:
+            cached = output_cache.get(cache_key(prompt_id, image_data))
+    if cached is not None:
+        return send_file(cached.path, mimetype=cached.content_type, conditional=True, etag=cached.digest)
+    
+    method = 'HEAD' if request.method == 'HEAD' else 'GET'
+    try:
+        upstream = get_client(backend).request(
+            method, '/view', params=view_params(image_data),
+            headers=proxy_request_headers(request.headers), stream=True
+        )
+    except requests.exceptions.HTTPError as e:
+        # 范围无效（416）或文件已被清理（404）时原样返回状态码
+        if e.response is not None and e.response.status_code in (404, 416):
+            e.response.close()
+            return Response(status=e.response.status_code, headers=proxy_response_headers(e.response.headers))
+        return comfyui_error_response(e)
+    except requests.exceptions.RequestException as e:
+        return comfyui_error_response(e)
+    
+    headers = proxy_response_headers(upstream.headers)
+    if method == 'HEAD' or upstream.status_code == 304:
+        upstream.close()
+        return Response(status=upstream.status_code, headers=headers)
+    
+    # 完整的图片边转发边写入本地缓存，下次请求不再访问ComfyUI
+    writer = None
+    if output_cache is not None and upstream.status_code == 200:
+        writer = output_cache.writer(cache_key(prompt_id, image_data), upstream.headers.get('Content-Type'), index)
+    
+    def generate():
+        # 直接读取底层连接，不解码、不在内存中拼接整张图片
+        try:
+            for chunk in upstream.raw.stream(Config.IMAGE_PROXY_CHUNK_SIZE, decode_content=False):
+                if writer is not None:
+                    writer.write(chunk)
+                yield chunk
+        except BaseException:
+            # 客户端断开或上游出错，丢弃不完整的文件
+            if writer is not None:
+                writer.abort()
+            raise
+        else:
+            if writer is not None:
+                writer.commit()
+        finally:
+            upstream.close()
+    
+    return Response(generate(), status=upstream.status_code, headers=headers, direct_passthrough=True)
+
 @app.route('/api/workflow', methods=['POST'])
 def submit_workflow():
     """提交工作流到ComfyUI"""
     try:
         workflow_data = request.json
         response = make_comfyui_request('POST', '/api/queue', json=workflow_data)
-        return jsonify(response.json())
+        # ComfyUI的响应原样返回，不解析再重新编码
+        return Response(response.content, mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -313,17 +846,23 @@ def submit_workflow():
 def get_status():
     """获取ComfyUI当前状态"""
     try:
-        response = make_comfyui_request('GET', '/system_stats')
-        return jsonify(response.json())
+        return Response(fetch_upstream_raw('/system_stats').content, mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/backends', methods=['GET'])
+def list_backends():
+    """查看ComfyUI后端池的状态"""
+    return jsonify({
+        'backends': backend_pool.status(),
+        'admission': admission_queue.stats()
+    })
+
 @app.route('/api/view_queue', methods=['GET'])
 def view_queue():
     """查看当前队列状态"""
     try:
-        response = make_comfyui_request('GET', '/queue')
-        return jsonify(response.json())
+        return Response(fetch_upstream_raw('/queue').content, mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -331,39 +870,48 @@ def view_queue():
 def check_task_status(prompt_id):
     """检查指定任务的状态，包括图片生成进度"""
     try:
-        # 1. 检查队列状态
-        try:
-            queue_response = make_comfyui_request('GET', '/queue')
-            queue_data = queue_response.json()
+        # 0. 本服务提交的任务直接从内存状态表返回，不访问ComfyUI
+        tracked = tracked_task_status(prompt_id)
+        if tracked is not None:
+            return jsonify(tracked)
+        
+        # 1. 检查队列状态（已缓存历史记录的任务已经结束，不再查询队列）
+        backend = backend_for(prompt_id)
+        history_data = cached_history(prompt_id, backend)
+        if history_data is None:
+            try:
+                # 并发轮询共享同一次 /queue 请求
+                queue_data = fetch_upstream_json('/queue', backend)
             
-            # 检查是否在执行队列中
-            for item in queue_data.get('queue_running', []):
-                if item.get('prompt_id') == prompt_id:
-                    return jsonify({
-                        'status': 'running',
-                        'message': 'Task is currently running',
-                        'execution_info': item
-                    })
+                # 检查是否在执行队列中
+                for item in queue_data.get('queue_running', []):
+                    if queue_item_prompt_id(item) == prompt_id:
+                        return jsonify({
+                            'status': 'running',
+                            'message': 'Task is currently running',
+                            'execution_info': item
+                        })
             
-            # 检查是否在等待队列中
-            for item in queue_data.get('queue_pending', []):
-                if item.get('prompt_id') == prompt_id:
-                    return jsonify({
-                        'status': 'pending',
-                        'message': 'Task is waiting in queue',
-                        'queue_position': queue_data['queue_pending'].index(item) + 1
-                    })
-        except Exception as e:
-            print(f"Error checking queue status: {str(e)}")
-            # 继续检查历史记录，即使队列检查失败
+                # 检查是否在等待队列中
+                for item in queue_data.get('queue_pending', []):
+                    if queue_item_prompt_id(item) == prompt_id:
+                        return jsonify({
+                            'status': 'pending',
+                            'message': 'Task is waiting in queue',
+                            'queue_position': queue_data['queue_pending'].index(item) + 1
+                        })
+            except Exception as e:
+                logger.warning('Error checking queue status: %s', e, extra={'prompt_id': prompt_id})
+                # 继续检查历史记录，即使队列检查失败
         
         # 2. 检查历史记录
         try:
-            history_response = make_comfyui_request('GET', f'/history/{prompt_id}')
-            history_data = history_response.json()
+            if history_data is None:
+                history_data = fetch_history(prompt_id, backend)
             
             if history_data:
                 # 如果在历史记录中找到了，说明任务已完成
+                history_data = history_data.get(prompt_id, history_data)
                 outputs = history_data.get('outputs', {})
                 if outputs:
                     return jsonify({
@@ -378,7 +926,7 @@ def check_task_status(prompt_id):
                         'history_data': history_data
                     })
         except Exception as e:
-            print(f"Error checking history: {str(e)}")
+            logger.warning('Error checking history: %s', e, extra={'prompt_id': prompt_id})
             # 如果历史记录检查也失败，返回未知状态
             
         # 3. 如果既不在队列中也不在历史记录中
@@ -388,7 +936,7 @@ def check_task_status(prompt_id):
         })
             
     except Exception as e:
-        print(f"Error checking task status: {str(e)}")
+        logger.exception('Error checking task status', extra={'prompt_id': prompt_id})
         return jsonify({
             'error': str(e),
             'status': 'error',
@@ -396,8 +944,12 @@ def check_task_status(prompt_id):
         }), 500
 
 if __name__ == '__main__':
-    app.run(
-        host=Config.HOST,
-        port=Config.PORT,
-        debug=Config.DEBUG
-    )
+    if Config.SERVER_MODE == 'async':
+        from async_app import run_async_server
+        run_async_server()
+    else:
+        app.run(
+            host=Config.HOST,
+            port=Config.PORT,
+            debug=Config.DEBUG
+        )
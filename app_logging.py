@@ -0,0 +1,114 @@
+"""日志配置：分级、延迟格式化，可选按行输出的JSON结构化日志
+
+日志记录通过进程内队列交给后台线程格式化和写出，请求线程不会阻塞在格式化异常堆栈和 stdout 上。
+与任务相关的日志通过 extra 传入 prompt_id / workflow / backend，
+JSON 格式下它们作为独立字段输出，便于按 prompt_id 检索。
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+from config import Config
+
+# 会作为独立字段写入JSON日志的 extra 键
+CONTEXT_FIELDS = ('prompt_id', 'workflow', 'backend', 'batch_id', 'status_code', 'elapsed_ms')
+
+_listener = None
+
+# 日志参数为这些类型时可以安全地推迟到监听线程再格式化
+_IMMUTABLE_ARGS = (str, bytes, int, float, bool, type(None))
+
+
+class LazyJSON:
+    """只有日志真正输出时才序列化的JSON对象，用于完整请求/工作流的 DEBUG 日志"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return json.dumps(self.data, ensure_ascii=False)
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出一行JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextFormatter(logging.Formatter):
+    """文本格式，把 extra 中的上下文字段附加在消息末尾"""
+
+    def formatMessage(self, record):
+        message = super().formatMessage(record)
+        context = ' '.join(
+            f"{field}={getattr(record, field)}"
+            for field in CONTEXT_FIELDS
+            if getattr(record, field, None) is not None
+        )
+        return f"{message} [{context}]" if context else message
+
+
+def configure_logging(level=None, fmt=None, stream=None):
+    """配置根日志器，可重复调用（以最后一次为准）"""
+    global _listener
+    level = (level or Config.LOG_LEVEL).upper()
+    fmt = fmt or Config.LOG_FORMAT
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(ContextFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    if _listener is not None:
+        _listener.stop()
+    # 格式化和写出都在监听线程中完成
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """保留原始记录（包括 extra 字段）放入进程内队列，消息合并和异常堆栈都由监听线程格式化"""
+
+    def prepare(self, record):
+        # 可变对象（dict、LazyJSON 等）在写出前可能被修改，只有这种情况在当前线程先生成消息
+        args = record.args.values() if isinstance(record.args, dict) else record.args or ()
+        if not all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
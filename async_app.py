@@ -0,0 +1,826 @@
+"""基于 asyncio (aiohttp) 的服务模式
+
+与 app.py 提供相同的核心接口，但等待ComfyUI期间不占用线程，重试退避使用
+asyncio.sleep。通过 SERVER_MODE=async 启动：
+
+    SERVER_MODE=async python app.py
+"""
+import asyncio
+import json
+import logging
+import random
+import tempfile
+import time
+import uuid
+
+import aiohttp
+import requests
+from aiohttp import web
+
+import json_codec
+from app_logging import configure_logging
+from comfy_client import IDEMPOTENT_METHODS, RETRY_STATUS_CODES
+from config import Config
+from http_compression import Encoder, compress, compressible, negotiate
+from output_cache import cache_key
+from upstream_cache import RawJSON
+from metrics import (
+    CONTENT_TYPE, HTTP_REQUEST_SECONDS, HTTP_REQUESTS, REGISTRY, UPSTREAM_FAILURES, UPSTREAM_REQUEST_SECONDS,
+    UPSTREAM_RESPONSE_BYTES, UPSTREAM_RETRIES, endpoint_label
+)
+from service import (
+    CLIENT_ID, APIError, apply_input_image, attach_uploads, backend_for, backend_pool, build_workflow,
+    cached_history, choose_backend, claim_duplicate, dedup_key, extract_images, history_cache, history_query,
+    input_images, is_random_seeded, iter_history_json, job_store, job_tracker, load_template, new_prompt_payload,
+    output_cache, output_image, output_rendition, parse_rendition,
+    prepare_input_image, proxy_request_headers, proxy_response_headers, queue_item_prompt_id, record_prompt_response,
+    rendition_pool, status_cache, stored_history, tracked_outputs, tracked_task_status, upload_input_image,
+    view_params, workflow_registry, workflow_schema, workflow_seed
+)
+
+logger = logging.getLogger(__name__)
+
+
+UPSTREAM_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+# 超过该大小的响应在线程池中压缩，不阻塞事件循环
+COMPRESS_EXECUTOR_BYTES = 256 * 1024
+
+
+async def run_blocking(func, *args):
+    """在线程池中执行会阻塞的调用（任务存储的 SQLite 读写、解析工作流模板），不占用事件循环"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def json_response(data, status=200, headers=None):
+    """web.json_response 的替代，使用 json_codec 编码"""
+    return web.Response(body=json_codec.dumps(data), status=status, headers=headers, content_type='application/json')
+
+
+class AsyncResponse:
+    """已读取完毕的上游响应"""
+
+    def __init__(self, status, body):
+        self.status_code = status
+        self.content = body
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json_codec.loads(self.content)
+
+
+class UpstreamResponseError(aiohttp.ClientResponseError):
+    """上游返回错误状态码，附带响应体（ComfyUI校验失败时其中有 node_errors）"""
+
+    def __init__(self, response, body):
+        super().__init__(response.request_info, response.history, status=response.status,
+                         message=response.reason or '', headers=response.headers)
+        self.body = body
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', errors='replace')
+
+
+async def raise_for_status(response):
+    if response.status >= 400:
+        raise UpstreamResponseError(response, await response.read())
+
+
+class AsyncComfyUIClient:
+    """非阻塞的ComfyUI客户端，重试策略与 comfy_client.ComfyUIClient 一致"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self._session = None
+
+    def url(self, endpoint):
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=Config.COMFYUI_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=Config.COMFYUI_CONNECT_TIMEOUT,
+                    sock_read=Config.COMFYUI_READ_TIMEOUT
+                )
+            )
+        return self._session
+
+    async def request(self, method, endpoint, **kwargs):
+        session = await self._get_session()
+        url = self.url(endpoint)
+        deadline = time.monotonic() + Config.COMFYUI_RETRY_DEADLINE
+        max_retries = max(1, Config.COMFYUI_MAX_RETRIES)
+        labels = {'method': method.upper(), 'endpoint': endpoint_label(endpoint)}
+
+        for attempt in range(1, max_retries + 1):
+            start = time.perf_counter()
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    reason = str(response.status)
+                    # 提交prompt等非幂等请求收到 5xx 时服务端可能已经处理，不重放
+                    if response.status not in RETRY_STATUS_CODES or method.upper() not in IDEMPOTENT_METHODS \
+                            or attempt == max_retries:
+                        if response.status >= 400:
+                            UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, status=reason, **labels)
+                            UPSTREAM_FAILURES.inc(reason=reason, **labels)
+                        await raise_for_status(response)
+                        body = await response.read()
+                        UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, status=reason, **labels)
+                        UPSTREAM_RESPONSE_BYTES.observe(len(body), endpoint=labels['endpoint'])
+                        return AsyncResponse(response.status, body)
+                    UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, status=reason, **labels)
+                    delay = self._retry_delay(attempt)
+                    if time.monotonic() + delay > deadline:
+                        UPSTREAM_FAILURES.inc(reason=reason, **labels)
+                        await raise_for_status(response)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                reason = type(e).__name__
+                UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, status=reason, **labels)
+                # 读超时时服务端可能已经接收了请求，非幂等方法不重放
+                replayable = isinstance(e, aiohttp.ClientConnectionError) or method.upper() in IDEMPOTENT_METHODS
+                delay = self._retry_delay(attempt)
+                if not replayable or attempt == max_retries or time.monotonic() + delay > deadline:
+                    UPSTREAM_FAILURES.inc(reason=reason, **labels)
+                    raise
+
+            UPSTREAM_RETRIES.inc(reason=reason, **labels)
+
+            logger.warning('Attempt %d to %s failed, retrying in %.2f seconds', attempt, endpoint, delay,
+                           extra={'backend': self.base_url})
+            await asyncio.sleep(delay)
+
+    def _retry_delay(self, attempt):
+        return random.uniform(0, Config.COMFYUI_RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+    async def stream(self, method, endpoint, **kwargs):
+        """发送请求并返回未读取正文的响应，调用者负责 release()；用于转发大文件，不重试"""
+        session = await self._get_session()
+        labels = {'method': method.upper(), 'endpoint': endpoint_label(endpoint)}
+        start = time.perf_counter()
+        try:
+            response = await session.request(method, self.url(endpoint), **kwargs)
+        except UPSTREAM_ERRORS as e:
+            UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, status=type(e).__name__, **labels)
+            UPSTREAM_FAILURES.inc(reason=type(e).__name__, **labels)
+            raise
+        UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, status=str(response.status), **labels)
+        return response
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+COMFYUI_CLIENTS = web.AppKey('comfyui_clients', dict)
+
+
+def get_async_client(app, base_url=None):
+    """获取指定后端的异步客户端，base_url 为空时使用默认后端"""
+    base_url = (base_url or backend_pool.default.base_url).rstrip('/')
+    clients = app[COMFYUI_CLIENTS]
+    if base_url not in clients:
+        clients[base_url] = AsyncComfyUIClient(base_url)
+    return clients[base_url]
+
+
+async def fetch_upstream_json(app, endpoint, backend=None):
+    """service.fetch_upstream_json 的异步版本（与同步模式一样缓存 RawJSON）"""
+    client = get_async_client(app, backend)
+
+    async def load():
+        return RawJSON((await client.request('GET', endpoint)).content)
+
+    if Config.UPSTREAM_CACHE_TTL <= 0:
+        return (await load()).data
+    return (await status_cache.fetch_async((endpoint, client.base_url), load, ttl=Config.UPSTREAM_CACHE_TTL)).data
+
+
+async def fetch_history(app, prompt_id, backend=None):
+    """service.fetch_history 的异步版本"""
+    client = get_async_client(app, backend)
+
+    async def load():
+        return (await client.request('GET', f'/history/{prompt_id}')).json()
+
+    return await history_cache.fetch_async(
+        ('/history/{prompt_id}', client.base_url, prompt_id), load,
+        cacheable=lambda data: prompt_id in data
+    )
+
+
+def comfyui_error_response(e):
+    body = {
+        'error': f'Failed to communicate with ComfyUI: {str(e)}',
+        'exception_type': type(e).__name__
+    }
+    if isinstance(e, aiohttp.ClientResponseError):
+        body['status_code'] = e.status
+    if isinstance(e, UpstreamResponseError):
+        # ComfyUI校验失败时会在响应体中返回 node_errors
+        body['response'] = e.text
+    return json_response(body, status=502)
+
+
+async def run_workflow(request):
+    """运行指定的工作流"""
+    workflow_name = request.match_info['workflow_name']
+    if request.content_type != 'application/json':
+        return json_response({
+            'error': 'Request must be JSON. Check Content-Type header and request body format.'
+        }, status=400)
+    try:
+        request_data = await request.json(loads=json_codec.loads)
+        workflow_data = await run_blocking(build_workflow, workflow_name, request_data)
+    except json.JSONDecodeError as e:
+        return json_response({'error': f'Invalid JSON format: {str(e)}'}, status=400)
+    except APIError as e:
+        return json_response({'error': str(e)}, status=e.status_code)
+    except FileNotFoundError as e:
+        return json_response({'error': str(e)}, status=404)
+
+    return await submit_workflow(request, workflow_name, workflow_data, request_data=request_data)
+
+
+def request_dedup(request, request_data):
+    """请求是否参与去重：关闭去重、带有 X-No-Dedup 头或要求随机种子时不参与"""
+    if not Config.DEDUP_ENABLED or request.headers.get('X-No-Dedup', '').lower() not in ('', '0', 'false'):
+        return False
+    return not is_random_seeded(request_data)
+
+
+def claim_submission(workflow_name, workflow_data, dedup):
+    """分配 prompt_id；参与去重时查找相同工作流的任务，返回 (prompt_id, 是否登记了去重, 复用的任务)"""
+    prompt_id = str(uuid.uuid4())
+    key = dedup_key(workflow_name, workflow_data) if dedup else None
+    if key is None:
+        return prompt_id, False, None
+    return prompt_id, True, claim_duplicate(key, prompt_id, workflow_name, len(workflow_data))
+
+
+def prepare_submission(workflow_name, workflow_data, tried, prompt_id):
+    """选择后端并生成 /prompt 请求体（读取模板、写入任务存储），返回 (backend, models, payload)"""
+    backend, models = choose_backend(workflow_name, workflow_data, exclude=tried)
+    return backend, models, new_prompt_payload(workflow_name, workflow_data, backend, prompt_id=prompt_id)
+
+
+def finish_submission(payload, prompt_data, workflow_name, workflow_data, backend, models):
+    """记录ComfyUI的响应（写入任务存储），返回响应中的种子"""
+    record_prompt_response(payload, prompt_data, workflow_name, backend, models)
+    return workflow_seed(workflow_name, workflow_data)
+
+
+async def output_images(request, prompt_id, outputs, backend, query=None):
+    """任务输出图片的响应数据：图床地址和通过本服务转发图片内容的 content_url"""
+    images = await run_blocking(attach_uploads, prompt_id, extract_images(outputs, backend))
+    for index, image in enumerate(images):
+        path = request.app.router['image_content'].url_for(prompt_id=prompt_id, index=str(index))
+        image['content_url'] = str(request.url.join(path.with_query(query or {})))
+    return images
+
+
+async def duplicate_response(request, job, **extra):
+    """重复提交的响应：已完成时直接带上图片，否则与正在进行的任务共用同一个 prompt_id"""
+    body = {
+        'status': 'success',
+        'prompt_id': job.prompt_id,
+        'deduplicated': True,
+        'task_status': job.status,
+        **extra,
+        'node_errors': {},
+        'error': None,
+        'client_id': CLIENT_ID
+    }
+    if job.status == 'completed':
+        body['images'] = await output_images(request, job.prompt_id, job.outputs, job.backend)
+    return json_response(body)
+
+
+async def submit_workflow(request, workflow_name, workflow_data, request_data=None, **extra):
+    """提交工作流并返回响应；相同工作流+输入的任务已完成或正在进行时直接复用。extra 为附加到响应中的字段"""
+    prompt_id, claimed, duplicate = await run_blocking(
+        claim_submission, workflow_name, workflow_data, request_dedup(request, request_data))
+    if duplicate is not None:
+        logger.info('Duplicate submission, reusing %s task', duplicate.status,
+                    extra={'prompt_id': duplicate.prompt_id, 'workflow': workflow_name})
+        return await duplicate_response(request, duplicate, **extra)
+
+    # 后端连接失败时将其剔除，并改投下一个负载最低的后端
+    tried = []
+    while True:
+        backend, models, payload = await run_blocking(
+            prepare_submission, workflow_name, workflow_data, tried, prompt_id)
+        try:
+            prompt_response = await get_async_client(request.app, backend).request('POST', '/prompt', json=payload)
+            break
+        except UPSTREAM_ERRORS as e:
+            await run_blocking(job_tracker.forget, payload['prompt_id'])
+            tried.append(backend)
+            if not isinstance(e, aiohttp.ClientConnectionError) or len(tried) >= len(backend_pool.backends):
+                if claimed:
+                    # 已经复用该 prompt_id 的重复请求看到失败，之后的请求重新提交
+                    await run_blocking(job_tracker.fail, prompt_id, f'Failed to submit to ComfyUI: {e}')
+                return comfyui_error_response(e)
+            backend_pool.mark_failed(backend, e)
+
+    prompt_data = prompt_response.json()
+    seed = await run_blocking(finish_submission, payload, prompt_data, workflow_name, workflow_data, backend, models)
+    return json_response({
+        'status': 'success',
+        'prompt_id': prompt_data.get('prompt_id'),
+        'seed': seed,
+        **extra,
+        'node_errors': prompt_data.get('node_errors'),
+        'error': prompt_data.get('error'),
+        'client_id': payload['client_id']
+    })
+
+
+async def read_image_upload(request):
+    """读取 multipart 请求：image 文件字段边接收边写入临时文件，其他字段作为文本返回
+
+    返回 (临时文件, 原文件名, Content-Type, 其他字段)，没有 image 字段时抛出 APIError。
+    """
+    if not request.content_type.startswith('multipart/'):
+        raise APIError('Request must be multipart/form-data with an "image" file field')
+    reader = await request.multipart()
+    fileobj, filename, content_type, fields = None, None, None, {}
+    try:
+        while True:
+            part = await reader.next()
+            if part is None:
+                break
+            if part.name == 'image' and fileobj is None:
+                fileobj = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+                filename, content_type = part.filename, part.headers.get('Content-Type')
+                size = 0
+                while True:
+                    chunk = await part.read_chunk(Config.IMAGE_PROXY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > Config.INPUT_IMAGE_MAX_BYTES:
+                        raise APIError(f'Image too large, at most {Config.INPUT_IMAGE_MAX_BYTES} bytes allowed', 413)
+                    fileobj.write(chunk)
+            else:
+                fields[part.name] = await part.text()
+    except BaseException:
+        if fileobj is not None:
+            fileobj.close()
+        raise
+    if fileobj is None:
+        raise APIError('Request must be multipart/form-data with an "image" file field')
+    return fileobj, filename, content_type, fields
+
+
+async def upload_image(request):
+    """上传输入图片到ComfyUI，相同内容只上传一次，返回可以写入 LoadImage 节点的文件名"""
+    loop = asyncio.get_running_loop()
+    try:
+        fileobj, filename, content_type, _ = await read_image_upload(request)
+    except APIError as e:
+        return json_response({'error': str(e)}, status=e.status_code)
+    with fileobj:
+        try:
+            name, digest, size = await run_blocking(prepare_input_image, fileobj, filename, content_type)
+            backends = await loop.run_in_executor(None, upload_input_image, fileobj, name, size, content_type)
+        except APIError as e:
+            return json_response({'error': str(e)}, status=e.status_code)
+        except requests.exceptions.RequestException as e:
+            return json_response({'error': f'Failed to communicate with ComfyUI: {str(e)}'}, status=502)
+    return json_response({
+        'status': 'success',
+        'image': input_images.reference(name),
+        'sha256': digest,
+        'size': size,
+        'backends': backends
+    })
+
+
+def prepare_image_workflow(workflow_name, fileobj, filename, content_type, fields):
+    """计算图片哈希、生成工作流并写入 LoadImage 节点，返回 (文件名, 大小, 工作流, 图片引用)"""
+    name, _, size = prepare_input_image(fileobj, filename, content_type)
+    workflow_data = build_workflow(workflow_name, json.loads(fields.get('request') or '{}'))
+    image = input_images.reference(name)
+    apply_input_image(load_template(workflow_name), workflow_data, image, fields.get('target_node'))
+    return name, size, workflow_data, image
+
+
+async def run_workflow_with_image(request):
+    """上传输入图片、写入工作流的 LoadImage 节点并提交（图生图），字段与同步模式相同"""
+    workflow_name = request.match_info['workflow_name']
+    loop = asyncio.get_running_loop()
+    try:
+        fileobj, filename, content_type, fields = await read_image_upload(request)
+    except APIError as e:
+        return json_response({'error': str(e)}, status=e.status_code)
+    with fileobj:
+        try:
+            name, size, workflow_data, image = await run_blocking(
+                prepare_image_workflow, workflow_name, fileobj, filename, content_type, fields)
+            # 工作流参数全部校验通过后才上传图片
+            await loop.run_in_executor(None, upload_input_image, fileobj, name, size, content_type)
+        except json.JSONDecodeError as e:
+            return json_response({'error': f'Invalid JSON in request field: {str(e)}'}, status=400)
+        except APIError as e:
+            return json_response({'error': str(e)}, status=e.status_code)
+        except FileNotFoundError as e:
+            return json_response({'error': str(e)}, status=404)
+        except requests.exceptions.RequestException as e:
+            return json_response({'error': f'Failed to communicate with ComfyUI: {str(e)}'}, status=502)
+    return await submit_workflow(request, workflow_name, workflow_data, image=image)
+
+
+async def list_workflows(request):
+    """列出所有可用的工作流，格式错误的模板单独列出原因"""
+    names, invalid = await run_blocking(lambda: (workflow_registry.names(), workflow_registry.errors()))
+    return json_response({
+        'workflows': [name for name in names if name not in invalid],
+        'invalid': invalid
+    })
+
+
+async def get_workflow_params(request):
+    """工作流参数清单中的命名参数：类型、默认值、取值范围和对应的节点输入"""
+    workflow_name = request.match_info['workflow_name']
+    try:
+        template = await run_blocking(load_template, workflow_name)
+    except APIError as e:
+        return json_response({'error': str(e)}, status=e.status_code)
+    except FileNotFoundError as e:
+        return json_response({'error': str(e)}, status=404)
+    if template.params is None:
+        return json_response({'error': f'Workflow {workflow_name} has no parameter manifest'}, status=404)
+    return json_response({
+        'workflow': workflow_name,
+        'params': {name: param.describe() for name, param in template.params.items()}
+    })
+
+
+async def get_workflow_schema(request):
+    """工作流中每个节点可覆盖的输入及其类型"""
+    workflow_name = request.match_info['workflow_name']
+    try:
+        return json_response(await run_blocking(workflow_schema, workflow_name))
+    except APIError as e:
+        return json_response({'error': str(e)}, status=e.status_code)
+    except FileNotFoundError as e:
+        return json_response({'error': str(e)}, status=404)
+
+
+def lookup_task(prompt_id):
+    """从任务状态表（内存中没有时读取任务存储）查询，返回 (后端, 状态响应或 None)"""
+    return backend_for(prompt_id), tracked_task_status(prompt_id)
+
+
+def lookup_history(prompt_id):
+    """返回 (后端, 本服务跟踪到已结束任务的历史记录或 None)"""
+    return backend_for(prompt_id), stored_history(prompt_id)
+
+
+async def check_task_status(request):
+    """检查指定任务的状态"""
+    prompt_id = request.match_info['prompt_id']
+    backend, tracked = await run_blocking(lookup_task, prompt_id)
+    if tracked is not None:
+        return json_response(tracked)
+
+    # 已缓存历史记录的任务已经结束，不再查询队列
+    history_data = cached_history(prompt_id, backend)
+    if history_data is None:
+        try:
+            queue_data = await fetch_upstream_json(request.app, '/queue', backend)
+            for item in queue_data.get('queue_running', []):
+                if queue_item_prompt_id(item) == prompt_id:
+                    return json_response({
+                        'status': 'running',
+                        'message': 'Task is currently running',
+                        'execution_info': item
+                    })
+            for position, item in enumerate(queue_data.get('queue_pending', []), start=1):
+                if queue_item_prompt_id(item) == prompt_id:
+                    return json_response({
+                        'status': 'pending',
+                        'message': 'Task is waiting in queue',
+                        'queue_position': position
+                    })
+        except UPSTREAM_ERRORS as e:
+            logger.warning('Error checking queue status: %s', e, extra={'prompt_id': prompt_id})
+
+    try:
+        if history_data is None:
+            history_data = await fetch_history(request.app, prompt_id, backend)
+        if history_data:
+            history_data = history_data.get(prompt_id, history_data)
+            outputs = history_data.get('outputs', {})
+            if outputs:
+                return json_response({
+                    'status': 'completed',
+                    'message': 'Task completed successfully',
+                    'outputs': outputs
+                })
+            return json_response({
+                'status': 'completed',
+                'message': 'Task completed but no outputs found',
+                'history_data': history_data
+            })
+    except UPSTREAM_ERRORS as e:
+        logger.warning('Error checking history: %s', e, extra={'prompt_id': prompt_id})
+
+    return json_response({
+        'status': 'unknown',
+        'message': 'Task not found in queue or history'
+    })
+
+
+def json_stream_response(request):
+    """流式输出JSON的响应和压缩器，客户端不接受压缩时压缩器为 None"""
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    headers = {'Content-Type': 'application/json', 'Vary': 'Accept-Encoding'}
+    if encoding is None:
+        return web.StreamResponse(headers=headers), None
+    headers['Content-Encoding'] = encoding
+    return web.StreamResponse(headers=headers), Encoder(encoding)
+
+
+async def get_all_history(request):
+    """分页、过滤的历史记录
+
+    启用持久化存储时在线程池中逐页读取本服务提交的任务并流式输出；否则原样转发ComfyUI的历史记录。
+    """
+    try:
+        query = history_query(request.query)
+    except APIError as e:
+        return json_response({'error': str(e)}, status=e.status_code)
+    if job_store is None:
+        params = {'max_items': query['limit']} if query['limit'] is not None else {}
+        try:
+            upstream = await get_async_client(request.app).stream('GET', '/history', params=params)
+        except UPSTREAM_ERRORS as e:
+            return comfyui_error_response(e)
+        try:
+            if upstream.status >= 400:
+                return json_response({
+                    'error': f'Failed to communicate with ComfyUI: /history returned {upstream.status}',
+                    'status_code': upstream.status
+                }, status=502)
+            response, encoder = json_stream_response(request)
+            await response.prepare(request)
+            async for chunk in upstream.content.iter_chunked(Config.IMAGE_PROXY_CHUNK_SIZE):
+                await response.write(encoder.compress(chunk) if encoder else chunk)
+            if encoder:
+                await response.write(encoder.finish())
+            await response.write_eof()
+            return response
+        finally:
+            upstream.release()
+
+    loop = asyncio.get_running_loop()
+    chunks = iter_history_json(**query)
+    response, encoder = json_stream_response(request)
+    try:
+        await response.prepare(request)
+        while True:
+            chunk = await loop.run_in_executor(None, next, chunks, None)
+            if chunk is None:
+                break
+            await response.write(encoder.compress(chunk) if encoder else chunk)
+        if encoder:
+            await response.write(encoder.finish())
+        await response.write_eof()
+    finally:
+        chunks.close()
+    return response
+
+
+async def get_history(request):
+    """获取指定prompt_id的历史记录（本服务跟踪的任务来自任务状态表，其他已完成的任务来自缓存）"""
+    prompt_id = request.match_info['prompt_id']
+    backend, history_data = await run_blocking(lookup_history, prompt_id)
+    try:
+        history_data = history_data or await fetch_history(request.app, prompt_id, backend)
+    except UPSTREAM_ERRORS as e:
+        return comfyui_error_response(e)
+    return json_response(history_data)
+
+
+async def get_image(request):
+    """获取指定prompt_id生成的图片；带 format/quality/max_size 时 content_url 指向对应的转码版本"""
+    prompt_id = request.match_info['prompt_id']
+    try:
+        rendition = parse_rendition(request.query)
+    except APIError as e:
+        return json_response({'error': str(e)}, status=e.status_code)
+    backend, history_data = await run_blocking(lookup_history, prompt_id)
+    client = get_async_client(request.app, backend)
+    try:
+        history_data = history_data or await fetch_history(request.app, prompt_id, client.base_url)
+    except UPSTREAM_ERRORS as e:
+        return comfyui_error_response(e)
+
+    if not history_data:
+        return json_response({'error': 'History not found'}, status=404)
+    outputs = history_data[prompt_id].get('outputs', {})
+    if not outputs:
+        return json_response({'error': 'No outputs found in history'}, status=404)
+    query = {key: str(value) for key, value in rendition.query().items()} if rendition is not None else None
+    images = await output_images(request, prompt_id, outputs, client.base_url, query)
+    if not images:
+        return json_response({'error': 'No images found in output'}, status=404)
+    return json_response({'status': 'success', 'images': images})
+
+
+async def get_metrics(request):
+    """Prometheus 格式的指标"""
+    return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """记录每个接口的请求次数和处理时间"""
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'unmatched'
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=status)
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route)
+
+
+@web.middleware
+async def compression_middleware(request, handler):
+    """JSON 和文本响应按 Accept-Encoding 压缩，大的响应体在线程池中压缩"""
+    response = await handler(request)
+    if type(response) is not web.Response or request.method == 'HEAD' or response.status in (204, 206, 304) \
+            or 'Content-Encoding' in response.headers or not compressible(response.content_type) \
+            or not isinstance(response.body, bytes) or len(response.body) < Config.COMPRESS_MIN_BYTES:
+        return response
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    body = response.body
+    if len(body) > COMPRESS_EXECUTOR_BYTES:
+        body = await asyncio.get_running_loop().run_in_executor(None, compress, body, encoding)
+    else:
+        body = compress(body, encoding)
+    response.body = body
+    response.headers['Content-Encoding'] = encoding
+    response.headers.add('Vary', 'Accept-Encoding')
+    return response
+
+
+def lookup_outputs(prompt_id):
+    """返回 (后端, 本服务跟踪到已完成任务的 (backend, outputs) 或 None)"""
+    return backend_for(prompt_id), tracked_outputs(prompt_id)
+
+
+async def find_output_image(app, prompt_id, index):
+    """找到任务的第 index 张输出图片，返回 (backend, image_data)"""
+    backend, tracked = await run_blocking(lookup_outputs, prompt_id)
+    if tracked is not None:
+        backend, outputs = tracked
+    else:
+        history_data = await fetch_history(app, prompt_id, backend)
+        if prompt_id not in history_data:
+            raise APIError('History not found', 404)
+        outputs = history_data[prompt_id].get('outputs') or {}
+    return backend, output_image(outputs, index)
+
+
+def cached_file_response(cached):
+    """从本地缓存发送图片；响应持有 cached，发送完成前文件不会被淘汰删除"""
+    response = web.FileResponse(cached.path, headers={'Content-Type': cached.content_type})
+    response['cached_output'] = cached
+    return response
+
+
+async def send_rendition(request, future):
+    """等待转码线程池完成编码后发送文件"""
+    try:
+        cached = await asyncio.wrap_future(future)
+    except (OSError, ValueError) as e:
+        logger.warning('Failed to render image: %s', e, extra={'prompt_id': request.match_info['prompt_id']})
+        return json_response({'error': f'Failed to render image: {str(e)}'}, status=422)
+    return cached_file_response(cached)
+
+
+async def get_image_content(request):
+    """以流的方式转发图片内容，支持 Range、ETag 条件请求和 HEAD；已缓存的图片直接从本地磁盘发送"""
+    prompt_id = request.match_info['prompt_id']
+    index = int(request.match_info['index'])
+    try:
+        rendition = parse_rendition(request.query)
+    except APIError as e:
+        return json_response({'error': str(e)}, status=e.status_code)
+    cached = output_cache.get_by_index(prompt_id, index) if output_cache is not None else None
+    if cached is not None and rendition is not None:
+        return await send_rendition(request, rendition_pool.submit(cached, rendition))
+    if cached is not None:
+        return cached_file_response(cached)
+    try:
+        backend, image_data = await find_output_image(request.app, prompt_id, index)
+    except APIError as e:
+        return json_response({'error': str(e)}, status=e.status_code)
+    except UPSTREAM_ERRORS as e:
+        return comfyui_error_response(e)
+    if rendition is not None:
+        # 原图通过同步客户端下载到本地缓存，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        try:
+            future = await loop.run_in_executor(
+                None, output_rendition, prompt_id, backend, image_data, rendition, index)
+        except requests.exceptions.RequestException as e:
+            return json_response({'error': f'Failed to communicate with ComfyUI: {str(e)}'}, status=502)
+        return await send_rendition(request, future)
+    if output_cache is not None:
+        cached = output_cache.get(cache_key(prompt_id, image_data))
+        if cached is not None:
+            return cached_file_response(cached)
+
+    try:
+        upstream = await get_async_client(request.app, backend).stream(
+            request.method, '/view', params=view_params(image_data),
+            headers=proxy_request_headers(request.headers)
+        )
+    except UPSTREAM_ERRORS as e:
+        return comfyui_error_response(e)
+
+    try:
+        headers = proxy_response_headers(upstream.headers)
+        if upstream.status >= 400 and upstream.status not in (404, 416):
+            return json_response({
+                'error': f'Failed to communicate with ComfyUI: /view returned {upstream.status}',
+                'status_code': upstream.status
+            }, status=502)
+        if request.method == 'HEAD' or upstream.status in (304, 404, 416):
+            return web.Response(status=upstream.status, headers=headers)
+
+        # 完整的图片边转发边写入本地缓存，下次请求不再访问ComfyUI
+        writer = None
+        if output_cache is not None and upstream.status == 200:
+            writer = output_cache.writer(cache_key(prompt_id, image_data), upstream.headers.get('Content-Type'), index)
+        response = web.StreamResponse(status=upstream.status, headers=headers)
+        try:
+            await response.prepare(request)
+            async for chunk in upstream.content.iter_chunked(Config.IMAGE_PROXY_CHUNK_SIZE):
+                if writer is not None:
+                    writer.write(chunk)
+                await response.write(chunk)
+            await response.write_eof()
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+        if writer is not None:
+            writer.commit()
+        return response
+    finally:
+        upstream.release()
+
+
+async def _close_clients(app):
+    for client in app[COMFYUI_CLIENTS].values():
+        await client.close()
+
+
+def create_app():
+    """创建 aiohttp 应用；本地准入队列只在同步模式中提供，开启时拒绝启动"""
+    if Config.ADMISSION_ENABLED:
+        raise RuntimeError('ADMISSION_ENABLED is not supported with SERVER_MODE=async: '
+                           'submissions would bypass the local priority queue')
+    app = web.Application(middlewares=[metrics_middleware, compression_middleware])
+    app[COMFYUI_CLIENTS] = {}
+    app.on_cleanup.append(_close_clients)
+    app.router.add_get('/api/workflows', list_workflows)
+    app.router.add_get('/api/workflows/{workflow_name}/schema', get_workflow_schema)
+    app.router.add_get('/api/workflows/{workflow_name}/params', get_workflow_params)
+    app.router.add_post('/api/workflow/{workflow_name}', run_workflow)
+    app.router.add_post('/api/workflow/{workflow_name}/image', run_workflow_with_image)
+    app.router.add_post('/api/upload/image', upload_image)
+    app.router.add_get('/api/task_status/{prompt_id}', check_task_status)
+    app.router.add_get('/api/history', get_all_history)
+    app.router.add_get('/api/history/{prompt_id}', get_history)
+    app.router.add_get('/api/image/{prompt_id}', get_image)
+    app.router.add_get(r'/api/image/{prompt_id}/{index:\d+}/content', get_image_content, name='image_content')
+    app.router.add_get('/metrics', get_metrics)
+    return app
+
+
+def run_async_server():
+    configure_logging()
+    web.run_app(create_app(), host=Config.HOST, port=Config.PORT, print=logger.info)
+
+
+if __name__ == '__main__':
+    run_async_server()
@@ -0,0 +1,192 @@
+"""多ComfyUI后端池：按队列深度选择后端，定期健康检查并剔除故障节点"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from comfy_client import get_client
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 模型加载节点及其模型名称输入
+MODEL_LOADER_INPUTS = {
+    'CheckpointLoaderSimple': 'ckpt_name',
+    'UnetLoaderGGUF': 'unet_name',
+    'UNETLoader': 'unet_name',
+}
+
+
+class Backend:
+    """单个ComfyUI后端的缓存状态"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.healthy = True
+        self.failures = 0
+        self.queue_remaining = 0
+        # 上次刷新之后本服务提交到该后端的任务数，刷新前计入队列深度
+        self.submitted_since_refresh = 0
+        self.vram_free = 0
+        self.last_checked = None
+        self.last_error = None
+        # 最近路由到该后端的模型，ComfyUI通常仍保留它们在显存中
+        self.recent_models = OrderedDict()
+
+    @property
+    def queue_depth(self):
+        return self.queue_remaining + self.submitted_since_refresh
+
+    def has_models(self, models):
+        return bool(models) and all(model in self.recent_models for model in models)
+
+    def to_dict(self):
+        return {
+            'base_url': self.base_url,
+            'healthy': self.healthy,
+            'failures': self.failures,
+            'queue_depth': self.queue_depth,
+            'vram_free': self.vram_free,
+            'recent_models': list(self.recent_models),
+            'last_checked': self.last_checked,
+            'last_error': self.last_error,
+        }
+
+
+class BackendPool:
+    """一组ComfyUI后端"""
+
+    def __init__(self, base_urls, refresh_interval=None, max_failures=None):
+        self.backends = [Backend(url) for url in base_urls]
+        self._by_url = {backend.base_url: backend for backend in self.backends}
+        self.refresh_interval = refresh_interval or Config.BACKEND_REFRESH_INTERVAL
+        self.max_failures = max_failures or Config.BACKEND_MAX_FAILURES
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def default(self):
+        return self.backends[0]
+
+    def get(self, base_url):
+        return self._by_url.get(base_url.rstrip('/')) if base_url else None
+
+    def start(self, track_queue=False):
+        """启动后台健康检查线程
+
+        只有一个后端时不需要选择后端，也就不需要刷新；准入队列按队列深度放行时传入 track_queue=True，
+        单个后端也定期刷新队列深度。
+        """
+        if (len(self.backends) < 2 and not track_queue) or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refresh_loop, name='comfyui-health', daemon=True)
+                self._thread.start()
+
+    def choose(self, models=(), exclude=()):
+        """选择负载最低的健康后端，已加载所需模型的后端优先"""
+        if len(self.backends) == 1:
+            return self.default
+        self.start()
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b.base_url not in exclude]
+            if not candidates:
+                # 全部不可用时仍然尝试失败次数最少的后端
+                candidates = sorted(
+                    (b for b in self.backends if b.base_url not in exclude),
+                    key=lambda b: b.failures
+                )[:1] or [self.default]
+
+            def score(backend):
+                affinity = Config.BACKEND_AFFINITY_WEIGHT if backend.has_models(models) else 0
+                return (backend.queue_depth - affinity, -backend.vram_free)
+
+            return min(candidates, key=score)
+
+    def note_submitted(self, base_url, models=()):
+        """记录一次提交，在下次刷新前把它计入该后端的队列深度"""
+        backend = self.get(base_url)
+        if backend is None:
+            return
+        with self._lock:
+            backend.submitted_since_refresh += 1
+            for model in models:
+                backend.recent_models[model] = True
+                backend.recent_models.move_to_end(model)
+            while len(backend.recent_models) > Config.BACKEND_RECENT_MODELS:
+                backend.recent_models.popitem(last=False)
+
+    def note_finished(self, base_url):
+        """记录一个任务结束，在下次刷新前把它从该后端的队列深度中扣除"""
+        backend = self.get(base_url)
+        if backend is None:
+            return
+        with self._lock:
+            if backend.queue_remaining > 0:
+                backend.queue_remaining -= 1
+            elif backend.submitted_since_refresh > 0:
+                backend.submitted_since_refresh -= 1
+
+    def mark_failed(self, base_url, error):
+        """提交失败时立即剔除该后端，等待健康检查恢复"""
+        backend = self.get(base_url)
+        if backend is None or len(self.backends) == 1:
+            return
+        with self._lock:
+            backend.failures = max(backend.failures + 1, self.max_failures)
+            backend.healthy = False
+            backend.last_error = str(error)
+
+    def refresh(self, backend):
+        """查询一次后端的队列深度和显存"""
+        client = get_client(backend.base_url)
+        timeout = (Config.COMFYUI_CONNECT_TIMEOUT, Config.BACKEND_HEALTH_TIMEOUT)
+        try:
+            # GET /prompt 只返回 queue_remaining，比 /queue 小得多
+            queue_remaining = client.session.get(client.url('/prompt'), timeout=timeout).json()['exec_info']['queue_remaining']
+            stats = client.session.get(client.url('/system_stats'), timeout=timeout).json()
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            with self._lock:
+                backend.failures += 1
+                backend.last_error = str(e)
+                backend.last_checked = time.time()
+                if backend.failures >= self.max_failures and backend.healthy:
+                    logger.warning('ComfyUI backend ejected: %s', e, extra={'backend': backend.base_url})
+                    backend.healthy = False
+            return
+
+        devices = stats.get('devices') or []
+        with self._lock:
+            if not backend.healthy:
+                logger.info('ComfyUI backend is healthy again', extra={'backend': backend.base_url})
+            backend.healthy = True
+            backend.failures = 0
+            backend.last_error = None
+            backend.queue_remaining = queue_remaining
+            backend.submitted_since_refresh = 0
+            backend.vram_free = sum(device.get('vram_free', 0) for device in devices)
+            backend.last_checked = time.time()
+
+    def _refresh_loop(self):
+        while True:
+            for backend in self.backends:
+                self.refresh(backend)
+            time.sleep(self.refresh_interval)
+
+    def status(self):
+        with self._lock:
+            return [backend.to_dict() for backend in self.backends]
+
+
+def workflow_models(template, workflow_data):
+    """返回工作流用到的 checkpoint / UNET 模型名称"""
+    models = []
+    for class_type, input_name in MODEL_LOADER_INPUTS.items():
+        for node_id in template.nodes_by_class.get(class_type, ()):
+            model = workflow_data[node_id]['inputs'].get(input_name)
+            if isinstance(model, str):
+                models.append(model)
+    return models
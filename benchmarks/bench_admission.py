@@ -0,0 +1,68 @@
+"""模拟一个调用方批量灌入任务时，交互式高优先级任务的端到端延迟：直接转发 vs 本地准入队列
+
+直接转发时所有任务进入ComfyUI的先进先出队列，交互任务要等前面的批量任务全部执行完；
+启用准入队列后ComfyUI中最多只有 ADMISSION_MAX_INFLIGHT 个在途任务，高优先级任务插到本地队列最前面。
+
+用法：
+    python benchmarks/bench_admission.py --flood 60 --interactive 5 --exec-time 0.05
+"""
+import argparse
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def wait_idle(server, service):
+    while server.queue_remaining() or any(service.admission_queue.stats()['queued'].values()):
+        time.sleep(0.05)
+
+
+def run(app_module, service, server, flood, interactive):
+    client = app_module.app.test_client()
+    for i in range(flood):
+        response = client.post('/api/workflow/sdxl?priority=low', json={'prompt': f"flood {i}"},
+                               headers={'X-Client-Id': 'flood'})
+        assert response.status_code in (200, 202), response.get_json()
+
+    latencies = []
+    for i in range(interactive):
+        start = time.perf_counter()
+        response = client.post('/api/workflow/sdxl/run?priority=high', json={'prompt': f"interactive {i}"},
+                               headers={'X-Client-Id': 'interactive'})
+        assert response.get_json()['status'] == 'completed', response.get_json()
+        latencies.append(time.perf_counter() - start)
+    wait_idle(server, service)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flood', type=int, default=60, help='批量调用方一次提交的任务数')
+    parser.add_argument('--interactive', type=int, default=5, help='之后依次提交的高优先级任务数')
+    parser.add_argument('--exec-time', type=float, default=0.05, help='每个任务的模拟GPU时间（秒）')
+    args = parser.parse_args()
+
+    server, base_url = start_fake_comfyui(exec_time=args.exec_time)
+    from config import Config
+    Config.COMFYUI_BASE_URL = base_url
+    Config.OUTPUT_CACHE_ENABLED = False
+    import app
+    import service
+    logging.getLogger().setLevel(logging.ERROR)
+
+    for label, enabled in (('direct to ComfyUI', False), ('admission queue', True)):
+        Config.ADMISSION_ENABLED = enabled
+        latencies = run(app, service, server, args.flood, args.interactive)
+        print(f"{label:<18} flood={args.flood}  high-priority latency "
+              f"mean {statistics.mean(latencies) * 1000:7.0f} ms  p50 {statistics.median(latencies) * 1000:7.0f} ms  "
+              f"max {max(latencies) * 1000:7.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
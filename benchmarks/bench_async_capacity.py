@@ -0,0 +1,129 @@
+"""对比同步（固定工作线程）与 asyncio 服务模式在慢速ComfyUI下的并发处理能力
+
+ComfyUI桩服务对每个GET请求延迟 --latency 秒；同步模式使用 --workers 个工作线程
+（相当于 gunicorn/waitress 的线程数），asyncio 模式在单线程事件循环中处理。
+
+用法：
+    python benchmarks/bench_async_capacity.py --concurrency 200 --latency 0.5 --workers 16
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """用固定大小线程池处理请求的WSGI服务器"""
+    request_queue_size = 1024
+    workers = 16
+
+    def server_activate(self):
+        super().server_activate()
+        self.pool = ThreadPoolExecutor(self.workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def start_flask(workers):
+    import app
+    PooledWSGIServer.workers = workers
+    server = make_server('127.0.0.1', 0, app.app, server_class=PooledWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def start_async():
+    import async_app
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(async_app.create_app())
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0, backlog=1024)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def load(base_url, concurrency, rounds):
+    latencies = []
+    in_flight = peak = 0
+
+    async def one(session):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        start = time.perf_counter()
+        async with session.get(f"{base_url}/api/history/some-prompt") as response:
+            await response.read()
+        latencies.append(time.perf_counter() - start)
+        in_flight -= 1
+
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(session) for _ in range(concurrency * rounds)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'throughput': len(latencies) / elapsed,
+        'p50': statistics.median(latencies),
+        'p99': latencies[int(len(latencies) * 0.99) - 1],
+        'elapsed': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    comfy, comfy_url = start_fake_comfyui(latency=args.latency)
+    from config import Config
+    Config.COMFYUI_BASE_URL = comfy_url
+    Config.COMFYUI_POOL_SIZE = args.concurrency
+
+    print(f"{args.concurrency} concurrent clients, upstream latency {args.latency}s")
+    for label, starter in ((f"flask, {args.workers} worker threads", lambda: start_flask(args.workers)),
+                           ('asyncio (aiohttp)', start_async)):
+        _, base_url = starter()
+        # 同步模式在请求路径上打印调试信息，这里不计入输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = asyncio.run(load(base_url, args.concurrency, args.rounds))
+        print(f"{label:<30} {result['throughput']:>8.1f} req/s  "
+              f"p50 {result['p50']:.2f}s  p99 {result['p99']:.2f}s  total {result['elapsed']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""多后端负载均衡：对比单个与多个ComfyUI桩服务完成一批任务的总耗时
+
+其中一个后端地址故意不可用，用来验证健康检查会把它剔除。
+
+用法：
+    python benchmarks/bench_backend_pool.py --backends 3 --jobs 12 --exec-time 0.3
+"""
+import argparse
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def run_batch(service, client, jobs):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        prompt_ids = [
+            client.post('/api/workflow/sdxl/run?timeout=0', json={'prompt': f"job {i}"}).get_json()['prompt_id']
+            for i in range(jobs)
+        ]
+    for prompt_id in prompt_ids:
+        while not service.job_tracker.get(prompt_id).finished:
+            time.sleep(0.02)
+    return time.perf_counter() - start, prompt_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=12)
+    parser.add_argument('--exec-time', type=float, default=0.3)
+    args = parser.parse_args()
+
+    servers = [start_fake_comfyui(exec_time=args.exec_time) for _ in range(args.backends)]
+    from config import Config
+    Config.COMFYUI_BASE_URLS = [url for _, url in servers] + ['http://127.0.0.1:9']
+    Config.BACKEND_REFRESH_INTERVAL = 0.2
+    import app
+    import service
+
+    client = app.app.test_client()
+    # 预热：建立websocket连接并完成一次健康检查
+    run_batch(service, client, args.backends)
+    time.sleep(0.5)
+
+    elapsed, prompt_ids = run_batch(service, client, args.jobs)
+    per_backend = {}
+    for prompt_id in prompt_ids:
+        backend = service.job_tracker.get(prompt_id).backend
+        per_backend[backend] = per_backend.get(backend, 0) + 1
+
+    print(f"{args.jobs} jobs x {args.exec_time}s on {args.backends} backends: {elapsed:.2f}s "
+          f"(single backend would take >= {args.jobs * args.exec_time:.2f}s)")
+    for backend in service.backend_pool.status():
+        print(f"  {backend['base_url']:<28} healthy={backend['healthy']!s:<5} jobs={per_backend.get(backend['base_url'], 0)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""多个调用方重复提交相同的工作流+输入：每次都提交到ComfyUI vs 结果去重
+
+关闭去重时每次提交都要占用一次GPU执行；开启后执行中的重复提交共用同一个任务，已完成的直接返回图片。
+
+用法：
+    python benchmarks/bench_dedup.py --requests 20 --distinct 4 --exec-time 0.1
+"""
+import argparse
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20, help='每轮提交的请求数')
+    parser.add_argument('--distinct', type=int, default=4, help='其中不同提示词的个数')
+    parser.add_argument('--exec-time', type=float, default=0.1, help='每个任务的模拟GPU时间（秒）')
+    args = parser.parse_args()
+
+    server, base_url = start_fake_comfyui(exec_time=args.exec_time)
+    from config import Config
+    Config.COMFYUI_BASE_URL = base_url
+    Config.OUTPUT_CACHE_ENABLED = False
+    import app
+    logging.getLogger().setLevel(logging.ERROR)
+    client = app.app.test_client()
+
+    for label, enabled in (('no dedup', False), ('dedup', True)):
+        Config.DEDUP_ENABLED = enabled
+        before = server.calls.get('/prompt', 0)
+        latencies = []
+        for i in range(args.requests):
+            start = time.perf_counter()
+            response = client.post('/api/workflow/sdxl/run', json={'prompt': f"{label} {i % args.distinct}"})
+            assert response.get_json()['status'] == 'completed', response.get_json()
+            latencies.append(time.perf_counter() - start)
+        print(f"{label:<9} {args.requests} requests / {args.distinct} distinct  "
+              f"/prompt calls {server.calls.get('/prompt', 0) - before:4d}  "
+              f"mean {statistics.mean(latencies) * 1000:7.1f} ms  p50 {statistics.median(latencies) * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""对比 /api/history 的旧做法（解析ComfyUI的完整历史再 jsonify）与从任务存储分页流式输出
+
+ComfyUI的 /history 中每个任务都带有完整的工作流图；任务存储中的条目不含工作流图，
+按页编码输出，精简视图（view=compact）只有状态、耗时和图片引用。
+
+用法：
+    python benchmarks/bench_history.py --jobs 5000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    received = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return received, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=5000)
+    parser.add_argument('--workflow', default='sdxl')
+    args = parser.parse_args()
+
+    server, base_url = start_fake_comfyui()
+    from config import Config
+    Config.COMFYUI_BASE_URL = base_url
+    Config.COMFYUI_WS_ENABLED = False
+    Config.OUTPUT_CACHE_ENABLED = False
+    Config.JOB_STORE_PATH = os.path.join(tempfile.mkdtemp(prefix='job_store_'), 'jobs.sqlite3')
+    import app
+    import service
+    from job_tracker import JobState
+    logging.getLogger().setLevel(logging.ERROR)
+
+    graph = json.loads((service.WORKFLOWS_DIR / f'{args.workflow}.json').read_text(encoding='utf-8'))
+    now = time.time()
+    for n in range(args.jobs):
+        job = JobState(str(uuid.uuid4()))
+        job.workflow = args.workflow
+        job.status = 'completed'
+        job.submitted_at = now - args.jobs + n
+        job.started_at = job.submitted_at + 0.1
+        job.finished_at = job.submitted_at + 5
+        job.outputs = {'9': {'images': [{'filename': f'{job.prompt_id}_9.png', 'subfolder': '', 'type': 'output'}]}}
+        service.job_store.save(job)
+        server.history[job.prompt_id] = {
+            'prompt': [n, job.prompt_id, graph, {'client_id': service.CLIENT_ID}, ['9']],
+            'outputs': job.outputs,
+            'status': {'status_str': 'success', 'completed': True, 'messages': []},
+        }
+    client = app.app.test_client()
+
+    def proxied():
+        # 旧做法：读取ComfyUI的完整历史，解析后再用 jsonify 序列化
+        with app.app.test_request_context():
+            data = app.make_comfyui_request('GET', '/history').json()
+            return len(app.jsonify(data).get_data())
+
+    def streamed(url):
+        def run():
+            response = client.get(url, buffered=False)
+            received = sum(len(chunk) for chunk in response.response)
+            response.close()
+            return received
+        return run
+
+    for label, func in (
+        ('proxy ComfyUI /history', proxied),
+        ('job store, full', streamed('/api/history')),
+        ('job store, compact', streamed('/api/history?view=compact')),
+        ('compact, limit=50', streamed('/api/history?view=compact&limit=50')),
+    ):
+        received, peak, elapsed = measure(func)
+        print(f"{label:<24} {args.jobs} jobs  body {received / 1024:9.0f} KB  "
+              f"peak memory {peak / 1024 / 1024:7.1f} MB  {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
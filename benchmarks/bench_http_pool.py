@@ -0,0 +1,50 @@
+"""对比每次新建连接与共享连接池访问ComfyUI的吞吐量
+
+用法：
+    python benchmarks/bench_http_pool.py --requests 2000 --threads 8
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from comfy_client import ComfyUIClient  # noqa: E402
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def run(label, call, total, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: call(), range(total)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {total / elapsed:>10.1f} req/s  ({elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_comfyui()
+    client = ComfyUIClient(base_url, pool_size=args.threads)
+
+    def bare():
+        # 旧实现：每次调用 requests.request，都会新建TCP连接
+        requests.request('GET', f"{base_url}/queue").raise_for_status()
+
+    def pooled():
+        client.request('GET', '/queue')
+
+    run('requests.request', bare, args.requests, args.threads)
+    run('ComfyUIClient (pooled)', pooled, args.requests, args.threads)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""对比缓冲整张图片与流式转发 /api/image/<id>/<index>/content 的内存峰值
+
+流式转发的同时写入本地图片缓存，之后的重复下载直接从磁盘发送，不再请求ComfyUI的 /view。
+
+用法：
+    python benchmarks/bench_image_proxy.py --size-mb 32
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    received = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return received, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=32)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_comfyui(image_size=args.size_mb << 20)
+    from config import Config
+    Config.COMFYUI_BASE_URL = base_url
+    Config.COMFYUI_WS_ENABLED = False
+    Config.OUTPUT_CACHE_DIR = tempfile.mkdtemp(prefix='output_cache_')
+    import app
+    from comfy_client import get_client
+    logging.getLogger().setLevel(logging.ERROR)
+
+    prompt_id = server.enqueue({'prompt': {'9': {'class_type': 'SaveImage', 'inputs': {}}}})['prompt_id']
+    while prompt_id not in server.history:
+        time.sleep(0.01)
+    image = server.history[prompt_id]['outputs']['9']['images'][0]
+    # 桩服务的图片在测量前生成好，不计入内存峰值
+    server.image_bytes(image['filename'])
+    client = app.app.test_client()
+
+    def buffered():
+        # 旧做法：先把整张图片读进内存，再复制到 BytesIO
+        data = get_client(base_url).request('GET', '/view', params=image).content
+        return sum(len(chunk) for chunk in iter(BytesIO(data).read, b''))
+
+    def streamed():
+        response = client.get(f'/api/image/{prompt_id}/0/content', buffered=False)
+        received = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return received
+
+    for label, func in (('buffered download', buffered), ('streaming proxy', streamed), ('cached repeat', streamed)):
+        server.calls.clear()
+        received, peak, elapsed = measure(func)
+        print(f"{label:<18} {received / (1 << 20):6.1f} MB  peak memory {peak / (1 << 20):7.2f} MB  "
+              f"{elapsed * 1000:7.1f} ms  upstream /view calls {server.calls.get('/view', 0)}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
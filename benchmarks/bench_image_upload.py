@@ -0,0 +1,83 @@
+"""任务完成后把多张输出图片上传到图床：Dify脚本的逐张下载再上传 vs 服务端并发上传
+
+旧做法每次调用新建 Session，先完整下载一张图片再上传，多张图片只能串行处理。
+服务端上传共用连接池，所有图片并发上传，请求体直接从ComfyUI的响应流中读取。
+
+用法：
+    python benchmarks/bench_image_upload.py --images 4 --size-kb 512 --latency 0.2
+"""
+import argparse
+import hashlib
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+from fake_lsky import start_fake_lsky  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=int, default=4, help='每个任务的输出图片数')
+    parser.add_argument('--size-kb', type=int, default=512)
+    parser.add_argument('--latency', type=float, default=0.2, help='图床处理每次上传的时间（秒）')
+    parser.add_argument('--jobs', type=int, default=3)
+    args = parser.parse_args()
+
+    comfy, base_url = start_fake_comfyui(image_size=args.size_kb << 10)
+    lsky, upload_url = start_fake_lsky(token='secret', latency=args.latency)
+    from config import Config
+    Config.COMFYUI_BASE_URL = base_url
+    Config.COMFYUI_WS_ENABLED = False
+    Config.OUTPUT_CACHE_DIR = tempfile.mkdtemp(prefix='output_cache_')
+    Config.LSKY_UPLOAD_URL = upload_url
+    Config.LSKY_TOKEN = 'secret'
+    import requests
+    import service
+    logging.getLogger().setLevel(logging.ERROR)
+
+    def make_job(label, n):
+        job = service.job_tracker.register(f'{label}-{n}', workflow='bench', backend=base_url)
+        job.status = 'completed'
+        job.outputs = {
+            str(i): {'images': [{'filename': f'{label}-{n}-{i}.png', 'subfolder': '', 'type': 'output'}]}
+            for i in range(args.images)
+        }
+        return job
+
+    def sequential(job):
+        for image_data in service.iter_output_images(job.outputs):
+            session = requests.Session()
+            image = session.get(service.view_url(image_data, base_url))
+            session.post(upload_url, headers={'Authorization': 'Bearer secret'},
+                         files={'file': (image_data['filename'], image.content, 'image/png')}).json()
+            session.close()
+
+    def server_side(job):
+        service.upload_outputs(job)
+        while any(upload['status'] == 'pending' for upload in job.uploads):
+            time.sleep(0.005)
+        assert all(upload['status'] == 'uploaded' for upload in job.uploads), job.uploads
+
+    for label, func in (('per-call sequential', sequential), ('server-side sink', server_side)):
+        elapsed = []
+        for n in range(args.jobs):
+            job = make_job(label.split()[0], n)
+            start = time.perf_counter()
+            func(job)
+            elapsed.append(time.perf_counter() - start)
+        print(f"{label:<20} {args.images} images x {args.size_kb} KB  "
+              f"{sum(elapsed) / len(elapsed) * 1000:8.1f} ms per job")
+
+    # 校验上传的内容与ComfyUI输出一致
+    for filename, digest in lsky.uploads.items():
+        assert hashlib.sha256(comfy.image_bytes(filename)).hexdigest() == digest, filename
+    print(f"verified {len(lsky.uploads)} uploads")
+
+
+if __name__ == '__main__':
+    main()
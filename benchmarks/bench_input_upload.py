@@ -0,0 +1,77 @@
+"""重复提交同一张输入图片时，上传到ComfyUI的次数和字节数
+
+对比每次都把图片上传到ComfyUI /upload/image 的做法，与 /api/workflow/<name>/image 按内容哈希去重：
+第一次上传，之后本地已记录（known）时不再访问ComfyUI；服务重启后（清空本地记录）用 /view 确认后端已有该文件。
+
+用法：
+    python benchmarks/bench_input_upload.py --requests 20 --image-size 4000000
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--image-size', type=int, default=4_000_000)
+    parser.add_argument('--workflow', default='sdxl-img2img')
+    args = parser.parse_args()
+
+    server, base_url = start_fake_comfyui()
+    from config import Config
+    Config.COMFYUI_BASE_URL = base_url
+    Config.COMFYUI_WS_ENABLED = False
+    Config.DEDUP_ENABLED = False
+    Config.JOB_STORE_PATH = os.path.join(tempfile.mkdtemp(prefix='job_store_'), 'jobs.sqlite3')
+    import app
+    import service
+    logging.getLogger().setLevel(logging.ERROR)
+
+    image = b'\x89PNG\r\n\x1a\n' + os.urandom(args.image_size)
+
+    # 做法一：每个请求都上传图片，再提交工作流
+    session = requests.Session()
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        session.post(f'{base_url}/upload/image', files={'image': ('input.png', image, 'image/png')},
+                     data={'type': 'input', 'overwrite': 'true'}).raise_for_status()
+    naive_time = time.perf_counter() - start
+    naive_uploads = server.calls.get('/upload/image', 0)
+
+    # 做法二：通过本服务提交，按内容哈希去重
+    client = app.app.test_client()
+    start = time.perf_counter()
+    for index in range(args.requests):
+        if index == args.requests // 2:
+            # 模拟服务重启：本地记录丢失，后端仍保留文件
+            service.input_images._held.clear()
+        response = client.post(f'/api/workflow/{args.workflow}/image', content_type='multipart/form-data', data={
+            'image': (io.BytesIO(image), 'input.png', 'image/png'),
+            'request': json.dumps({'seed': index}),
+        })
+        assert response.status_code in (200, 202), response.get_json()
+    dedup_time = time.perf_counter() - start
+    dedup_uploads = server.calls.get('/upload/image', 0) - naive_uploads
+
+    print(f'{"mode":<18} {"requests":>8} {"uploads":>8} {"MB sent":>9} {"total s":>8}')
+    for mode, uploads, elapsed in (('upload every time', naive_uploads, naive_time),
+                                   ('hash dedup', dedup_uploads, dedup_time)):
+        print(f'{mode:<18} {args.requests:>8} {uploads:>8} {uploads * len(image) / 1e6:>9.1f} {elapsed:>8.2f}')
+    print(f'/view existence probes (first upload and after simulated restart): {server.calls.get("/view", 0)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""JSON 编解码和响应压缩：各接口每个请求的CPU时间和传输字节数
+
+对比四种配置，每种配置在单独的子进程中运行（JSON_CODEC 在导入时选定），fake ComfyUI 运行在父进程中，
+子进程的CPU时间只包含本服务：
+    before       标准库 json、不压缩，/api/view_queue 按旧做法解析ComfyUI的响应再 jsonify
+    orjson       orjson（未安装时为标准库）、上游响应原样转发、不压缩
+    orjson+gzip  同上，客户端发送 Accept-Encoding: gzip
+    orjson+br    同上，客户端发送 Accept-Encoding: br（需要安装 brotli）
+
+用法：
+    python benchmarks/bench_json_codec.py --queue 200 --jobs 2000 --requests 200
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+MODES = (
+    ('before', {'JSON_CODEC': 'json', 'COMPRESS_ENABLED': 'false'}, None),
+    ('orjson', {'JSON_CODEC': 'auto', 'COMPRESS_ENABLED': 'true'}, None),
+    ('orjson+gzip', {'JSON_CODEC': 'auto', 'COMPRESS_ENABLED': 'true'}, 'gzip'),
+    ('orjson+br', {'JSON_CODEC': 'auto', 'COMPRESS_ENABLED': 'true'}, 'br'),
+)
+
+
+def run_child(args):
+    """在子进程中：对每个接口发送 --requests 次请求，输出每个请求的CPU微秒数和响应字节数"""
+    from config import Config
+    Config.COMFYUI_BASE_URL = args.base_url
+    Config.COMFYUI_WS_ENABLED = False
+    Config.UPSTREAM_CACHE_TTL = 0
+    Config.JOB_STORE_PATH = os.path.join(tempfile.mkdtemp(prefix='job_store_'), 'jobs.sqlite3')
+    import app
+    import json_codec
+    import service
+    from job_tracker import JobState
+    logging.getLogger().setLevel(logging.ERROR)
+
+    now = time.time()
+    prompt_id = None
+    for n in range(args.jobs):
+        job = JobState(str(uuid.uuid4()))
+        job.workflow = args.workflow
+        job.status = 'completed'
+        job.submitted_at = now - args.jobs + n
+        job.started_at = job.submitted_at + 0.1
+        job.finished_at = job.submitted_at + 5
+        job.outputs = {'9': {'images': [{'filename': f'{job.prompt_id}_9.png', 'subfolder': '', 'type': 'output'}]}}
+        service.job_store.save(job)
+        prompt_id = job.prompt_id
+
+    client = app.app.test_client()
+    headers = {'Accept-Encoding': args.encoding} if args.encoding else {}
+
+    def legacy_view_queue():
+        # 旧做法：解析ComfyUI的 /queue 再用 jsonify 重新编码
+        with app.app.test_request_context():
+            return app.jsonify(service.fetch_upstream_json('/queue')).get_data()
+
+    def endpoint(url):
+        def run():
+            response = client.get(url, headers=headers, buffered=False)
+            data = b''.join(response.response)
+            response.close()
+            return data
+        return run
+
+    endpoints = {
+        '/api/view_queue': legacy_view_queue if args.legacy else endpoint('/api/view_queue'),
+        '/api/history?limit=100': endpoint('/api/history?limit=100'),
+        '/api/task_status/<id>': endpoint(f'/api/task_status/{prompt_id}'),
+        '/metrics': endpoint('/metrics'),
+    }
+    results = {'codec': json_codec.CODEC}
+    for name, func in endpoints.items():
+        func()
+        start = time.process_time()
+        for _ in range(args.requests):
+            body = func()
+        results[name] = ((time.process_time() - start) / args.requests * 1e6, len(body))
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queue', type=int, default=200, help='ComfyUI队列中的任务数（每个带完整工作流图）')
+    parser.add_argument('--jobs', type=int, default=2000, help='任务存储中的历史任务数')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--workflow', default='sdxl')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--encoding', help=argparse.SUPPRESS)
+    parser.add_argument('--legacy', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    server, base_url = start_fake_comfyui()
+    root = Path(__file__).resolve().parent.parent
+    graph = json.loads((root / 'workflows' / f'{args.workflow}.json').read_text(encoding='utf-8'))
+    # 直接放入 running，不会被 fake ComfyUI 的工作线程取走执行
+    server.running.extend(
+        [n, str(uuid.uuid4()), graph, {'client_id': 'bench'}, ['9']] for n in range(args.queue))
+
+    rows = {}
+    for mode, env, encoding in MODES:
+        command = [sys.executable, __file__, '--child', '--base-url', base_url, '--jobs', str(args.jobs),
+                   '--requests', str(args.requests), '--workflow', args.workflow]
+        if encoding:
+            command += ['--encoding', encoding]
+        if mode == 'before':
+            command.append('--legacy')
+        output = subprocess.run(command, env={**os.environ, **env}, cwd=root, capture_output=True, text=True,
+                                check=True).stdout
+        rows[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f'{"endpoint":<24} {"mode":<12} {"codec":<7} {"CPU µs/req":>11} {"bytes":>9}')
+    for name in rows['before']:
+        if name == 'codec':
+            continue
+        for mode, result in rows.items():
+            cpu, size = result[name]
+            print(f'{name:<24} {mode:<12} {result["codec"]:<7} {cpu:>11.1f} {size:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""提交前裁剪工作流：每个模板去掉的节点数、/prompt 请求体的大小，以及每次提交时裁剪的耗时
+
+去掉的节点（调试显示节点、不通向输出的分支）不再由ComfyUI执行，节省的是后端的执行时间；
+裁剪本身在本服务中只是一次对请求连线的检查和一次字典复制。
+
+用法：
+    python benchmarks/bench_prune.py --repeat 2000
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    from config import Config
+    Config.COMFYUI_WS_ENABLED = False
+    Config.JOB_STORE_ENABLED = False
+    Config.WORKFLOW_PRUNE_ENABLED = True
+    import service
+    from workflow_registry import TemplateError
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f'{"workflow":<28} {"nodes":>6} {"pruned":>7} {"bytes":>8} {"pruned bytes":>13} {"prune µs":>9}')
+    for name in service.workflow_registry.names():
+        try:
+            workflow_data = service.workflow_registry.load(name)
+        except TemplateError:
+            continue
+        pruned, removed = service.prune_workflow(name, workflow_data)
+        elapsed = timed(lambda: service.prune_workflow(name, workflow_data), args.repeat)
+        size = len(json.dumps(workflow_data, ensure_ascii=False).encode('utf-8'))
+        pruned_size = len(json.dumps(pruned, ensure_ascii=False).encode('utf-8'))
+        print(f'{name:<28} {len(workflow_data):>6} {len(removed):>7} {size:>8} {pruned_size:>13} {elapsed:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
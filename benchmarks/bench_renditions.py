@@ -0,0 +1,81 @@
+"""对比 /api/image/<id>/<index>/content 返回原图（全尺寸PNG）与转码版本的字节数和耗时
+
+原图为本地生成的带噪声的渐变图片，预先写入本地图片缓存；每个转码版本请求两次：
+第一次在转码线程池中编码，第二次直接从缓存发送。
+
+用法：
+    python benchmarks/bench_renditions.py --size 1024
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image  # noqa: E402
+
+RENDITIONS = (
+    {},
+    {'format': 'png', 'max_size': 512},
+    {'format': 'jpeg', 'quality': 85},
+    {'format': 'webp', 'quality': 80},
+    {'format': 'webp', 'quality': 80, 'max_size': 512},
+    {'format': 'webp', 'quality': 75, 'max_size': 256},
+)
+
+
+def sample_png(size):
+    """接近生成图片的PNG：平滑渐变叠加细节噪声"""
+    gradient = Image.linear_gradient('L').resize((size, size))
+    noise = Image.effect_noise((size, size), 48)
+    image = Image.merge('RGB', (gradient, noise, gradient.rotate(90)))
+    path = os.path.join(tempfile.mkdtemp(prefix='renditions_'), 'ComfyUI_00001_.png')
+    image.save(path, 'PNG')
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1024)
+    args = parser.parse_args()
+
+    from config import Config
+    Config.COMFYUI_WS_ENABLED = False
+    Config.JOB_STORE_ENABLED = False
+    Config.OUTPUT_CACHE_DIR = tempfile.mkdtemp(prefix='output_cache_')
+    import app
+    import service
+    logging.getLogger().setLevel(logging.ERROR)
+
+    prompt_id = str(uuid.uuid4())
+    source = sample_png(args.size)
+    writer = service.output_cache.writer((prompt_id, 'output', '', 'ComfyUI_00001_.png'), 'image/png', 0)
+    with open(source, 'rb') as f:
+        writer.write(f.read())
+    writer.commit()
+
+    client = app.app.test_client()
+    url = f'/api/image/{prompt_id}/0/content'
+    print(f'{"rendition":<36} {"type":<11} {"bytes":>10} {"ratio":>7} {"first ms":>9} {"cached ms":>10}')
+    original = None
+    for params in RENDITIONS:
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            response = client.get(url, query_string=params)
+            body = response.get_data()
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+        original = original or len(body)
+        label = '&'.join(f'{key}={value}' for key, value in params.items()) or 'original'
+        print(f'{label:<36} {response.mimetype:<11} {len(body):>10} {len(body) / original:>7.1%} '
+              f'{timings[0]:>9.1f} {timings[1]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
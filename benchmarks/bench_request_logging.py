@@ -0,0 +1,73 @@
+"""对比不同日志级别下 POST /api/workflow/<name> 的请求延迟
+
+DEBUG 级别会输出原始请求、完整工作流和ComfyUI请求体（相当于改造前每个请求都做的事情），
+INFO 级别只输出一行提交记录。日志写入临时文件，避免终端速度影响结果。
+
+用法：
+    python benchmarks/bench_request_logging.py --workflow flux-gender-topic-api2 --requests 300
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def run(client, workflow, count):
+    latencies = []
+    for index in range(count):
+        start = time.perf_counter()
+        response = client.post(f'/api/workflow/{workflow}', json={'prompt': f'benchmark {index}'})
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workflow', default='flux-gender-topic-api2')
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_comfyui()
+
+    from config import Config
+    Config.COMFYUI_BASE_URL = base_url
+    Config.COMFYUI_WS_ENABLED = False
+
+    from app_logging import configure_logging
+    import app
+
+    client = app.app.test_client()
+    modes = (
+        ('DEBUG text (full dumps)', 'DEBUG', 'text'),
+        ('INFO text', 'INFO', 'text'),
+        ('INFO json', 'INFO', 'json'),
+    )
+    with tempfile.TemporaryFile('w') as log_file:
+        for label, level, fmt in modes:
+            configure_logging(level, fmt, stream=log_file)
+            run(client, args.workflow, 20)
+            # 重新配置会停止上一个写日志线程并写完队列中的记录
+            configure_logging(level, fmt, stream=log_file)
+            start = log_file.tell()
+            latencies = run(client, args.workflow, args.requests)
+            configure_logging(level, fmt, stream=log_file)
+            written = log_file.tell() - start
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+            print(f"{label:<26} p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  "
+                  f"log {written / args.requests / 1024:7.1f} KB/request")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""对比轮询ComfyUI与websocket状态表两种方式下 /api/task_status 的上游调用次数
+
+用法：
+    python benchmarks/bench_task_status.py --jobs 5 --exec-time 0.5
+"""
+import argparse
+import contextlib
+import io
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def run(app_module, server, jobs, interval):
+    client = app_module.app.test_client()
+    server.calls.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        prompt_ids = [
+            client.post('/api/workflow/sdxl', json={'prompt': f"job {i}"}).get_json()['prompt_id']
+            for i in range(jobs)
+        ]
+        polls = 0
+        start = time.perf_counter()
+        remaining = set(prompt_ids)
+        while remaining:
+            for prompt_id in list(remaining):
+                polls += 1
+                status = client.get(f'/api/task_status/{prompt_id}').get_json()['status']
+                if status == 'completed':
+                    remaining.discard(prompt_id)
+            time.sleep(interval)
+    upstream = sum(v for k, v in server.calls.items() if k not in ('/prompt', '/ws'))
+    return polls, upstream, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=5)
+    parser.add_argument('--exec-time', type=float, default=0.5)
+    parser.add_argument('--interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    server, base_url = start_fake_comfyui(exec_time=args.exec_time)
+    from config import Config
+    Config.COMFYUI_BASE_URL = base_url
+    import app
+
+    for label, ws_enabled in (('polling /queue + /history', False), ('websocket state table', True)):
+        Config.COMFYUI_WS_ENABLED = ws_enabled
+        polls, upstream, elapsed = run(app, server, args.jobs, args.interval)
+        print(f"{label:<28} {polls:>5} polls -> {upstream:>5} upstream calls ({elapsed:.2f}s)")
+        # 等待websocket连接建立后再跑下一轮
+        time.sleep(0.5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""并发轮询 /api/task_status 时的上游调用次数：关闭缓存 vs 短TTL缓存 + 单飞合并
+
+任务直接提交到桩服务（不经过本服务，状态表中没有），所以每次轮询都会走 /queue + /history 的回退路径。
+一半任务已完成（在 /history 中），一半仍在排队。
+
+用法：
+    python benchmarks/bench_upstream_cache.py --pollers 1 10 50 100 --duration 3
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+def poll(client, prompt_ids, stop, counter):
+    index = 0
+    while not stop.is_set():
+        prompt_id = prompt_ids[index % len(prompt_ids)]
+        status = client.get(f'/api/task_status/{prompt_id}').get_json()['status']
+        assert status in ('pending', 'running', 'completed'), status
+        counter.append(1)
+        index += 1
+
+
+def run(app_module, server, prompt_ids, pollers, duration):
+    server.calls.clear()
+    stop = threading.Event()
+    counter = []
+    threads = [
+        threading.Thread(target=poll, args=(app_module.app.test_client(), prompt_ids[i:] + prompt_ids[:i], stop, counter))
+        for i in range(pollers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    upstream = sum(v for k, v in server.calls.items() if k in ('/queue', '/history/<id>'))
+    return len(counter), upstream
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pollers', type=int, nargs='+', default=[1, 10, 50, 100])
+    parser.add_argument('--duration', type=float, default=3)
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help='桩服务GET响应延迟（秒）')
+    args = parser.parse_args()
+
+    # 任务执行很慢，提交后一直留在队列里
+    server, base_url = start_fake_comfyui(exec_time=3600, latency=args.latency)
+    from config import Config
+    Config.COMFYUI_BASE_URL = base_url
+    Config.COMFYUI_WS_ENABLED = False
+    import app
+    import service
+    logging.getLogger().setLevel(logging.ERROR)
+
+    prompt_ids = []
+    for i in range(args.jobs):
+        prompt_id = server.enqueue({'prompt': {}, 'client_id': 'other-client'})['prompt_id']
+        if i % 2:
+            # 模拟已完成的任务
+            with server.lock:
+                server.pending = [item for item in server.pending if item[1] != prompt_id]
+            server.history[prompt_id] = {'outputs': {}, 'status': {'status_str': 'success', 'completed': True}}
+        prompt_ids.append(prompt_id)
+
+    ttl, history_size = Config.UPSTREAM_CACHE_TTL, service.history_cache.max_entries
+    for label, cache_on in (('no cache', False), ('cache + coalescing', True)):
+        Config.UPSTREAM_CACHE_TTL = ttl if cache_on else 0
+        service.history_cache.max_entries = history_size if cache_on else 0
+        service.history_cache.invalidate()
+        service.status_cache.invalidate()
+        for pollers in args.pollers:
+            polls, upstream = run(app, server, prompt_ids, pollers, args.duration)
+            print(f"{label:<20} {pollers:>4} pollers  {polls / args.duration:>7.0f} polls/s  "
+                  f"{upstream / args.duration:>6.1f} upstream calls/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""对比每次请求重新解析工作流文件与使用模板注册表的开销
+
+用法：
+    python benchmarks/bench_workflow_load.py --workflow flux-gender-topic-api2
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from workflow_registry import WorkflowRegistry  # noqa: E402
+
+TEXT_NODE_TYPES = ['Text Multiline', 'CLIPTextEncode']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workflow', default='flux-gender-topic-api2')
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    path = ROOT / 'workflows' / f"{args.workflow}.json"
+    registry = WorkflowRegistry(ROOT / 'workflows')
+
+    def parse_every_time():
+        # 旧实现：打开文件、json.load，然后线性扫描文本节点
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return [k for k, v in data.items() if v.get('class_type') in TEXT_NODE_TYPES][:1]
+
+    def registry_copy():
+        template = registry.get(args.workflow)
+        template.instantiate()
+        return template.find_nodes(TEXT_NODE_TYPES)[:1]
+
+    print(f"{args.workflow}.json: {path.stat().st_size} bytes")
+    for label, func in (('json.load per request', parse_every_time),
+                        ('registry + instantiate', registry_copy)):
+        seconds = timeit.timeit(func, number=args.number)
+        print(f"{label:<24} {seconds / args.number * 1e6:>8.1f} us/request")
+
+
+if __name__ == '__main__':
+    main()
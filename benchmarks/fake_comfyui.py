@@ -0,0 +1,470 @@
+"""本地ComfyUI桩服务，用于测试与基准测试
+
+实现 /prompt、/queue、/history、/system_stats、/view、/upload/image 和 /ws，提交的任务由
+workers 个执行线程按队列顺序"执行"，并像ComfyUI一样通过websocket推送 execution_start / executing /
+progress / executed / execution_success（失败时为 execution_error）事件。
+
+可以模拟的情况：
+- 每个任务的执行时间及其随机波动（exec_time / exec_jitter），GET请求的额外延迟（latency）
+- 队列长度上限（max_queue，超出时 /prompt 返回503）
+- 按比例注入的故障：HTTP 500（error_rate）、挂起后断开连接的超时（timeout_rate / hang_time）、
+  执行失败的任务（fail_rate）
+- /view 返回的图片大小（image_size）
+
+用法：
+    python benchmarks/fake_comfyui.py --port 8188 --exec-time 2 --workers 2 --error-rate 0.01
+"""
+import argparse
+import base64
+import email.parser
+import email.policy
+import hashlib
+import json
+import random
+import re
+import socket
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WS_MAGIC = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class WebSocketConnection:
+    """服务端websocket连接（只发送文本帧）"""
+
+    def __init__(self, handler):
+        self.wfile = handler.wfile
+        self.socket = handler.connection
+        self.lock = threading.Lock()
+
+    def send_json(self, data):
+        payload = json.dumps(data).encode('utf-8')
+        header = bytearray([0x81])
+        if len(payload) < 126:
+            header.append(len(payload))
+        elif len(payload) < 65536:
+            header.append(126)
+            header += struct.pack('!H', len(payload))
+        else:
+            header.append(127)
+            header += struct.pack('!Q', len(payload))
+        with self.lock:
+            self.wfile.write(bytes(header) + payload)
+
+    def close(self):
+        """不发送关闭帧直接断开，模拟网络中断"""
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class FakeComfyUIHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才能保持长连接
+    protocol_version = 'HTTP/1.1'
+    # 头部和正文分开写出，不关闭Nagle会在长连接上触发延迟ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject_fault(self, path):
+        """按设定的比例返回500或挂起后断开连接，已处理时返回 True"""
+        fault = self.server.draw_fault(path)
+        if fault == 'error':
+            self._send_json({'error': 'injected failure'}, 500)
+        elif fault == 'timeout':
+            time.sleep(self.server.hang_time)
+            self.close_connection = True
+        return fault is not None
+
+    def do_HEAD(self):
+        parsed = urlparse(self.path)
+        self.server.count(parsed.path)
+        if self._inject_fault(parsed.path):
+            return
+        if parsed.path == '/view':
+            self._serve_view(parse_qs(parsed.query), head=True)
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def _serve_view(self, query, head=False):
+        """像 aiohttp FileResponse 一样支持 ETag / Range"""
+        filename = query.get('filename', [''])[0]
+        if query.get('type', ['output'])[0] == 'input':
+            # 输入图片只有上传过的才存在
+            key = '/'.join(filter(None, (query.get('subfolder', [''])[0], filename)))
+            data = self.server.inputs.get(key)
+            if data is None:
+                if head:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                else:
+                    self._send_json({'error': 'not found'}, 404)
+                return
+        else:
+            data = self.server.image_bytes(filename)
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        status, start, end = 200, 0, len(data) - 1
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            else:
+                start = max(0, len(data) - int(match.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Disposition', f'filename="{filename}"')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.end_headers()
+        if not head:
+            self.wfile.write(memoryview(data)[start:end + 1])
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        self.server.count(path)
+        if path != '/ws':
+            if self._inject_fault(path):
+                return
+            if self.server.latency:
+                time.sleep(self.server.latency)
+        if path == '/view':
+            self._serve_view(parse_qs(parsed.query))
+        elif path == '/ws':
+            self._serve_websocket(parse_qs(parsed.query).get('clientId', [''])[0])
+        elif path == '/system_stats':
+            self._send_json({'system': {'os': 'fake'}, 'devices': [{'name': 'fake', 'vram_free': 8 << 30}]})
+        elif path == '/prompt':
+            self._send_json({'exec_info': {'queue_remaining': self.server.queue_remaining()}})
+        elif path == '/queue':
+            self._send_json(self.server.queue_snapshot())
+        elif path.startswith('/history/'):
+            prompt_id = path.rsplit('/', 1)[-1]
+            entry = self.server.history.get(prompt_id)
+            self._send_json({prompt_id: entry} if entry else {})
+        elif path == '/history':
+            self._send_json(self.server.history)
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        path = urlparse(self.path).path
+        self.server.count(path)
+        if self._inject_fault(path):
+            return
+        if path == '/prompt':
+            if self.server.node_errors:
+                self._send_json({
+                    'error': {'type': 'prompt_outputs_failed_validation',
+                              'message': 'Prompt outputs failed validation', 'details': '', 'extra_info': {}},
+                    'node_errors': self.server.node_errors,
+                }, 400)
+                return
+            result = self.server.enqueue(json.loads(body or b'{}'))
+            if result is None:
+                self._send_json({'error': 'queue full'}, 503)
+            else:
+                self._send_json(result)
+        elif path == '/upload/image':
+            self._upload_image(body)
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def _upload_image(self, body):
+        """像ComfyUI一样接收 multipart 的 image 字段，保存到 input/<subfolder>/<filename>"""
+        head = f"Content-Type: {self.headers.get('Content-Type', '')}\r\n\r\n".encode('utf-8')
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(head + body)
+        fields, image = {}, None
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'image':
+                image = (part.get_filename(), part.get_payload(decode=True))
+            else:
+                fields[name] = part.get_content().strip()
+        if image is None:
+            self._send_json({'error': 'no image'}, 400)
+            return
+        subfolder = fields.get('subfolder', '')
+        filename, data = image
+        self.server.inputs['/'.join(filter(None, (subfolder, filename)))] = data
+        self._send_json({'name': filename, 'subfolder': subfolder, 'type': fields.get('type', 'input')})
+
+    def _serve_websocket(self, client_id):
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WS_MAGIC).encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+
+        conn = WebSocketConnection(self)
+        self.server.add_ws(client_id, conn)
+        try:
+            # 只需检测对端关闭，客户端发来的帧（ping/close）一律忽略
+            while self.rfile.read(1):
+                pass
+        except OSError:
+            pass
+        finally:
+            self.server.remove_ws(client_id, conn)
+            self.close_connection = True
+
+
+class FakeComfyUIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, exec_time=0.0, steps=4, latency=0.0, image_size=256 << 10, workers=1,
+                 exec_jitter=0.0, max_queue=0, error_rate=0.0, timeout_rate=0.0, hang_time=30.0,
+                 fail_rate=0.0, seed=None):
+        super().__init__(address, FakeComfyUIHandler)
+        self.exec_time = exec_time
+        self.exec_jitter = exec_jitter
+        self.latency = latency
+        self.steps = steps
+        self.image_size = image_size
+        self.max_queue = max_queue
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_time = hang_time
+        self.fail_rate = fail_rate
+        # 非空时 /prompt 像ComfyUI工作流校验失败一样返回 400 和这些 node_errors
+        self.node_errors = {}
+        self.random = random.Random(seed)
+        self.images = {}
+        # 上传到 input 目录的图片：子目录/文件名 -> 内容
+        self.inputs = {}
+        self.history = {}
+        self.pending = []
+        self.running = []
+        self.number = 0
+        self.calls = {}
+        # 注入的故障次数：error / timeout / failed
+        self.faults = {}
+        self.ws_clients = {}
+        self.lock = threading.Condition()
+        for _ in range(max(1, workers)):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def count(self, path):
+        key = '/history/<id>' if path.startswith('/history/') else path
+        with self.lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def _record_fault(self, kind):
+        with self.lock:
+            self.faults[kind] = self.faults.get(kind, 0) + 1
+
+    def draw_fault(self, path):
+        """为一个HTTP请求抽取注入的故障：error、timeout 或 None"""
+        if not (self.error_rate or self.timeout_rate):
+            return None
+        with self.lock:
+            value = self.random.random()
+        if value < self.error_rate:
+            fault = 'error'
+        elif value < self.error_rate + self.timeout_rate:
+            fault = 'timeout'
+        else:
+            return None
+        self._record_fault(fault)
+        return fault
+
+    def add_ws(self, client_id, conn):
+        with self.lock:
+            self.ws_clients.setdefault(client_id, []).append(conn)
+
+    def remove_ws(self, client_id, conn):
+        with self.lock:
+            conns = self.ws_clients.get(client_id, [])
+            if conn in conns:
+                conns.remove(conn)
+
+    def drop_ws(self, client_id):
+        """断开某个客户端ID的所有websocket连接"""
+        with self.lock:
+            conns = self.ws_clients.pop(client_id, [])
+        for conn in conns:
+            conn.close()
+
+    def send_event(self, client_id, event, data):
+        with self.lock:
+            conns = list(self.ws_clients.get(client_id, []))
+        for conn in conns:
+            try:
+                conn.send_json({'type': event, 'data': data})
+            except OSError:
+                self.remove_ws(client_id, conn)
+
+    def image_bytes(self, filename):
+        """按文件名生成固定内容的"图片"（PNG签名加伪随机数据），同一文件只生成一次"""
+        data = self.images.get(filename)
+        if data is None:
+            seed = hashlib.sha256(filename.encode('utf-8')).digest()
+            body = (seed * (self.image_size // len(seed) + 1))[:max(0, self.image_size - len(PNG_SIGNATURE))]
+            data = self.images[filename] = PNG_SIGNATURE + body
+        return data
+
+    def queue_remaining(self):
+        with self.lock:
+            return len(self.pending) + len(self.running)
+
+    def queue_snapshot(self):
+        with self.lock:
+            return {'queue_running': list(self.running), 'queue_pending': list(self.pending)}
+
+    def enqueue(self, payload):
+        """加入队列，返回 /prompt 的响应；队列已满时返回 None"""
+        prompt_id = payload.get('prompt_id') or str(uuid.uuid4())
+        with self.lock:
+            if self.max_queue and len(self.pending) >= self.max_queue:
+                return None
+            number = self.number
+            self.number += 1
+            item = [number, prompt_id, payload.get('prompt', {}), {'client_id': payload.get('client_id')}, []]
+            self.pending.append(item)
+            self.lock.notify()
+        return {'prompt_id': prompt_id, 'number': number, 'node_errors': {}}
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.lock.wait()
+                item = self.pending.pop(0)
+                self.running.append(item)
+            try:
+                self._execute(item)
+            finally:
+                with self.lock:
+                    self.running.remove(item)
+
+    def _execute(self, item):
+        _, prompt_id, prompt, extra, _ = item
+        client_id = extra.get('client_id')
+        self.send_event(client_id, 'execution_start', {'prompt_id': prompt_id})
+        outputs = {}
+        node_ids = list(prompt) or ['1']
+        with self.lock:
+            jitter = self.random.uniform(-self.exec_jitter, self.exec_jitter) if self.exec_jitter else 0.0
+            failed_node = self.random.choice(node_ids) if self.random.random() < self.fail_rate else None
+        exec_time = max(0.0, self.exec_time * (1 + jitter))
+        step_time = exec_time / (len(node_ids) * self.steps) if exec_time else 0
+        for node_id in node_ids:
+            self.send_event(client_id, 'executing', {'node': node_id, 'prompt_id': prompt_id})
+            for step in range(1, self.steps + 1):
+                if step_time:
+                    time.sleep(step_time)
+                self.send_event(client_id, 'progress', {
+                    'value': step, 'max': self.steps, 'node': node_id, 'prompt_id': prompt_id})
+            if node_id == failed_node:
+                self._fail(item, node_id)
+                return
+            node = prompt.get(node_id) or {}
+            if node.get('class_type') == 'SaveImage':
+                output = {'images': [{'filename': f"{prompt_id}_{node_id}.png", 'subfolder': '', 'type': 'output'}]}
+                outputs[node_id] = output
+                self.send_event(client_id, 'executed', {'node': node_id, 'output': output, 'prompt_id': prompt_id})
+        self.history[prompt_id] = {
+            'prompt': item,
+            'outputs': outputs,
+            'status': {'status_str': 'success', 'completed': True, 'messages': []},
+        }
+        self.send_event(client_id, 'execution_success', {'prompt_id': prompt_id})
+        self.send_event(client_id, 'executing', {'node': None, 'prompt_id': prompt_id})
+
+    def _fail(self, item, node_id):
+        """像ComfyUI一样记录执行失败：推送 execution_error，历史记录状态为 error"""
+        _, prompt_id, prompt, extra, _ = item
+        self._record_fault('failed')
+        error = {
+            'prompt_id': prompt_id, 'node_id': node_id,
+            'node_type': (prompt.get(node_id) or {}).get('class_type'),
+            'exception_message': 'injected failure', 'exception_type': 'RuntimeError', 'traceback': [],
+        }
+        self.history[prompt_id] = {
+            'prompt': item,
+            'outputs': {},
+            'status': {'status_str': 'error', 'completed': False, 'messages': [['execution_error', error]]},
+        }
+        self.send_event(extra.get('client_id'), 'execution_error', error)
+
+
+def start_fake_comfyui(host='127.0.0.1', port=0, exec_time=0.0, latency=0.0, image_size=256 << 10, **options):
+    """在后台线程启动桩服务，返回 (server, base_url)
+
+    latency 为每个GET请求的额外响应延迟（秒），用于模拟繁忙的ComfyUI；
+    image_size 为 /view 返回的图片大小（字节）；
+    其余参数（workers、exec_jitter、max_queue、error_rate、timeout_rate、hang_time、fail_rate、seed）
+    见 FakeComfyUIServer。
+    """
+    server = FakeComfyUIServer((host, port), exec_time=exec_time, latency=latency, image_size=image_size,
+                               **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake ComfyUI server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8188)
+    parser.add_argument('--exec-time', type=float, default=0.0, help='每个任务的模拟执行时间（秒）')
+    parser.add_argument('--latency', type=float, default=0.0, help='GET请求的额外响应延迟（秒）')
+    parser.add_argument('--image-size', type=int, default=256 << 10, help='/view 返回的图片大小（字节）')
+    parser.add_argument('--workers', type=int, default=1, help='同时执行的任务数')
+    parser.add_argument('--exec-jitter', type=float, default=0.0, help='执行时间的随机波动比例，如0.3为±30%%')
+    parser.add_argument('--max-queue', type=int, default=0, help='排队任务数上限，0为不限制')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500的请求比例')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='挂起后断开连接的请求比例')
+    parser.add_argument('--hang-time', type=float, default=30.0, help='超时请求挂起的时间（秒）')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='执行失败的任务比例')
+    parser.add_argument('--seed', type=int, help='故障注入的随机种子')
+    args = parser.parse_args()
+    server, base_url = start_fake_comfyui(
+        args.host, args.port, args.exec_time, args.latency, args.image_size, workers=args.workers,
+        exec_jitter=args.exec_jitter, max_queue=args.max_queue, error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate, hang_time=args.hang_time, fail_rate=args.fail_rate, seed=args.seed,
+    )
+    print(f"Fake ComfyUI listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,123 @@
+"""本地兰空(Lsky Pro)图床桩服务，用于测试与基准测试
+
+实现 POST /api/v1/upload：解析 multipart 请求体中的 file 字段，按兰空的响应格式返回图片地址，
+收到的文件记录在 server.uploads 中（文件名 -> sha256）。
+
+用法：
+    python benchmarks/fake_lsky.py --port 2222 --latency 0.2
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_FILENAME = re.compile(rb'name="file"; filename="([^"]*)"')
+
+
+class FakeLskyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        if self.path != '/api/v1/upload':
+            self._send_json({'status': False, 'message': 'not found'}, 404)
+            return
+        if self.server.token and self.headers.get('Authorization') != f'Bearer {self.server.token}':
+            with self.server.lock:
+                self.server.rejected += 1
+            self._send_json({'status': False, 'message': 'Unauthenticated.'}, 401)
+            return
+        if self.server.should_fail():
+            self._send_json({'status': False, 'message': 'Server Error'}, 500)
+            return
+
+        boundary = re.search(r'boundary=(\S+)', self.headers.get('Content-Type', ''))
+        match = _FILENAME.search(body)
+        if boundary is None or match is None:
+            self._send_json({'status': False, 'message': 'The file field is required.'}, 422)
+            return
+        start = body.index(b'\r\n\r\n', match.end()) + 4
+        end = body.index(b'\r\n--' + boundary.group(1).encode('ascii'), start)
+        data = body[start:end]
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        digest = hashlib.sha256(data).hexdigest()
+        filename = match.group(1).decode('utf-8')
+        with self.server.lock:
+            self.server.uploads[filename] = digest
+        self._send_json({
+            'status': True,
+            'message': '上传成功',
+            'data': {
+                'key': digest[:6],
+                'name': filename,
+                'size': len(data) / 1024,
+                'links': {'url': f'{self.server.base_url}/i/{digest[:16]}.png'},
+            },
+        })
+
+
+class FakeLskyServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, token='', latency=0.0, fail_every=0):
+        super().__init__(address, FakeLskyHandler)
+        self.token = token
+        self.latency = latency
+        # 每 fail_every 次上传返回一次 500，用于测试重试
+        self.fail_every = fail_every
+        self.requests = 0
+        # token 不匹配被拒绝的请求数
+        self.rejected = 0
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.base_url = f"http://{address[0]}:{self.server_address[1]}"
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            return bool(self.fail_every) and self.requests % self.fail_every == 0
+
+
+def start_fake_lsky(host='127.0.0.1', port=0, token='', latency=0.0, fail_every=0):
+    """在后台线程启动桩服务，返回 (server, upload_url)
+
+    latency 为每次上传的额外处理时间（秒），用于模拟图床保存文件和生成缩略图。
+    """
+    server = FakeLskyServer((host, port), token=token, latency=latency, fail_every=fail_every)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"{server.base_url}/api/v1/upload"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Lsky Pro image host')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--token', default='')
+    parser.add_argument('--latency', type=float, default=0.0, help='每次上传的额外处理时间（秒）')
+    args = parser.parse_args()
+    server, upload_url = start_fake_lsky(args.host, args.port, args.token, args.latency)
+    print(f"Fake Lsky listening on {upload_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,438 @@
+"""端到端压测：在ComfyUI桩服务前启动真实的 app.py 进程，按接近实际使用的请求组合压测
+
+场景：
+- poll：像 dify-ComfyUI.py 一样提交工作流，按固定间隔轮询 /api/task_status，完成后获取 /api/image
+- image：在 poll 的基础上下载每张图片的内容（/api/image/<id>/<index>/content）
+- batch：提交批量任务，轮询 /api/batch/<batch_id> 直到全部结束（asyncio 服务模式没有批量接口）
+- mix：按 --mix 给出的比例随机选择以上场景
+
+app.py 以子进程运行（--server-mode 选择 flask 或 async），配置通过环境变量传入，任务存储和图片缓存
+放在临时目录。报告每个接口的请求数、错误数、p50/p99 延迟，整体吞吐量，上游放大倍数（ComfyUI收到的
+请求数 / 本服务收到的请求数）以及服务进程的峰值常驻内存。每次运行的结果追加到 --results 指定的
+JSON Lines 文件，并与参数相同的上一次结果对比。
+
+用法：
+    python benchmarks/load_suite.py --scenario mix --clients 16 --duration 30 --exec-time 1 --workers 2
+    python benchmarks/load_suite.py --scenario poll --error-rate 0.02 --timeout-rate 0.01 --hang-time 3
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+SCENARIOS = ('poll', 'image', 'batch', 'mix')
+# 任务结束的状态，与 dify-ComfyUI.py 的判断一致
+FINAL_STATUSES = ('completed', 'failed', 'error')
+DEFAULT_RESULTS = ROOT / 'benchmarks' / 'results' / 'load_suite.jsonl'
+# 结果对比时使用的参数，其余参数（如 --label）不影响对比
+COMPARE_KEYS = ('scenario', 'mix', 'server_mode', 'clients', 'duration', 'workflow', 'batch_size',
+                'poll_interval', 'exec_time', 'exec_jitter', 'workers', 'max_queue', 'latency',
+                'image_size', 'error_rate', 'timeout_rate', 'hang_time', 'fail_rate')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+class Recorder:
+    """按接口记录每个请求的耗时和结果，可在多个线程间共享"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.outcomes = defaultdict(int)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def request(self, session, endpoint, method, url, **kwargs):
+        """发送一个请求并记录，连接失败、超时和5xx计为错误；返回响应，请求失败时返回 None"""
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=60, **kwargs)
+            response.content
+        except requests.exceptions.RequestException:
+            response = None
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.requests += 1
+            self.latencies[endpoint].append(elapsed)
+            if response is None or response.status_code >= 500:
+                self.errors[endpoint] += 1
+        return response
+
+    def outcome(self, scenario, result, elapsed):
+        with self.lock:
+            self.outcomes[(scenario, result)] += 1
+            self.latencies[f'flow:{scenario}'].append(elapsed)
+
+
+class RSSSampler(threading.Thread):
+    """定期读取 /proc/<pid>/status 中的 VmRSS，记录峰值（KB）"""
+
+    def __init__(self, pid, interval=0.2):
+        super().__init__(daemon=True)
+        self.path = f'/proc/{pid}/status'
+        self.interval = interval
+        self.peak = None
+        self.last = None
+        self.stopped = threading.Event()
+
+    def sample(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1])
+        except OSError:
+            return None
+
+    def run(self):
+        while not self.stopped.is_set():
+            rss = self.sample()
+            if rss is not None:
+                self.last = rss
+                self.peak = max(self.peak or 0, rss)
+            self.stopped.wait(self.interval)
+
+
+class LoadClient:
+    """一个模拟的调用方，按场景循环发送请求"""
+
+    def __init__(self, args, base_url, recorder):
+        self.args = args
+        self.base_url = base_url
+        self.recorder = recorder
+        self.session = requests.Session()
+        self.random = random.Random()
+
+    def call(self, endpoint, method, path, **kwargs):
+        return self.recorder.request(self.session, endpoint, method, self.base_url + path, **kwargs)
+
+    def wait_task(self, prompt_id, deadline):
+        """像 dify-ComfyUI.py 一样轮询任务状态直到结束，返回最后的状态"""
+        while time.monotonic() < deadline:
+            time.sleep(self.args.poll_interval)
+            response = self.call('GET /api/task_status', 'GET', f'/api/task_status/{prompt_id}')
+            if response is None or response.status_code != 200:
+                continue
+            status = response.json().get('status')
+            if status in FINAL_STATUSES:
+                return status
+        return 'timeout'
+
+    def run_poll(self, fetch_content=False):
+        deadline = time.monotonic() + self.args.task_timeout
+        response = self.call('POST /api/workflow', 'POST', f'/api/workflow/{self.args.workflow}',
+                             json={'seed': self.random.randrange(2 ** 32)})
+        if response is None or response.status_code not in (200, 202):
+            return 'submit_error'
+        prompt_id = response.json()['prompt_id']
+        status = self.wait_task(prompt_id, deadline)
+        if status != 'completed':
+            return status
+        response = self.call('GET /api/image', 'GET', f'/api/image/{prompt_id}')
+        if response is None or response.status_code != 200:
+            return 'image_error'
+        if fetch_content:
+            for index, _ in enumerate(response.json().get('images', [])):
+                content = self.call('GET /api/image/content', 'GET', f'/api/image/{prompt_id}/{index}/content')
+                if content is None or content.status_code != 200:
+                    return 'content_error'
+        return 'completed'
+
+    def run_batch(self):
+        deadline = time.monotonic() + self.args.task_timeout
+        seeds = [self.random.randrange(2 ** 32) for _ in range(self.args.batch_size)]
+        response = self.call('POST /api/workflow/batch', 'POST', f'/api/workflow/{self.args.workflow}/batch',
+                             json={'seeds': seeds})
+        if response is None or response.status_code != 200:
+            return 'submit_error'
+        batch_id = response.json()['batch_id']
+        while time.monotonic() < deadline:
+            time.sleep(self.args.poll_interval)
+            response = self.call('GET /api/batch', 'GET', f'/api/batch/{batch_id}')
+            if response is None or response.status_code != 200:
+                continue
+            body = response.json()
+            if body['finished']:
+                return 'completed' if body['counts']['completed'] == body['total'] else 'partial'
+        return 'timeout'
+
+    def pick(self):
+        if self.args.scenario != 'mix':
+            return self.args.scenario
+        scenarios, weights = zip(*self.args.mix.items())
+        return self.random.choices(scenarios, weights)[0]
+
+    def run(self, stop_at):
+        while time.monotonic() < stop_at:
+            scenario = self.pick()
+            start = time.perf_counter()
+            if scenario == 'batch':
+                result = self.run_batch()
+            else:
+                result = self.run_poll(fetch_content=scenario == 'image')
+            self.recorder.outcome(scenario, result, time.perf_counter() - start)
+            if result == 'submit_error':
+                # 提交被拒绝（如排队已满）时稍后重试，不空转
+                time.sleep(self.args.poll_interval)
+
+
+def parse_mix(value):
+    """解析 poll=6,image=3,batch=1 形式的场景比例"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS or name == 'mix':
+            raise argparse.ArgumentTypeError(f'unknown scenario: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def start_proxy(args, comfyui_url, workdir):
+    """以子进程启动 app.py，返回 (进程, 地址)"""
+    port = free_port()
+    env = dict(os.environ, **{
+        'FLASK_HOST': '127.0.0.1',
+        'FLASK_PORT': str(port),
+        'FLASK_DEBUG': 'False',
+        'SERVER_MODE': args.server_mode,
+        'LOG_LEVEL': 'WARNING',
+        'COMFYUI_BASE_URL': comfyui_url,
+        'COMFYUI_BASE_URLS': comfyui_url,
+        'JOB_STORE_PATH': os.path.join(workdir, 'jobs.sqlite3'),
+        'OUTPUT_CACHE_DIR': os.path.join(workdir, 'output_cache'),
+        'PYTHONUNBUFFERED': '1',
+    })
+    process = subprocess.Popen([sys.executable, str(ROOT / 'app.py')], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, 'app.log'), 'wb'))
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'app.py exited with code {process.returncode}, see {workdir}/app.log')
+        try:
+            requests.get(f'{base_url}/api/workflows', timeout=1).raise_for_status()
+            return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'app.py did not start within 30s, see {workdir}/app.log')
+
+
+def stop_proxy(process):
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def summarize(args, recorder, server, elapsed, rss):
+    endpoints = {}
+    for endpoint, values in sorted(recorder.latencies.items()):
+        endpoints[endpoint] = {
+            'count': len(values),
+            'errors': recorder.errors.get(endpoint, 0),
+            'p50_ms': round(percentile(values, 0.5) * 1000, 2),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+            'mean_ms': round(statistics.fmean(values) * 1000, 2),
+        }
+    upstream = dict(sorted(server.calls.items()))
+    upstream_total = sum(upstream.values())
+    flows = sum(count for (_, _), count in recorder.outcomes.items())
+    return {
+        'requests': recorder.requests,
+        'throughput_rps': round(recorder.requests / elapsed, 2),
+        'flows': flows,
+        'flows_per_s': round(flows / elapsed, 3),
+        'outcomes': {f'{scenario}:{result}': count for (scenario, result), count in sorted(recorder.outcomes.items())},
+        'endpoints': endpoints,
+        'upstream_calls': upstream,
+        'upstream_amplification': round(upstream_total / recorder.requests, 3) if recorder.requests else None,
+        'upstream_faults': dict(server.faults),
+        'proxy_rss_peak_kb': rss.peak,
+        'proxy_rss_end_kb': rss.last,
+    }
+
+
+def print_report(summary):
+    print(f'{"endpoint":<28} {"count":>7} {"errors":>7} {"p50 ms":>9} {"p99 ms":>9}')
+    for endpoint, stats in summary['endpoints'].items():
+        print(f'{endpoint:<28} {stats["count"]:>7} {stats["errors"]:>7} {stats["p50_ms"]:>9.1f} {stats["p99_ms"]:>9.1f}')
+    print()
+    print(f'requests: {summary["requests"]}  throughput: {summary["throughput_rps"]} req/s  '
+          f'flows: {summary["flows"]} ({summary["flows_per_s"]}/s)')
+    print('outcomes: ' + ', '.join(f'{key}={count}' for key, count in summary['outcomes'].items()))
+    print(f'upstream calls: {sum(summary["upstream_calls"].values())} '
+          f'(amplification {summary["upstream_amplification"]}x)  '
+          + ', '.join(f'{path}={count}' for path, count in summary['upstream_calls'].items()))
+    if summary['upstream_faults']:
+        print('injected faults: ' + ', '.join(f'{kind}={count}' for kind, count in summary['upstream_faults'].items()))
+    if summary['proxy_rss_peak_kb'] is not None:
+        print(f'proxy RSS: peak {summary["proxy_rss_peak_kb"] / 1024:.1f} MB, '
+              f'end {summary["proxy_rss_end_kb"] / 1024:.1f} MB')
+
+
+def load_previous(path, params):
+    """找到参数相同的上一次结果"""
+    if not path.exists():
+        return None
+    key = {name: params.get(name) for name in COMPARE_KEYS}
+    previous = None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if {name: record['params'].get(name) for name in COMPARE_KEYS} == key:
+                previous = record
+    return previous
+
+
+def print_comparison(previous, summary):
+    """与上一次结果对比：吞吐量、各接口 p50/p99、上游放大倍数、峰值内存"""
+    def change(old, new):
+        if old in (None, 0) or new is None:
+            return 'n/a'
+        return f'{(new - old) / old:+.1%}'
+
+    print()
+    print(f'compared with {previous["commit"]} ({previous["timestamp"]}):')
+    before = previous['summary']
+    rows = [('throughput req/s', before['throughput_rps'], summary['throughput_rps']),
+            ('upstream amplification', before['upstream_amplification'], summary['upstream_amplification']),
+            ('proxy RSS peak KB', before['proxy_rss_peak_kb'], summary['proxy_rss_peak_kb'])]
+    for endpoint, stats in summary['endpoints'].items():
+        old = before['endpoints'].get(endpoint)
+        if old is not None:
+            rows.append((f'{endpoint} p50 ms', old['p50_ms'], stats['p50_ms']))
+            rows.append((f'{endpoint} p99 ms', old['p99_ms'], stats['p99_ms']))
+    for label, old, new in rows:
+        print(f'  {label:<40} {str(old):>10} -> {str(new):>10} {change(old, new):>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end load test of app.py against a fake ComfyUI')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='mix')
+    parser.add_argument('--mix', type=parse_mix, default='poll=6,image=3,batch=1', help='mix 场景的比例')
+    parser.add_argument('--server-mode', choices=('flask', 'async'), default='flask')
+    parser.add_argument('--clients', type=int, default=8, help='并发的调用方数量')
+    parser.add_argument('--duration', type=float, default=20, help='发起新流程的时间（秒），之后等待进行中的流程结束')
+    parser.add_argument('--workflow', default='sdxl')
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='轮询间隔（dify-ComfyUI.py 为5秒）')
+    parser.add_argument('--task-timeout', type=float, default=120, help='单个流程的最长等待时间（秒）')
+    # 桩服务参数
+    parser.add_argument('--exec-time', type=float, default=0.5)
+    parser.add_argument('--exec-jitter', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=2, help='桩服务同时执行的任务数')
+    parser.add_argument('--max-queue', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--image-size', type=int, default=1 << 20)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--hang-time', type=float, default=5.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0, help='故障注入的随机种子')
+    # 结果
+    parser.add_argument('--results', type=Path, default=DEFAULT_RESULTS, help='结果文件（JSON Lines）')
+    parser.add_argument('--label', default='', help='附加在结果记录中的说明')
+    parser.add_argument('--no-save', action='store_true', help='只打印，不写入结果文件')
+    args = parser.parse_args()
+    if args.server_mode == 'async' and (args.scenario == 'batch' or
+                                        args.scenario == 'mix' and args.mix.get('batch')):
+        parser.error('async server mode has no batch endpoint; use --scenario poll/image or a mix without batch')
+
+    server, comfyui_url = start_fake_comfyui(
+        exec_time=args.exec_time, latency=args.latency, image_size=args.image_size, workers=args.workers,
+        exec_jitter=args.exec_jitter, max_queue=args.max_queue, error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate, hang_time=args.hang_time, fail_rate=args.fail_rate, seed=args.seed,
+    )
+    workdir = tempfile.mkdtemp(prefix='load_suite_')
+    process, base_url = start_proxy(args, comfyui_url, workdir)
+    rss = RSSSampler(process.pid)
+    rss.start()
+    # 启动探测产生的请求不计入统计
+    server.calls.clear()
+    server.faults.clear()
+
+    recorder = Recorder()
+    try:
+        start = time.perf_counter()
+        stop_at = time.monotonic() + args.duration
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            for future in [executor.submit(LoadClient(args, base_url, recorder).run, stop_at)
+                           for _ in range(args.clients)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        rss.stopped.set()
+        rss.join()
+        stop_proxy(process)
+
+    summary = summarize(args, recorder, server, elapsed, rss)
+    print_report(summary)
+
+    params = {key: value for key, value in vars(args).items() if key not in ('results', 'label', 'no_save')}
+    previous = load_previous(args.results, params)
+    if previous is not None:
+        print_comparison(previous, summary)
+    if not args.no_save:
+        args.results.parent.mkdir(parents=True, exist_ok=True)
+        record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'label': args.label,
+            'elapsed_s': round(elapsed, 2),
+            'params': params,
+            'summary': summary,
+        }
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f'\nresult appended to {args.results}')
+
+
+if __name__ == '__main__':
+    main()
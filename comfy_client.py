@@ -0,0 +1,144 @@
+"""ComfyUI HTTP客户端：共享连接池、超时与重试"""
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from metrics import (
+    UPSTREAM_FAILURES, UPSTREAM_REQUEST_SECONDS, UPSTREAM_RESPONSE_BYTES, UPSTREAM_RETRIES, endpoint_label
+)
+
+logger = logging.getLogger(__name__)
+
+# 需要重试的上游状态码
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+# 可以安全重放的HTTP方法
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class ComfyUIClient:
+    """基于 requests.Session 的连接池客户端，可在多个请求线程间共享"""
+
+    def __init__(self, base_url, pool_size=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, retry_backoff=None, retry_deadline=None):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size or Config.COMFYUI_POOL_SIZE
+        self.connect_timeout = connect_timeout or Config.COMFYUI_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or Config.COMFYUI_READ_TIMEOUT
+        self.max_retries = max(1, max_retries or Config.COMFYUI_MAX_RETRIES)
+        self.retry_backoff = Config.COMFYUI_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self.retry_deadline = retry_deadline or Config.COMFYUI_RETRY_DEADLINE
+
+        # 重试由本类自己处理，适配器层不再重试
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, endpoint):
+        """构建完整的ComfyUI URL"""
+        return f"{self.base_url}/{endpoint.lstrip('/')}"
+
+    def request(self, method, endpoint, timeout=None, backoff=False, **kwargs):
+        """发送请求，失败时重试
+
+        timeout 可以是单个数值或 (connect, read) 元组，默认使用配置中的超时。
+        默认不在调用线程上等待：只有不需要退避的失败（池中空闲连接被对端关闭）会立即重试，
+        其他失败直接交给调用方，由接口返回错误或由后台线程、准入队列稍后重新调度。
+        backoff=True 供后台线程使用，按带抖动的指数退避在 retry_deadline 内重试。
+        状态码重试只用于幂等方法，提交prompt等请求收到 5xx 时不重放。
+        """
+        url = self.url(endpoint)
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        deadline = time.monotonic() + self.retry_deadline
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        labels = {'method': method.upper(), 'endpoint': endpoint_label(endpoint)}
+
+        for attempt in range(1, self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                reason = type(e).__name__
+                UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, status=reason, **labels)
+                delay = self._retry_delay(attempt, e)
+                if not self._can_retry(method, e) or attempt == self.max_retries \
+                        or not self._can_wait(delay, backoff, deadline):
+                    UPSTREAM_FAILURES.inc(reason=reason, **labels)
+                    raise
+            else:
+                reason = str(response.status_code)
+                UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start, status=reason, **labels)
+                if response.status_code not in RETRY_STATUS_CODES or not idempotent \
+                        or attempt == self.max_retries:
+                    if response.status_code >= 400:
+                        UPSTREAM_FAILURES.inc(reason=reason, **labels)
+                    elif not kwargs.get('stream'):
+                        UPSTREAM_RESPONSE_BYTES.observe(len(response.content), endpoint=labels['endpoint'])
+                    response.raise_for_status()
+                    return response
+                delay = self._retry_delay(attempt)
+                if not self._can_wait(delay, backoff, deadline):
+                    UPSTREAM_FAILURES.inc(reason=reason, **labels)
+                    response.raise_for_status()
+                response.close()
+
+            UPSTREAM_RETRIES.inc(reason=reason, **labels)
+
+            logger.warning('Attempt %d to %s failed, retrying in %.2f seconds', attempt, endpoint, delay,
+                           extra={'backend': self.base_url})
+            if delay:
+                time.sleep(delay)
+
+    def _can_retry(self, method, error):
+        """判断异常是否可以重试"""
+        if isinstance(error, requests.exceptions.ConnectionError):
+            # 包括连接超时：请求没有送达服务端，任何方法都可以重放
+            return True
+        if isinstance(error, requests.exceptions.Timeout):
+            # 读超时时服务端可能已经接收了请求，非幂等方法（如提交prompt）不重放
+            return method.upper() in IDEMPOTENT_METHODS
+        return False
+
+    def _can_wait(self, delay, backoff, deadline):
+        """是否可以在退避后重试：立即重试总是允许，需要等待时只允许后台调用且不超过总时长"""
+        if not delay:
+            return True
+        return backoff and time.monotonic() + delay <= deadline
+
+    def _retry_delay(self, attempt, error=None):
+        """计算退避时间（带抖动的指数退避）"""
+        if attempt == 1 and isinstance(error, requests.exceptions.ConnectionError) \
+                and not isinstance(error, requests.exceptions.ConnectTimeout):
+            # 池中空闲连接被对端关闭是最常见的失败，第一次立即重试即可
+            return 0
+        return random.uniform(0, self.retry_backoff * (2 ** (attempt - 1)))
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url=None):
+    """获取指定ComfyUI地址的共享客户端"""
+    base_url = (base_url or Config.COMFYUI_BASE_URL).rstrip('/')
+    client = _clients.get(base_url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(base_url)
+            if client is None:
+                client = _clients[base_url] = ComfyUIClient(base_url)
+    return client
@@ -0,0 +1,105 @@
+"""ComfyUI websocket事件流：每个后端一条常驻连接，断线自动重连"""
+import logging
+import threading
+
+from comfy_client import get_client
+from config import Config
+import json_codec
+
+try:
+    import websocket
+except ImportError:  # websocket-client 未安装时退回轮询模式
+    websocket = None
+
+logger = logging.getLogger(__name__)
+
+
+class ComfyUIEventStream(threading.Thread):
+    """订阅 /ws?clientId=... 并把事件交给 JobTracker"""
+
+    def __init__(self, base_url, client_id, tracker):
+        super().__init__(name=f"comfyui-ws-{base_url}", daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.client_id = client_id
+        self.tracker = tracker
+        self.connected = False
+        self._stop_event = threading.Event()
+
+    @property
+    def ws_url(self):
+        scheme, rest = self.base_url.split('://', 1)
+        ws_scheme = 'wss' if scheme == 'https' else 'ws'
+        return f"{ws_scheme}://{rest}/ws?clientId={self.client_id}"
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        delay = 1
+        while not self._stop_event.is_set():
+            try:
+                ws = websocket.create_connection(self.ws_url, timeout=Config.COMFYUI_CONNECT_TIMEOUT)
+            except Exception as e:
+                logger.warning('ComfyUI websocket connect failed: %s, retrying in %ss', e, delay,
+                               extra={'backend': self.base_url})
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, Config.COMFYUI_WS_MAX_RECONNECT_DELAY)
+                continue
+
+            delay = 1
+            self.connected = True
+            logger.info('ComfyUI websocket connected', extra={'backend': self.base_url})
+            try:
+                # 断线期间可能错过了事件，重新连接后用 /history 补齐
+                self._resync()
+                ws.settimeout(Config.COMFYUI_WS_PING_INTERVAL)
+                while not self._stop_event.is_set():
+                    try:
+                        message = ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        ws.ping()
+                        continue
+                    # 二进制消息是预览图，不需要处理
+                    if isinstance(message, str) and message:
+                        self.tracker.handle_message(self.base_url, json_codec.loads(message))
+            except Exception as e:
+                logger.warning('ComfyUI websocket disconnected: %s', e, extra={'backend': self.base_url})
+            finally:
+                self.connected = False
+                ws.close()
+
+    def _resync(self):
+        client = get_client(self.base_url)
+        for prompt_id in self.tracker.unfinished(self.base_url):
+            try:
+                history = client.request('GET', f'/history/{prompt_id}', backoff=True).json()
+            except Exception as e:
+                logger.warning('Resync failed: %s', e, extra={'prompt_id': prompt_id, 'backend': self.base_url})
+                continue
+            if prompt_id in history:
+                self.tracker.complete_from_history(prompt_id, history[prompt_id])
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def ensure_event_stream(base_url, client_id, tracker):
+    """确保指定后端的事件流已经启动，未启用时返回 None"""
+    if websocket is None or not Config.COMFYUI_WS_ENABLED:
+        return None
+    base_url = base_url.rstrip('/')
+    stream = _streams.get(base_url)
+    if stream is None:
+        with _streams_lock:
+            stream = _streams.get(base_url)
+            if stream is None:
+                stream = _streams[base_url] = ComfyUIEventStream(base_url, client_id, tracker)
+                stream.start()
+    return stream
+
+
+def is_stream_connected(base_url):
+    """判断指定后端的事件流当前是否在线"""
+    stream = _streams.get(base_url.rstrip('/'))
+    return stream is not None and stream.connected
@@ -7,7 +7,133 @@ load_dotenv(override=True)
 class Config:
     # ComfyUI服务地址，优先使用环境变量，否则使用默认值
     COMFYUI_BASE_URL = os.environ.get('COMFYUI_BASE_URL', 'http://localhost:8188')
-    
+
+    # 多个ComfyUI后端（逗号分隔），未设置时只使用 COMFYUI_BASE_URL
+    COMFYUI_BASE_URLS = [url.strip() for url in os.environ.get('COMFYUI_BASE_URLS', '').split(',') if url.strip()]
+    # 后端队列深度与显存的刷新间隔、健康检查超时（秒），连续失败多少次后剔除
+    BACKEND_REFRESH_INTERVAL = float(os.environ.get('BACKEND_REFRESH_INTERVAL', 2))
+    BACKEND_HEALTH_TIMEOUT = float(os.environ.get('BACKEND_HEALTH_TIMEOUT', 3))
+    BACKEND_MAX_FAILURES = int(os.environ.get('BACKEND_MAX_FAILURES', 2))
+    # 已加载相同模型的后端相当于队列少多少个任务，以及每个后端记住的最近模型数
+    BACKEND_AFFINITY_WEIGHT = float(os.environ.get('BACKEND_AFFINITY_WEIGHT', 1))
+    BACKEND_RECENT_MODELS = int(os.environ.get('BACKEND_RECENT_MODELS', 2))
+
+    # ComfyUI连接池与超时配置（秒）
+    COMFYUI_POOL_SIZE = int(os.environ.get('COMFYUI_POOL_SIZE', 32))
+    COMFYUI_CONNECT_TIMEOUT = float(os.environ.get('COMFYUI_CONNECT_TIMEOUT', 5))
+    COMFYUI_READ_TIMEOUT = float(os.environ.get('COMFYUI_READ_TIMEOUT', 60))
+
+    # 重试配置：最大尝试次数、退避基数、单次请求的总重试时间上限
+    COMFYUI_MAX_RETRIES = int(os.environ.get('COMFYUI_MAX_RETRIES', 3))
+    COMFYUI_RETRY_BACKOFF = float(os.environ.get('COMFYUI_RETRY_BACKOFF', 0.5))
+    COMFYUI_RETRY_DEADLINE = float(os.environ.get('COMFYUI_RETRY_DEADLINE', 10))
+
+    # 通过websocket跟踪任务状态（需要安装 websocket-client）
+    COMFYUI_WS_ENABLED = os.environ.get('COMFYUI_WS_ENABLED', 'True').lower() == 'true'
+    COMFYUI_WS_PING_INTERVAL = float(os.environ.get('COMFYUI_WS_PING_INTERVAL', 30))
+    COMFYUI_WS_MAX_RECONNECT_DELAY = float(os.environ.get('COMFYUI_WS_MAX_RECONNECT_DELAY', 30))
+    # 内存中最多保留的任务状态数量
+    JOB_TRACKER_MAX_JOBS = int(os.environ.get('JOB_TRACKER_MAX_JOBS', 10000))
+    # 任务状态持久化（SQLite）：数据库路径，已结束任务的保留时间（秒，0 表示永久保留）
+    JOB_STORE_ENABLED = os.environ.get('JOB_STORE_ENABLED', 'True').lower() == 'true'
+    JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs.sqlite3'))
+    JOB_STORE_RETENTION = float(os.environ.get('JOB_STORE_RETENTION', 30 * 24 * 3600))
+
+    # /queue、/system_stats 响应的缓存时间（秒，0 表示不缓存），已完成任务的 /history 缓存条数
+    UPSTREAM_CACHE_TTL = float(os.environ.get('UPSTREAM_CACHE_TTL', 1))
+    HISTORY_CACHE_SIZE = int(os.environ.get('HISTORY_CACHE_SIZE', 2000))
+
+    # 图片代理每次转发的块大小（字节）
+    IMAGE_PROXY_CHUNK_SIZE = int(os.environ.get('IMAGE_PROXY_CHUNK_SIZE', 64 * 1024))
+
+    # 生成图片的本地磁盘缓存：目录、总大小上限（字节）、任务完成后预取图片的线程数
+    OUTPUT_CACHE_ENABLED = os.environ.get('OUTPUT_CACHE_ENABLED', 'True').lower() == 'true'
+    OUTPUT_CACHE_DIR = os.environ.get('OUTPUT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output_cache'))
+    OUTPUT_CACHE_MAX_BYTES = int(os.environ.get('OUTPUT_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+    OUTPUT_CACHE_WORKERS = int(os.environ.get('OUTPUT_CACHE_WORKERS', 2))
+
+    # 调用方上传的输入图片：ComfyUI input 目录下的子目录、单张图片的大小上限（字节）、每个后端记录的已上传图片数、
+    # 记录的有效期（秒，过期后重新向后端确认）
+    INPUT_IMAGE_SUBFOLDER = os.environ.get('INPUT_IMAGE_SUBFOLDER', 'api')
+    INPUT_IMAGE_MAX_BYTES = int(os.environ.get('INPUT_IMAGE_MAX_BYTES', 50 * 1024 ** 2))
+    INPUT_IMAGE_MAX_KNOWN = int(os.environ.get('INPUT_IMAGE_MAX_KNOWN', 10000))
+    INPUT_IMAGE_KNOWN_TTL = float(os.environ.get('INPUT_IMAGE_KNOWN_TTL', 600))
+
+    # 输出图片转码：编码线程数、只给出质量或尺寸时使用的格式、默认质量、缩略图最长边上限（像素）
+    RENDITION_WORKERS = int(os.environ.get('RENDITION_WORKERS', 2))
+    RENDITION_DEFAULT_FORMAT = os.environ.get('RENDITION_DEFAULT_FORMAT', 'webp')
+    RENDITION_DEFAULT_QUALITY = int(os.environ.get('RENDITION_DEFAULT_QUALITY', 80))
+    RENDITION_MAX_SIZE = int(os.environ.get('RENDITION_MAX_SIZE', 4096))
+
+    # 任务完成后把生成的图片上传到兰空(Lsky)兼容图床，上传地址为空时不上传
+    LSKY_UPLOAD_URL = os.environ.get('LSKY_UPLOAD_URL', '')
+    LSKY_TOKEN = os.environ.get('LSKY_TOKEN', '')
+    LSKY_STRATEGY_ID = os.environ.get('LSKY_STRATEGY_ID', '')
+    LSKY_VERIFY_SSL = os.environ.get('LSKY_VERIFY_SSL', 'True').lower() == 'true'
+    # 同时上传的图片数（连接池大小）、单次上传超时（秒）、每张图片的最大尝试次数
+    LSKY_UPLOAD_WORKERS = int(os.environ.get('LSKY_UPLOAD_WORKERS', 4))
+    LSKY_UPLOAD_TIMEOUT = float(os.environ.get('LSKY_UPLOAD_TIMEOUT', 60))
+    LSKY_UPLOAD_RETRIES = int(os.environ.get('LSKY_UPLOAD_RETRIES', 3))
+    # 上传前转码：格式为空时上传原图，否则按格式、质量和最长边（0 表示保持原尺寸）上传转码版本
+    LSKY_UPLOAD_FORMAT = os.environ.get('LSKY_UPLOAD_FORMAT', '')
+    LSKY_UPLOAD_QUALITY = int(os.environ.get('LSKY_UPLOAD_QUALITY', 85))
+    LSKY_UPLOAD_MAX_SIZE = int(os.environ.get('LSKY_UPLOAD_MAX_SIZE', 0))
+
+    # 相同工作流+输入的重复提交直接复用已有结果：记录保留时间（秒）与最大条数
+    DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', 'True').lower() == 'true'
+    DEDUP_TTL = float(os.environ.get('DEDUP_TTL', 3600))
+    DEDUP_MAX_ENTRIES = int(os.environ.get('DEDUP_MAX_ENTRIES', 10000))
+
+    # 本地准入队列：每个后端最多的在途任务数，达到上限后降到低水位以下才继续放行，
+    # 单个调用方（X-Client-Id 请求头或客户端IP）最多的在途任务数（0 不限制），本地队列最大长度
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'False').lower() == 'true'
+    ADMISSION_MAX_INFLIGHT = int(os.environ.get('ADMISSION_MAX_INFLIGHT', 4))
+    ADMISSION_WATERMARK = int(os.environ.get('ADMISSION_WATERMARK', 2))
+    ADMISSION_MAX_PER_CLIENT = int(os.environ.get('ADMISSION_MAX_PER_CLIENT', 0))
+    ADMISSION_MAX_QUEUED = int(os.environ.get('ADMISSION_MAX_QUEUED', 1000))
+
+    # /api/workflow/<name>/run 等待结果的默认与最大超时（秒）
+    RUN_WAIT_TIMEOUT = float(os.environ.get('RUN_WAIT_TIMEOUT', 300))
+    RUN_WAIT_MAX_TIMEOUT = float(os.environ.get('RUN_WAIT_MAX_TIMEOUT', 1800))
+    # SSE心跳间隔，以及websocket离线时查询 /history 的间隔（秒）
+    RUN_HEARTBEAT_INTERVAL = float(os.environ.get('RUN_HEARTBEAT_INTERVAL', 15))
+    RUN_OFFLINE_POLL_INTERVAL = float(os.environ.get('RUN_OFFLINE_POLL_INTERVAL', 2))
+
+    # 批量提交：单批最大任务数、并发提交数、内存中保留的批次数
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 500))
+    BATCH_MAX_PARALLEL = int(os.environ.get('BATCH_MAX_PARALLEL', 8))
+    BATCH_MAX_STORED = int(os.environ.get('BATCH_MAX_STORED', 1000))
+
+    # 工作流模板缓存的最大数量（LRU）
+    WORKFLOW_CACHE_SIZE = int(os.environ.get('WORKFLOW_CACHE_SIZE', 64))
+
+    # 提交前裁剪工作流：只保留输出节点（逗号分隔的 class_type）用得到的节点，去掉调试显示节点
+    WORKFLOW_PRUNE_ENABLED = os.environ.get('WORKFLOW_PRUNE_ENABLED', 'False').lower() == 'true'
+    WORKFLOW_PRUNE_OUTPUT_NODES = [name.strip() for name in os.environ.get(
+        'WORKFLOW_PRUNE_OUTPUT_NODES',
+        'SaveImage,PreviewImage,SaveAnimatedWEBP,SaveAnimatedPNG,SaveImageWebsocket,Image Save,VHS_VideoCombine'
+    ).split(',') if name.strip()]
+    WORKFLOW_PRUNE_DEBUG_NODES = [name.strip() for name in os.environ.get(
+        'WORKFLOW_PRUNE_DEBUG_NODES',
+        'ShowText|pysssss,Get resolution [Crystools],easy showAnything,PreviewAny'
+    ).split(',') if name.strip()]
+
+    # JSON 编解码实现：auto（安装了 orjson 时使用）、orjson 或 json（标准库）
+    JSON_CODEC = os.environ.get('JSON_CODEC', 'auto').lower()
+
+    # 响应压缩：按 Accept-Encoding 使用 br（需要 brotli）或 gzip，小于 COMPRESS_MIN_BYTES 的响应不压缩
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'True').lower() == 'true'
+    COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+
+    # 日志级别（DEBUG 时输出完整的请求/工作流JSON）与格式（text 或 json）
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text').lower()
+
+    # 服务模式：flask（同步，默认）或 async（aiohttp，适合大量长时间等待的请求）
+    SERVER_MODE = os.environ.get('SERVER_MODE', 'flask').lower()
+
     # Flask配置
     DEBUG = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
     HOST = os.environ.get('FLASK_HOST', '0.0.0.0')
@@ -18,7 +18,6 @@ def main(prompt: str, workflow: str, nodeid: str,
     import json
     import requests
     import time
-    from io import BytesIO
     from requests.adapters import HTTPAdapter
     from urllib3.util.retry import Retry
 
@@ -132,8 +131,14 @@ def main(prompt: str, workflow: str, nodeid: str,
         # 3. 获取图片信息
         image_info_url = f"{comfyui_base_url}/api/image/{prompt_id}"
         try:
-            image_info_response = session.get(image_info_url, verify=False, timeout=60)  # 增加超时时间
-            image_info_data = image_info_response.json()
+            # 服务端配置了图床时会在任务完成后自动上传，上传中的图片稍等片刻
+            for _ in range(30):
+                image_info_response = session.get(image_info_url, verify=False, timeout=60)  # 增加超时时间
+                image_info_data = image_info_response.json()
+                images = image_info_data.get('images') or []
+                if not any(image.get('upload_status') == 'pending' for image in images):
+                    break
+                time.sleep(1)
             print(f"Image info response: {json.dumps(image_info_data)}")  # 添加日志
             
             if image_info_data.get('status') != 'success' or not image_info_data.get('images'):
@@ -141,10 +146,16 @@ def main(prompt: str, workflow: str, nodeid: str,
                     "result": f"Error: Failed to get image info: {json.dumps(image_info_data)}"
                 }
             
-            # 获取完整URL并处理
-            full_url = image_info_data['images'][0]['url']
-            # 只保留&之前的部分
-            image_url = full_url.split('&')[0]
+            # 服务端已上传全部图片时直接返回图床地址，不再自己下载上传
+            upload_urls = [image.get('upload_url') for image in image_info_data['images']]
+            if all(upload_urls):
+                return {
+                    "result": "\n".join(f"![image]({url})" for url in upload_urls)
+                }
+            
+            # 优先通过API服务转发图片，不直接访问ComfyUI
+            image_info = image_info_data['images'][0]
+            image_url = image_info.get('content_url') or image_info['url'].split('&')[0]
             print(f"Image URL: {image_url}")  # 添加日志
             
         except requests.exceptions.Timeout:
@@ -158,13 +169,13 @@ def main(prompt: str, workflow: str, nodeid: str,
         
         # 4. 下载图片
         try:
+            # requests 的 multipart 编码会把整个文件读入内存，这里直接读取完整图片
             image_response = session.get(image_url, verify=False, timeout=60)  # 增加超时时间
             if image_response.status_code != 200:
                 return {
                     "result": f"Error downloading image: Status code {image_response.status_code}, URL: {image_url}"
                 }
-            image_data = image_response.content
-            print(f"Successfully downloaded image, size: {len(image_data)} bytes")  # 添加日志
+            print(f"Successfully downloaded image, size: {len(image_response.content)} bytes")  # 添加日志
             
         except requests.exceptions.Timeout:
             return {
@@ -182,7 +193,7 @@ def main(prompt: str, workflow: str, nodeid: str,
             }
             
             files = {
-                'file': ('image.png', BytesIO(image_data), 'image/png')
+                'file': ('image.png', image_response.content, 'image/png')
             }
             
             upload_response = session.post(
@@ -27,7 +27,8 @@ def main(comfyui_response: str,
     """
     import requests
     import json
-    from io import BytesIO
+    import mimetypes
+    import os
     from requests.adapters import HTTPAdapter
     from urllib3.util.retry import Retry
     from urllib.parse import urlparse, parse_qs
@@ -66,6 +67,11 @@ def main(comfyui_response: str,
         if not comfyui_data.get('status') == 'success' or not comfyui_data.get('images'):
             return {"result": "Error: Invalid response data or no images found"}
         
+        # 服务端已上传全部图片时直接返回图床地址
+        upload_urls = [image.get('upload_url') for image in comfyui_data['images']]
+        if all(upload_urls):
+            return {"result": "\n".join(f"![Generated Image]({url})" for url in upload_urls)}
+        
         image_info = comfyui_data['images'][0]  # 获取第一张图片
         image_url = image_info['url']
         filename = image_info['filename']
@@ -86,7 +92,8 @@ def main(comfyui_response: str,
                 return f"{base_url}?filename={query_params['filename'][0]}"
             return url
 
-        image_url = clean_url(image_info['url'])
+        # 优先通过API服务转发图片（content_url），旧版本的响应中没有该字段
+        image_url = image_info.get('content_url') or clean_url(image_info['url'])
         
         # 添加调试信息
         print(f"Attempting to download image from: {image_url}")
@@ -113,8 +120,6 @@ def main(comfyui_response: str,
         if not content_type.startswith('image/'):
             return {"result": f"Error: Downloaded content is not an image (Content-Type: {content_type})"}
         
-        image_data = image_response.content
-        
         # 3. 上传到图床
         if not lsky_token.startswith('Bearer '):
             lsky_token = f'Bearer {lsky_token}'
@@ -123,8 +128,13 @@ def main(comfyui_response: str,
             "Authorization": lsky_token
         }
         
+        # requests 的 multipart 编码会把整个文件读入内存，图片按完整内容上传
+        # 按实际下载到的格式上传（content_url 可以带 format/max_size 指向转码版本）
+        extension = mimetypes.guess_extension(content_type.split(';')[0].strip())
+        if extension and not filename.lower().endswith(extension):
+            filename = os.path.splitext(filename)[0] + extension
         files = {
-            'file': (filename, BytesIO(image_data), 'image/png')
+            'file': (filename, image_response.content, content_type)
         }
         
         upload_response = session.post(
@@ -0,0 +1,95 @@
+"""响应压缩：按请求的 Accept-Encoding 协商 br（安装了 brotli 时）或 gzip
+
+JSON 和文本响应（/api/history、/api/view_queue、/metrics 等）压缩率通常在 5-20 倍。小于 COMPRESS_MIN_BYTES
+的响应不压缩；流式响应逐块压缩，不需要先在内存中拼出完整的响应体。
+"""
+import zlib
+
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # brotli 未安装时只提供 gzip
+    brotli = None
+
+# 可以压缩的 Content-Type（图片本身已经压缩过，SSE 需要逐条立即送达）
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain')
+
+
+def available_encodings():
+    """服务端支持的编码，按优先顺序"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compressible(content_type):
+    return bool(content_type) and content_type.split(';')[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+def negotiate(accept_encoding):
+    """从 Accept-Encoding 中选出编码，客户端不接受任何可用编码时返回 None
+
+    按客户端给出的 q 值选择，q 值相同时按服务端的优先顺序（br 优先）；q=0 表示拒绝该编码。
+    """
+    if not Config.COMPRESS_ENABLED or not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            weights[coding] = quality
+    best, best_quality = None, 0.0
+    for coding in available_encodings():
+        quality = weights.get(coding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class Encoder:
+    """一个响应的压缩器，compress() 可以多次调用，最后调用 finish()"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=Config.COMPRESS_BROTLI_QUALITY)
+            self._compress = self._compressor.process
+        else:
+            # wbits=31：带 gzip 头和校验
+            self._compressor = zlib.compressobj(Config.COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+
+    def compress(self, data):
+        return self._compress(data)
+
+    def finish(self):
+        return self._compressor.finish() if self.encoding == 'br' else self._compressor.flush()
+
+
+def compress(data, encoding):
+    encoder = Encoder(encoding)
+    return encoder.compress(data) + encoder.finish()
+
+
+def compress_stream(chunks, encoding):
+    """逐块压缩可迭代的响应体，跳过压缩器暂时没有输出的空块"""
+    encoder = Encoder(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = encoder.compress(chunk)
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,109 @@
+"""生成图片上传到兰空(Lsky Pro)兼容图床
+
+所有上传共用一个带连接池的 requests.Session。请求体按 multipart/form-data 流式生成，
+图片内容直接从ComfyUI的响应（或本地缓存文件）中读取，不在内存中拼接整张图片。
+"""
+import logging
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(Exception):
+    """图床拒绝上传或返回了无法识别的响应"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class MultipartBody:
+    """只有一个文件字段的流式 multipart 请求体
+
+    requests 通过 len 属性得到长度后发送 Content-Length，并分块调用 read()。
+    """
+
+    def __init__(self, fields, name, filename, fileobj, content_type, size):
+        self.boundary = uuid.uuid4().hex
+        head = b''.join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode('utf-8')
+            for key, value in fields.items()
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode('utf-8')
+        tail = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self.len = len(head) + size + len(tail)
+        self._head = head
+        self._file = fileobj
+        self._tail = tail
+        self._remaining = size
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.len
+        chunks = []
+        if self._head:
+            chunks.append(self._head[:size])
+            self._head = self._head[size:]
+            size -= len(chunks[-1])
+        if size > 0 and self._remaining > 0:
+            data = self._file.read(min(size, self._remaining))
+            if not data:
+                raise UploadError('Image source ended before Content-Length bytes were read', retryable=True)
+            self._remaining -= len(data)
+            size -= len(data)
+            chunks.append(data)
+        if size > 0 and not self._remaining and self._tail:
+            chunks.append(self._tail[:size])
+            self._tail = self._tail[size:]
+        return b''.join(chunks)
+
+
+class LskySink:
+    """兰空图床 /api/v1/upload 客户端，可在多个线程间共享"""
+
+    def __init__(self, upload_url, token, strategy_id=None, pool_size=4, timeout=60, verify=True):
+        self.upload_url = upload_url
+        self.token = token if not token or token.startswith('Bearer ') else f'Bearer {token}'
+        self.strategy_id = strategy_id
+        self.timeout = timeout
+        self.verify = verify
+        # 请求体是一次性的流，不能在适配器层重放；失败后由调用者重新读取图片再上传
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def upload(self, filename, fileobj, content_type, size):
+        """上传一张图片，返回图床中的图片地址"""
+        fields = {'strategy_id': self.strategy_id} if self.strategy_id else {}
+        body = MultipartBody(fields, 'file', filename, fileobj, content_type or 'application/octet-stream', size)
+        headers = {'Content-Type': body.content_type, 'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = self.token
+        response = self.session.post(self.upload_url, data=body, headers=headers, timeout=self.timeout,
+                                     verify=self.verify)
+        try:
+            if response.status_code >= 500 or response.status_code == 429:
+                raise UploadError(f'Image host returned {response.status_code}', retryable=True)
+            try:
+                result = response.json()
+            except ValueError:
+                raise UploadError(f'Image host returned a non-JSON response ({response.status_code})')
+            if not result.get('status'):
+                raise UploadError(f"Upload failed: {result.get('message', 'Unknown error')}")
+            url = ((result.get('data') or {}).get('links') or {}).get('url')
+            if not url:
+                raise UploadError('No image URL in upload response')
+            return url
+        finally:
+            response.close()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,142 @@
+"""调用方上传的输入图片（图生图工作流的 LoadImage 节点）转存到ComfyUI
+
+图片按内容的 sha256 命名（<哈希前32位><扩展名>，放在ComfyUI input 目录的子目录下），相同内容的图片在同一个
+后端只上传一次：先查本地记录，再用 /view 确认后端是否已有该文件，都没有时才以 multipart 流式上传到
+/upload/image，图片内容直接从请求的临时文件读取，不在内存中拼接。本地记录在 ttl 秒后过期，
+后端的 input 目录被清理或后端重建后会重新确认并上传。
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from comfy_client import get_client
+from image_sink import MultipartBody
+from metrics import INPUT_IMAGE_UPLOADS
+
+logger = logging.getLogger(__name__)
+
+# ComfyUI LoadImage 节点能读取的图片格式
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.tiff')
+
+
+class InputImageError(ValueError):
+    """上传的文件不是可以使用的图片"""
+
+
+def hash_image(fileobj, chunk_size):
+    """分块计算文件内容的 sha256，返回 (哈希, 大小)，读取后回到文件开头"""
+    digest = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+
+def image_name(digest, filename=None, content_type=None):
+    """按内容哈希命名，扩展名取自原文件名或 Content-Type"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in IMAGE_EXTENSIONS and content_type:
+        extension = mimetypes.guess_extension(content_type.split(';')[0].strip()) or ''
+    if extension not in IMAGE_EXTENSIONS:
+        raise InputImageError(f'Unsupported image type. Expected one of: {", ".join(IMAGE_EXTENSIONS)}')
+    return digest[:32] + extension
+
+
+class InputImageStore:
+    """记录各后端已经持有的输入图片，可在多个线程间共享"""
+
+    def __init__(self, subfolder='', max_entries=10000, ttl=600.0):
+        self.subfolder = subfolder.strip('/')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._held = OrderedDict()
+        self._lock = threading.Lock()
+
+    def reference(self, name):
+        """写入 LoadImage 节点 image 输入的值（子目录/文件名）"""
+        return f'{self.subfolder}/{name}' if self.subfolder else name
+
+    def _remember(self, key):
+        with self._lock:
+            self._held[key] = time.monotonic() + self.ttl
+            self._held.move_to_end(key)
+            while len(self._held) > self.max_entries:
+                self._held.popitem(last=False)
+
+    def _is_held(self, key):
+        with self._lock:
+            expires = self._held.get(key)
+            if expires is None:
+                return False
+            if expires <= time.monotonic():
+                del self._held[key]
+                return False
+            self._held.move_to_end(key)
+            return True
+
+    def ensure(self, base_url, name, fileobj, size, content_type, max_attempts=3):
+        """保证后端的 input 目录中有这张图片，返回 known（本地已记录）、exists（后端已有）或 uploaded"""
+        client = get_client(base_url)
+        key = (client.base_url, name)
+        if self._is_held(key):
+            INPUT_IMAGE_UPLOADS.inc(result='known')
+            return 'known'
+        if self._exists(client, name):
+            self._remember(key)
+            INPUT_IMAGE_UPLOADS.inc(result='exists')
+            return 'exists'
+        self._upload(client, name, fileobj, size, content_type, max_attempts)
+        self._remember(key)
+        INPUT_IMAGE_UPLOADS.inc(result='uploaded')
+        return 'uploaded'
+
+    def _exists(self, client, name):
+        params = {'filename': name, 'subfolder': self.subfolder, 'type': 'input'}
+        try:
+            client.request('HEAD', '/view', params=params).close()
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                return False
+            raise
+        return True
+
+    def _upload(self, client, name, fileobj, size, content_type, max_attempts):
+        """流式上传到 /upload/image
+
+        请求体是一次性的流，不能交给客户端自动重放；连接失败时回到文件开头重新构造请求体。
+        """
+        fields = {'type': 'input', 'subfolder': self.subfolder, 'overwrite': 'true'}
+        for attempt in range(1, max_attempts + 1):
+            fileobj.seek(0)
+            body = MultipartBody(fields, 'image', name, fileobj, content_type or 'application/octet-stream', size)
+            try:
+                response = client.session.post(
+                    client.url('/upload/image'), data=body, headers={'Content-Type': body.content_type},
+                    timeout=(client.connect_timeout, client.read_timeout)
+                )
+            except requests.exceptions.ConnectionError as e:
+                if attempt == max_attempts:
+                    raise
+                logger.warning('Upload of input image %s failed (%s), retrying', name, e,
+                               extra={'backend': client.base_url})
+                continue
+            with response:
+                response.raise_for_status()
+                result = response.json()
+            if result.get('name') != name:
+                # overwrite=true 时ComfyUI不会改名，改名说明后端不支持覆盖
+                logger.warning('ComfyUI stored input image %s as %s', name, result.get('name'),
+                               extra={'backend': client.base_url})
+            return result
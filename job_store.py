@@ -0,0 +1,157 @@
+"""任务状态的持久化存储（SQLite，WAL模式）
+
+每个任务一行，记录工作流、输入哈希、后端、客户端ID、时间戳、状态、输出和图床上传结果。
+内存中的 JobTracker 在状态变化时写入；服务重启后从这里恢复未结束的任务，已被内存淘汰的
+历史任务也从这里查询，不必再访问ComfyUI的 /history。
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from job_tracker import FINISHED_STATUSES, PENDING, RUNNING, JobState
+
+_COLUMNS = (
+    'prompt_id', 'workflow', 'inputs_hash', 'backend', 'client_id', 'number', 'status',
+    'submitted_at', 'started_at', 'finished_at', 'outputs', 'error', 'uploads',
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    prompt_id TEXT PRIMARY KEY,
+    workflow TEXT,
+    inputs_hash TEXT,
+    backend TEXT,
+    client_id TEXT,
+    number INTEGER,
+    status TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    outputs TEXT,
+    error TEXT,
+    uploads TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, submitted_at);
+CREATE INDEX IF NOT EXISTS jobs_submitted_at ON jobs (submitted_at);
+CREATE INDEX IF NOT EXISTS jobs_workflow ON jobs (workflow, submitted_at);
+"""
+
+_UNFINISHED = (PENDING, RUNNING)
+
+
+def _row_to_job(row):
+    job = JobState(row['prompt_id'])
+    job.workflow = row['workflow']
+    job.inputs_hash = row['inputs_hash']
+    job.backend = row['backend']
+    job.client_id = row['client_id']
+    job.number = row['number']
+    job.status = row['status']
+    job.submitted_at = row['submitted_at']
+    job.started_at = row['started_at']
+    job.finished_at = row['finished_at']
+    job.outputs = json.loads(row['outputs']) if row['outputs'] else {}
+    job.error = row['error']
+    job.uploads = json.loads(row['uploads']) if row['uploads'] else None
+    return job
+
+
+class JobStore:
+    """单个连接加锁串行访问；WAL 模式下写入不阻塞其他进程的读取，synchronous=NORMAL 时每次提交不做 fsync"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(_SCHEMA)
+
+    def save(self, job):
+        """写入任务的当前状态（调用方持有 JobTracker 的锁，保证写入顺序与状态变化一致）"""
+        values = (
+            job.prompt_id, job.workflow, job.inputs_hash, job.backend, job.client_id, job.number, job.status,
+            job.submitted_at, job.started_at, job.finished_at,
+            json.dumps(job.outputs, ensure_ascii=False) if job.outputs else None,
+            job.error,
+            json.dumps(job.uploads, ensure_ascii=False) if job.uploads is not None else None,
+        )
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                values
+            )
+
+    def delete(self, prompt_id):
+        with self._lock:
+            self._conn.execute('DELETE FROM jobs WHERE prompt_id = ?', (prompt_id,))
+
+    def get(self, prompt_id):
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE prompt_id = ?', (prompt_id,)).fetchone()
+        return _row_to_job(row) if row is not None else None
+
+    def unfinished(self):
+        """所有未结束的任务，按提交时间排列"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({', '.join('?' * len(_UNFINISHED))}) ORDER BY submitted_at",
+                _UNFINISHED
+            ).fetchall()
+        return [_row_to_job(row) for row in rows]
+
+    def iter_jobs(self, statuses=FINISHED_STATUSES, workflow=None, since=None, offset=0, limit=None, page_size=200):
+        """按提交时间倒序逐页读取任务，调用方边读边输出时不需要把整个结果集放在内存中
+
+        statuses 为空时不过滤状态；since 为提交时间的下限（Unix 时间戳）。第一页之后按上一页最后一行的
+        (submitted_at, prompt_id) 继续读取，读取期间有新任务写入也不会重复或遗漏。
+        """
+        where, params = [], []
+        if statuses:
+            where.append(f"status IN ({', '.join('?' * len(statuses))})")
+            params.extend(sorted(statuses))
+        if workflow is not None:
+            where.append('workflow = ?')
+            params.append(workflow)
+        if since is not None:
+            where.append('submitted_at >= ?')
+            params.append(since)
+        order = ' ORDER BY submitted_at DESC, prompt_id LIMIT ?'
+        after = None
+        while limit is None or limit > 0:
+            count = page_size if limit is None else min(page_size, limit)
+            clauses, values = list(where), list(params)
+            if after is not None:
+                clauses.append('(submitted_at < ? OR (submitted_at = ? AND prompt_id > ?))')
+                values.extend((after[0], after[0], after[1]))
+            sql = 'SELECT * FROM jobs' + (' WHERE ' + ' AND '.join(clauses) if clauses else '') + order
+            values.append(count)
+            if after is None and offset:
+                sql += ' OFFSET ?'
+                values.append(offset)
+            with self._lock:
+                rows = self._conn.execute(sql, values).fetchall()
+            for row in rows:
+                yield _row_to_job(row)
+            if len(rows) < count:
+                return
+            after = (rows[-1]['submitted_at'], rows[-1]['prompt_id'])
+            if limit is not None:
+                limit -= count
+
+    def prune(self, max_age):
+        """删除提交时间早于 max_age 秒之前、已经结束的任务，返回删除的行数"""
+        statuses = tuple(sorted(FINISHED_STATUSES))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM jobs WHERE submitted_at < ? AND status IN ({', '.join('?' * len(statuses))})",
+                (time.time() - max_age,) + statuses
+            )
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
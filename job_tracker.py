@@ -0,0 +1,330 @@
+"""任务状态表：根据ComfyUI websocket事件在内存中跟踪本服务提交的任务"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from metrics import JOB_EXECUTION_SECONDS, JOB_QUEUE_WAIT_SECONDS, JOBS_FINISHED
+
+# 任务状态
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+FINISHED_STATUSES = {COMPLETED, FAILED}
+JOB_STATUSES = {PENDING, RUNNING, COMPLETED, FAILED}
+
+logger = logging.getLogger(__name__)
+
+
+class JobState:
+    """单个prompt的执行状态"""
+
+    def __init__(self, prompt_id):
+        self.prompt_id = prompt_id
+        self.workflow = None
+        # 最终工作流图的规范化哈希，与去重使用同一个哈希
+        self.inputs_hash = None
+        self.backend = None
+        self.client_id = None
+        self.number = None
+        self.total_nodes = 0
+        self.status = PENDING
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.current_node = None
+        self.node_value = 0
+        self.node_max = 0
+        self.done_nodes = set()
+        self.outputs = {}
+        self.error = None
+        # 图床上传结果，按输出图片下标排列；未配置图床时为 None
+        self.uploads = None
+        # 每次状态变化递增，等待者据此判断是否有新进展
+        self.version = 0
+        # 从持久化存储恢复的任务：websocket事件发往旧进程的客户端ID，只能通过查询ComfyUI得到结果
+        self.rehydrated = False
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def progress(self):
+        """当前节点进度与整体进度（百分比）"""
+        node_percent = round(self.node_value * 100 / self.node_max, 1) if self.node_max else None
+        if self.status == COMPLETED:
+            percent = 100.0
+        elif self.total_nodes:
+            current = self.node_value / self.node_max if self.node_max else 0
+            percent = round(min(len(self.done_nodes) + current, self.total_nodes) * 100 / self.total_nodes, 1)
+        else:
+            percent = None
+        return {
+            'node': self.current_node,
+            'value': self.node_value,
+            'max': self.node_max,
+            'node_percent': node_percent,
+            'percent': percent,
+        }
+
+    def to_dict(self):
+        return {
+            'prompt_id': self.prompt_id,
+            'workflow': self.workflow,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': self.progress(),
+            'outputs': self.outputs,
+            'error': self.error,
+            'uploads': self.uploads,
+        }
+
+
+class JobTracker:
+    """prompt_id -> JobState 的线程安全状态表
+
+    传入 store（JobStore）时，登记、开始执行、结束和上传结果变化时写入存储；内存中被淘汰的任务从存储中读取。
+    """
+
+    def __init__(self, max_jobs=None, store=None):
+        self.max_jobs = max_jobs or Config.JOB_TRACKER_MAX_JOBS
+        self.store = store
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # 每个后端最近开始执行的队列编号，用于估算排队位置
+        self._running_number = {}
+        # 任务结束时调用的回调（在锁外、事件线程中执行）
+        self._finish_listeners = []
+
+    def _get_or_create(self, prompt_id):
+        job = self._jobs.get(prompt_id)
+        if job is None:
+            job = self._jobs[prompt_id] = JobState(prompt_id)
+            self._evict()
+        return job
+
+    def _evict(self):
+        """超出容量时按提交顺序淘汰已结束的任务"""
+        overflow = len(self._jobs) - self.max_jobs
+        if overflow <= 0:
+            return
+        for prompt_id in [p for p, j in self._jobs.items() if j.finished][:overflow]:
+            del self._jobs[prompt_id]
+
+    def _save(self, job):
+        """写入持久化存储（在锁内调用，写入顺序与状态变化一致）；写入失败只记录日志"""
+        if self.store is None:
+            return
+        try:
+            self.store.save(job)
+        except Exception:
+            logger.exception('Failed to persist job state', extra={'prompt_id': job.prompt_id})
+
+    def register(self, prompt_id, workflow=None, backend=None, total_nodes=0, inputs_hash=None, client_id=None):
+        """在提交到ComfyUI之前登记任务，事件先到达时也能正确合并"""
+        with self._lock:
+            job = self._get_or_create(prompt_id)
+            job.workflow = workflow
+            job.backend = backend
+            job.total_nodes = total_nodes
+            if inputs_hash is not None:
+                job.inputs_hash = inputs_hash
+            if client_id is not None:
+                job.client_id = client_id
+            self._save(job)
+            return job
+
+    def set_number(self, prompt_id, number):
+        """记录ComfyUI返回的队列编号"""
+        with self._lock:
+            job = self._jobs.get(prompt_id)
+            if job is not None:
+                job.number = number
+                self._save(job)
+
+    def forget(self, prompt_id):
+        with self._lock:
+            self._jobs.pop(prompt_id, None)
+            if self.store is not None:
+                self.store.delete(prompt_id)
+
+    def get(self, prompt_id):
+        """内存中没有时从持久化存储读取（已被淘汰或重启前结束的任务）"""
+        job = self._jobs.get(prompt_id)
+        if job is None and self.store is not None:
+            stored = self.store.get(prompt_id)
+            if stored is not None:
+                with self._lock:
+                    job = self._jobs.setdefault(prompt_id, stored)
+                    self._evict()
+        return job
+
+    def rehydrate(self):
+        """服务启动时从持久化存储恢复未结束的任务，返回恢复的任务列表"""
+        if self.store is None:
+            return []
+        jobs = self.store.unfinished()
+        with self._lock:
+            for job in jobs:
+                job.rehydrated = True
+                self._jobs.setdefault(job.prompt_id, job)
+        return jobs
+
+    def wait_for_change(self, prompt_id, version, timeout):
+        """阻塞直到任务状态版本号不同于 version、任务结束或超时，返回任务状态"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(prompt_id)
+                if job is None or job.version != version or job.finished:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return job
+                self._changed.wait(remaining)
+
+    def _start(self, job, now):
+        job.status = RUNNING
+        job.started_at = now
+        self._save(job)
+        JOB_QUEUE_WAIT_SECONDS.observe(now - job.submitted_at, workflow=job.workflow or 'unknown')
+
+    def add_finish_listener(self, callback):
+        """注册任务结束回调 callback(job)"""
+        self._finish_listeners.append(callback)
+
+    def _notify_finished(self, job):
+        for callback in self._finish_listeners:
+            try:
+                callback(job)
+            except Exception:
+                logger.exception('Finish listener failed', extra={'prompt_id': job.prompt_id})
+
+    def _finish(self, job, status, now):
+        """标记任务结束，只有首次结束时返回 True"""
+        if job.finished:
+            return False
+        job.status = status
+        job.finished_at = now
+        workflow = job.workflow or 'unknown'
+        JOBS_FINISHED.inc(workflow=workflow, status=status)
+        if job.started_at is not None:
+            JOB_EXECUTION_SECONDS.observe(now - job.started_at, workflow=workflow)
+        self._save(job)
+        return True
+
+    def set_upload(self, job, index, **fields):
+        """更新第 index 张图片的上传状态"""
+        with self._lock:
+            job.uploads[index].update(fields)
+            self._save(job)
+            self._touch(job)
+
+    def _touch(self, job):
+        job.version += 1
+        self._changed.notify_all()
+
+    def unfinished(self, backend):
+        """返回某个后端上尚未结束的任务ID"""
+        with self._lock:
+            return [p for p, j in self._jobs.items() if j.backend == backend and not j.finished]
+
+    def queue_position(self, job):
+        """根据队列编号估算排队位置"""
+        running = self._running_number.get(job.backend)
+        if job.number is None or running is None:
+            return None
+        return max(1, job.number - running)
+
+    def handle_message(self, backend, message):
+        """处理一条ComfyUI websocket消息"""
+        event = message.get('type')
+        data = message.get('data') or {}
+        prompt_id = data.get('prompt_id')
+        if not prompt_id:
+            return
+
+        finished = False
+        with self._lock:
+            job = self._get_or_create(prompt_id)
+            if job.backend is None:
+                job.backend = backend
+            now = time.time()
+
+            if event == 'execution_start':
+                if job.status == PENDING:
+                    self._start(job, now)
+                if job.number is not None:
+                    self._running_number[backend] = job.number
+            elif event == 'execution_cached':
+                job.done_nodes.update(data.get('nodes') or ())
+            elif event == 'executing':
+                node = data.get('node')
+                if job.current_node is not None:
+                    job.done_nodes.add(job.current_node)
+                if node is None:
+                    # node 为空表示整个prompt执行结束
+                    finished = self._finish(job, COMPLETED, now)
+                    job.current_node = None
+                else:
+                    if job.status == PENDING:
+                        self._start(job, now)
+                    job.current_node = node
+                    job.node_value = 0
+                    job.node_max = 0
+            elif event == 'progress':
+                job.current_node = data.get('node', job.current_node)
+                job.node_value = data.get('value', 0)
+                job.node_max = data.get('max', 0)
+            elif event == 'executed':
+                node = data.get('node')
+                if node is not None:
+                    job.done_nodes.add(node)
+                    if data.get('output'):
+                        job.outputs[node] = data['output']
+            elif event == 'execution_success':
+                finished = self._finish(job, COMPLETED, now)
+            elif event in ('execution_error', 'execution_interrupted'):
+                if not job.finished:
+                    job.error = data.get('exception_message') or event
+                finished = self._finish(job, FAILED, now)
+            else:
+                return
+            self._touch(job)
+        if finished:
+            self._notify_finished(job)
+
+    def fail(self, prompt_id, error):
+        """任务没有送达ComfyUI（例如本地排队后提交失败）时直接标记为失败"""
+        with self._lock:
+            job = self._get_or_create(prompt_id)
+            if job.finished:
+                return job
+            job.error = error
+            self._finish(job, FAILED, time.time())
+            self._touch(job)
+        self._notify_finished(job)
+        return job
+
+    def complete_from_history(self, prompt_id, history_entry):
+        """用 /history 的结果补全任务状态（websocket断线期间可能丢失事件）"""
+        status = history_entry.get('status') or {}
+        with self._lock:
+            job = self._get_or_create(prompt_id)
+            if job.finished:
+                return job
+            job.outputs = history_entry.get('outputs') or {}
+            if status.get('status_str') == 'error':
+                job.error = 'execution_error'
+                self._finish(job, FAILED, time.time())
+            else:
+                self._finish(job, COMPLETED, time.time())
+            self._touch(job)
+        self._notify_finished(job)
+        return job
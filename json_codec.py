@@ -0,0 +1,55 @@
+"""JSON 编解码：安装了 orjson 时使用 orjson，否则使用标准库 json
+
+ComfyUI 的响应（/queue、/history、websocket 事件）和本服务的响应都经过这里。orjson 直接输出 UTF-8 字节，
+编码和解码都比标准库快数倍；JSON_CODEC=json 可以强制使用标准库。两种实现的输出都是紧凑格式、
+不转义非 ASCII 字符，字典的非字符串键（如批量提交的错误序号）转换为字符串。
+"""
+import json
+import logging
+
+from config import Config
+
+try:
+    import orjson
+except ImportError:  # orjson 未安装时使用标准库
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+CODECS = ('auto', 'orjson', 'json')
+
+
+def _select(name):
+    if name not in CODECS:
+        raise ValueError(f"JSON_CODEC must be one of {', '.join(CODECS)}, got {name}")
+    if name == 'json' or orjson is None:
+        if name == 'orjson':
+            logger.warning('JSON_CODEC=orjson but orjson is not installed, using the standard json module')
+        return 'json'
+    return 'orjson'
+
+
+# 实际使用的实现：orjson 或 json
+CODEC = _select(Config.JSON_CODEC)
+
+
+def loads(data):
+    """解析 bytes 或 str"""
+    if CODEC == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, default=None, indent=False, sort_keys=False):
+    """编码为 UTF-8 字节；default 处理两种实现都不支持的类型，indent 为 True 时缩进两格"""
+    if CODEC == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(
+        obj, default=default, ensure_ascii=False, sort_keys=sort_keys,
+        indent=2 if indent else None, separators=(',', ': ') if indent else (',', ':')
+    ).encode('utf-8')
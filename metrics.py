@@ -0,0 +1,243 @@
+"""进程内指标，按 Prometheus 文本格式导出（/metrics）
+
+只实现本服务用到的 Counter / Gauge / Histogram，不依赖 prometheus_client。
+多进程部署（如 gunicorn 多 worker）时每个进程各自计数。
+"""
+import bisect
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# 默认耗时分桶（秒）：覆盖本地调用到长时间的GPU任务
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+JOB_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+SIZE_BUCKETS = (1 << 10, 10 << 10, 100 << 10, 1 << 20, 5 << 20, 20 << 20, 100 << 20)
+
+# 上游路径中的任务ID等变化部分，归一化后作为标签，避免标签数量无限增长
+_PATH_IDS = re.compile(r'^/(history|api/history)/[^/]+')
+
+
+def endpoint_label(endpoint):
+    """把 /history/<id>?x=1 之类的路径归一化为 /history/{prompt_id}"""
+    path = '/' + endpoint.split('?', 1)[0].lstrip('/')
+    return _PATH_IDS.sub(lambda m: f"/{m.group(1)}/{{prompt_id}}", path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各分桶的非累计计数（最后一个为 +Inf）、总和、次数
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        # 导出前调用的回调，用于刷新按需计算的 Gauge
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, func):
+        self._collectors.append(func)
+
+    def render(self):
+        for collect in self._collectors:
+            collect()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 本服务的HTTP接口
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    'comfyui_api_http_requests_total', 'HTTP requests handled by this service',
+    ('method', 'route', 'status')))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'comfyui_api_http_request_seconds', 'HTTP request handling time',
+    ('method', 'route')))
+
+# 工作流模板
+TEMPLATE_LOAD_SECONDS = REGISTRY.register(Histogram(
+    'comfyui_api_template_load_seconds', 'Time to load a workflow template and apply request parameters',
+    ('workflow',)))
+
+# 上游ComfyUI调用（每次尝试记录一次）
+UPSTREAM_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'comfyui_upstream_request_seconds', 'ComfyUI request latency per attempt',
+    ('method', 'endpoint', 'status')))
+UPSTREAM_RESPONSE_BYTES = REGISTRY.register(Histogram(
+    'comfyui_upstream_response_bytes', 'ComfyUI response body size',
+    ('endpoint',), buckets=SIZE_BUCKETS))
+UPSTREAM_RETRIES = REGISTRY.register(Counter(
+    'comfyui_upstream_retries_total', 'ComfyUI request attempts that were retried',
+    ('method', 'endpoint', 'reason')))
+UPSTREAM_FAILURES = REGISTRY.register(Counter(
+    'comfyui_upstream_failures_total', 'ComfyUI requests that failed after all attempts',
+    ('method', 'endpoint', 'reason')))
+UPSTREAM_CACHE = REGISTRY.register(Counter(
+    'comfyui_upstream_cache_total', 'Cached ComfyUI lookups by result (hit, miss, coalesced)',
+    ('endpoint', 'result')))
+
+# 任务生命周期
+JOBS_SUBMITTED = REGISTRY.register(Counter(
+    'comfyui_jobs_submitted_total', 'Prompts submitted to ComfyUI',
+    ('workflow', 'backend')))
+JOBS_FINISHED = REGISTRY.register(Counter(
+    'comfyui_jobs_finished_total', 'Prompts that finished executing',
+    ('workflow', 'status')))
+JOB_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'comfyui_job_queue_wait_seconds', 'Time from submission to execution start',
+    ('workflow',), buckets=JOB_BUCKETS))
+JOB_EXECUTION_SECONDS = REGISTRY.register(Histogram(
+    'comfyui_job_execution_seconds', 'Time from execution start to completion (GPU time)',
+    ('workflow',), buckets=JOB_BUCKETS))
+
+# 重复提交去重（hit：返回已完成的结果，attached：合并到进行中的任务）
+DEDUP_LOOKUPS = REGISTRY.register(Counter(
+    'comfyui_dedup_lookups_total', 'Submissions checked against the result dedup store by result',
+    ('result',)))
+
+# 本地准入队列
+ADMISSION_QUEUED = REGISTRY.register(Gauge(
+    'comfyui_admission_queued', 'Prompts waiting in the local admission queue', ('priority',)))
+ADMISSION_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    'comfyui_admission_queue_seconds', 'Time a prompt waited in the local queue before being sent to ComfyUI',
+    ('priority',), buckets=JOB_BUCKETS))
+
+# 图床上传（每张图片记录一次最终结果）
+IMAGE_UPLOADS = REGISTRY.register(Counter(
+    'comfyui_image_uploads_total', 'Output images pushed to the image host', ('status',)))
+IMAGE_UPLOAD_SECONDS = REGISTRY.register(Histogram(
+    'comfyui_image_upload_seconds', 'Time to stream one output image to the image host, including retries'))
+
+# 调用方上传的输入图片（known：本地已记录，exists：后端已有，uploaded：实际上传）
+INPUT_IMAGE_UPLOADS = REGISTRY.register(Counter(
+    'comfyui_input_image_uploads_total', 'Input images checked against or uploaded to ComfyUI by result',
+    ('result',)))
+
+# 提交前裁剪掉的工作流节点
+PRUNED_NODES = REGISTRY.register(Counter(
+    'comfyui_pruned_nodes_total', 'Workflow nodes removed before submission by workflow', ('workflow',)))
+
+# 输出图片转码（hit：已缓存，encoded：新编码，attached：等待进行中的同一编码）
+RENDITIONS = REGISTRY.register(Counter(
+    'comfyui_renditions_total', 'Output image rendition requests by format and result',
+    ('format', 'result')))
+RENDITION_SECONDS = REGISTRY.register(Histogram(
+    'comfyui_rendition_seconds', 'Time to decode, resize and encode one rendition',
+    ('format',)))
+
+# 后端状态（导出时刷新）
+BACKEND_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'comfyui_backend_queue_depth', 'Queued prompts per ComfyUI backend', ('backend',)))
+BACKEND_HEALTHY = REGISTRY.register(Gauge(
+    'comfyui_backend_healthy', 'Whether the ComfyUI backend is accepting work', ('backend',)))
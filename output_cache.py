@@ -0,0 +1,268 @@
+"""生成图片的本地磁盘缓存
+
+图片按内容的 sha256 存放在 blobs/ 下（相同内容只存一份），(prompt_id, type, subfolder, filename)
+以及 (prompt_id, 图片下标) 到哈希的映射追加写入 index.jsonl，重启后重新加载。总大小超过上限时按最近访问时间淘汰，
+被淘汰图片的映射同时删除；index.jsonl 中的行数超过有效映射数的 INDEX_COMPACT_RATIO 倍时重写。
+get() 和 commit() 返回的 CachedOutput 在被回收（或调用 release()）之前持有对文件的引用，期间被淘汰的图片
+只从索引中移除，文件等最后一个引用释放后再删除。单张超过缓存上限的图片不写入缓存，只在本次使用后删除。
+ComfyUI清理 temp 目录后，缓存中的图片仍然可以下载。
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# index.jsonl 的行数超过有效映射数的多少倍时重写（至少 INDEX_COMPACT_MIN_LINES 行才检查）
+INDEX_COMPACT_RATIO = 2
+INDEX_COMPACT_MIN_LINES = 1000
+
+
+def cache_key(prompt_id, image_data):
+    return (
+        prompt_id,
+        image_data.get('type', 'output'),
+        image_data.get('subfolder', ''),
+        image_data['filename'],
+    )
+
+
+def _unlink_quietly(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class CachedOutput:
+    """缓存中的一张图片；对象存在期间 path 指向的文件不会被删除"""
+
+    def __init__(self, digest, size, content_type, path, release=None):
+        self.digest = digest
+        self.size = size
+        self.content_type = content_type
+        self.path = path
+        self._finalizer = weakref.finalize(self, release) if release is not None else None
+
+    def release(self):
+        """提前释放对文件的引用，之后不能再读取 path"""
+        if self._finalizer is not None:
+            self._finalizer()
+
+
+class CacheWriter:
+    """边下载边计算哈希，commit() 时移入缓存；中途失败调用 abort()"""
+
+    def __init__(self, cache, key, content_type, index=None):
+        self.cache = cache
+        self.key = key
+        self.content_type = content_type
+        self.index = index
+        self._hash = hashlib.sha256()
+        self._size = 0
+        fd, self._tmp_path = tempfile.mkstemp(dir=cache.tmp_dir)
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self._hash.update(chunk)
+        self._size += len(chunk)
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        return self.cache._commit(self.key, self.index, self._tmp_path, self._hash.hexdigest(), self._size,
+                                  self.content_type)
+
+    def abort(self):
+        self._file.close()
+        _unlink_quietly(self._tmp_path)
+
+
+class OutputCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(self.directory, 'blobs')
+        self.tmp_dir = os.path.join(self.directory, 'tmp')
+        self.index_path = os.path.join(self.directory, 'index.jsonl')
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        # key -> (digest, content_type)；(prompt_id, 下标) -> key；digest -> size，按最近访问排序
+        self._keys = {}
+        self._by_index = {}
+        self._blobs = OrderedDict()
+        # 反向映射：digest -> 引用它的 key，key -> 下标；淘汰图片时据此删除映射
+        self._digest_keys = {}
+        self._key_index = {}
+        self._total = 0
+        # 正在使用的图片：digest -> 引用数；被淘汰时仍在使用、等引用释放后再删除文件的图片
+        self._pins = {}
+        self._doomed = set()
+        # index.jsonl 当前的行数
+        self._index_lines = 0
+        # 可重入：CachedOutput 可能在持有锁的线程中被垃圾回收，回收时要释放引用
+        self._lock = threading.RLock()
+        self._load()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _load(self):
+        """扫描已有文件并重建索引，顺便压缩 index.jsonl"""
+        blobs = []
+        for root, _, files in os.walk(self.blob_dir):
+            for name in files:
+                stat = os.stat(os.path.join(root, name))
+                blobs.append((stat.st_mtime, name, stat.st_size))
+        for _, digest, size in sorted(blobs):
+            self._blobs[digest] = size
+            self._total += size
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry['digest'] in self._blobs:
+                        self._add_key(tuple(entry['key']), entry.get('index'), entry['digest'], entry['content_type'])
+        self._write_index()
+
+        for name in os.listdir(self.tmp_dir):
+            os.unlink(os.path.join(self.tmp_dir, name))
+        self._evict()
+
+    def _write_index(self):
+        """只保留有效映射重写 index.jsonl"""
+        with open(self.index_path + '.tmp', 'w', encoding='utf-8') as f:
+            for key, (digest, content_type) in self._keys.items():
+                f.write(self._index_line(key, self._key_index.get(key), digest, content_type))
+        os.replace(self.index_path + '.tmp', self.index_path)
+        self._index_lines = len(self._keys)
+
+    def _add_key(self, key, index, digest, content_type):
+        previous = self._keys.get(key)
+        if previous is not None and previous[0] != digest:
+            self._digest_keys.get(previous[0], set()).discard(key)
+        self._keys[key] = (digest, content_type)
+        self._digest_keys.setdefault(digest, set()).add(key)
+        if index is not None:
+            old_index = self._key_index.get(key)
+            if old_index is not None and old_index != index and self._by_index.get((key[0], old_index)) == key:
+                del self._by_index[(key[0], old_index)]
+            self._key_index[key] = index
+            self._by_index[(key[0], index)] = key
+
+    def _drop_key(self, key):
+        entry = self._keys.pop(key, None)
+        if entry is not None:
+            keys = self._digest_keys.get(entry[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._digest_keys[entry[0]]
+        index = self._key_index.pop(key, None)
+        if index is not None and self._by_index.get((key[0], index)) == key:
+            del self._by_index[(key[0], index)]
+
+    @staticmethod
+    def _index_line(key, index, digest, content_type):
+        return json.dumps({'key': key, 'index': index, 'digest': digest, 'content_type': content_type}) + '\n'
+
+    def get_by_index(self, prompt_id, index):
+        """按 /api/image 列表中的下标查找，不需要先查询历史记录"""
+        key = self._by_index.get((prompt_id, index))
+        return self.get(key) if key is not None else None
+
+    def get(self, key):
+        """命中时返回 CachedOutput 并更新访问顺序"""
+        with self._lock:
+            entry = self._keys.get(key)
+            if entry is None:
+                return None
+            digest, content_type = entry
+            size = self._blobs.get(digest)
+            if size is None:
+                self._drop_key(key)
+                return None
+            self._blobs.move_to_end(digest)
+            return self._pinned(digest, size, content_type)
+
+    def _pinned(self, digest, size, content_type):
+        """在锁内增加引用，返回的 CachedOutput 被回收时释放"""
+        self._pins[digest] = self._pins.get(digest, 0) + 1
+        return CachedOutput(digest, size, content_type, self._blob_path(digest), lambda: self._unpin(digest))
+
+    def _unpin(self, digest):
+        with self._lock:
+            count = self._pins.pop(digest) - 1
+            if count:
+                self._pins[digest] = count
+            elif digest in self._doomed:
+                self._doomed.discard(digest)
+                _unlink_quietly(self._blob_path(digest))
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._keys.get(key)
+            return entry is not None and entry[0] in self._blobs
+
+    def writer(self, key, content_type=None, index=None):
+        content_type = content_type or mimetypes.guess_type(key[-1])[0] or 'application/octet-stream'
+        return CacheWriter(self, key, content_type, index)
+
+    def _commit(self, key, index, tmp_path, digest, size, content_type):
+        if size > self.max_bytes:
+            # 放不进缓存：不建立映射，临时文件在本次使用后删除
+            logger.debug('Output %s (%d bytes) exceeds the cache size, not cached', digest, size)
+            return CachedOutput(digest, size, content_type, tmp_path, lambda: _unlink_quietly(tmp_path))
+        path = self._blob_path(digest)
+        with self._lock:
+            # 被淘汰但仍在使用的同一内容重新写入，文件不再需要删除
+            self._doomed.discard(digest)
+            if digest in self._blobs:
+                # 相同内容已经存在，只增加一个引用
+                os.unlink(tmp_path)
+                self._blobs.move_to_end(digest)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                self._blobs[digest] = size
+                self._total += size
+            self._add_key(key, index, digest, content_type)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(self._index_line(key, index, digest, content_type))
+            self._index_lines += 1
+            # 先增加引用再淘汰，返回的文件不会被立即删除
+            cached = self._pinned(digest, size, content_type)
+            self._evict()
+            if self._index_lines >= INDEX_COMPACT_MIN_LINES \
+                    and self._index_lines > INDEX_COMPACT_RATIO * len(self._keys):
+                self._write_index()
+        return cached
+
+    def _evict(self):
+        """超出总大小上限时淘汰最久未访问的图片，连同引用它的映射（在锁内或初始化时调用）"""
+        while self._total > self.max_bytes and self._blobs:
+            digest, size = self._blobs.popitem(last=False)
+            self._total -= size
+            for key in self._digest_keys.pop(digest, ()):
+                self._drop_key(key)
+            if digest in self._pins:
+                self._doomed.add(digest)
+            else:
+                _unlink_quietly(self._blob_path(digest))
+            logger.debug('Evicted cached output %s (%d bytes)', digest, size)
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._keys)
+            return {'entries': entries, 'blobs': len(self._blobs), 'bytes': self._total,
+                    'max_bytes': self.max_bytes}
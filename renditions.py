@@ -0,0 +1,168 @@
+"""输出图片的转码版本（rendition）：WebP/JPEG/PNG 编码、限制最长边的缩略图
+
+ComfyUI 的 SaveImage 输出是全尺寸 PNG，聊天和信息流预览只需要小得多的 WebP/JPEG。转码在独立的线程池中
+进行（Pillow 的解码、缩放和编码会释放 GIL），结果按 (原图哈希, 格式, 质量, 最长边) 存入本地图片缓存，
+每个版本只编码一次；同一版本的并发请求共用一次编码。
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+
+from metrics import RENDITION_SECONDS, RENDITIONS
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 未安装时不提供转码，只能获取原图
+    Image = None
+
+# 格式名 -> (Pillow 编码器, Content-Type, 扩展名)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', '.webp'),
+    'jpeg': ('JPEG', 'image/jpeg', '.jpg'),
+    'png': ('PNG', 'image/png', '.png'),
+}
+# 支持质量参数的格式
+LOSSY_FORMATS = ('webp', 'jpeg')
+# 缩略图最长边的下限（像素）
+MIN_SIZE = 16
+
+
+class RenditionError(ValueError):
+    """转码参数无效"""
+
+
+class Rendition(namedtuple('Rendition', 'format quality max_size')):
+    """一个转码版本：格式、质量（PNG 为 None）、最长边（None 表示保持原尺寸）"""
+
+    @classmethod
+    def parse(cls, args, default_format, default_quality, size_limit):
+        """从查询参数 format / quality / max_size 解析转码版本，都没有时返回 None"""
+        fmt = args.get('format')
+        quality = args.get('quality')
+        max_size = args.get('max_size')
+        if fmt is None and quality is None and max_size is None:
+            return None
+        fmt = (fmt or default_format).lower()
+        if fmt == 'jpg':
+            fmt = 'jpeg'
+        if fmt not in FORMATS:
+            raise RenditionError(f'Invalid format: {fmt}. Expected one of: {", ".join(FORMATS)}')
+        if fmt in LOSSY_FORMATS:
+            quality = _parse_int('quality', default_quality if quality is None else quality, 1, 100)
+        else:
+            quality = None
+        if max_size is not None:
+            max_size = _parse_int('max_size', max_size, MIN_SIZE, size_limit)
+        return cls(fmt, quality, max_size)
+
+    @property
+    def content_type(self):
+        return FORMATS[self.format][1]
+
+    def query(self):
+        """用于构造图片地址的查询参数"""
+        params = {'format': self.format}
+        if self.quality is not None:
+            params['quality'] = self.quality
+        if self.max_size is not None:
+            params['max_size'] = self.max_size
+        return params
+
+    def filename(self, filename):
+        """转码后的文件名：替换扩展名"""
+        return os.path.splitext(filename)[0] + FORMATS[self.format][2]
+
+    def cache_key(self, digest):
+        """本地图片缓存中的键，与原图的 (prompt_id, type, subfolder, filename) 键互不冲突"""
+        return ('rendition', digest, self.format, self.quality, self.max_size)
+
+
+def _parse_int(name, value, low, high):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RenditionError(f'{name} must be an integer')
+    if not low <= value <= high:
+        raise RenditionError(f'{name} must be between {low} and {high}')
+    return value
+
+
+def encode(path, rendition):
+    """读取原图并按转码版本编码，返回编码后的字节"""
+    with Image.open(path) as image:
+        if rendition.max_size is not None:
+            # JPEG 原图可以在解码时直接按比例缩小
+            image.draft('RGB', (rendition.max_size, rendition.max_size))
+            image.thumbnail((rendition.max_size, rendition.max_size), Image.LANCZOS)
+        else:
+            image.load()
+        encoder = FORMATS[rendition.format][0]
+        options = {}
+        if rendition.format == 'jpeg':
+            # JPEG 不支持透明通道
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            options = {'quality': rendition.quality, 'optimize': True, 'progressive': True}
+        elif rendition.format == 'webp':
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            options = {'quality': rendition.quality, 'method': 4}
+        buffer = BytesIO()
+        image.save(buffer, encoder, **options)
+    return buffer.getvalue()
+
+
+class RenditionPool:
+    """转码线程池，结果写入 OutputCache"""
+
+    def __init__(self, cache, workers):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='rendition')
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return Image is not None
+
+    def submit(self, source, rendition):
+        """source 为原图的 CachedOutput，返回结果为转码后 CachedOutput 的 Future；已缓存时直接完成"""
+        key = rendition.cache_key(source.digest)
+        cached = self.cache.get(key)
+        if cached is not None:
+            RENDITIONS.inc(format=rendition.format, result='hit')
+            future = Future()
+            future.set_result(cached)
+            return future
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._render, key, source, rendition)
+                self._inflight[key] = future
+                RENDITIONS.inc(format=rendition.format, result='encoded')
+            else:
+                RENDITIONS.inc(format=rendition.format, result='attached')
+        return future
+
+    def render(self, source, rendition):
+        """阻塞等待转码结果"""
+        return self.submit(source, rendition).result()
+
+    def _render(self, key, source, rendition):
+        try:
+            start = time.perf_counter()
+            data = encode(source.path, rendition)
+            RENDITION_SECONDS.observe(time.perf_counter() - start, format=rendition.format)
+            writer = self.cache.writer(key, rendition.content_type)
+            try:
+                writer.write(data)
+            except BaseException:
+                writer.abort()
+                raise
+            return writer.commit()
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
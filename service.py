@@ -0,0 +1,1079 @@
+"""Flask 与 asyncio 两种服务模式共用的工作流处理逻辑和任务状态"""
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import urlencode
+
+import requests
+
+import json_codec
+from app_logging import LazyJSON
+from backend_pool import BackendPool, workflow_models
+from comfy_client import get_client
+from comfy_events import ensure_event_stream, is_stream_connected
+from config import Config
+from admission import AdmissionQueue
+from image_sink import LskySink, UploadError
+from input_images import InputImageError, InputImageStore, hash_image, image_name
+from job_store import JobStore
+from job_tracker import FINISHED_STATUSES, JOB_STATUSES, JobTracker
+from metrics import (
+    BACKEND_HEALTHY, BACKEND_QUEUE_DEPTH, DEDUP_LOOKUPS, IMAGE_UPLOAD_SECONDS, IMAGE_UPLOADS, JOBS_SUBMITTED,
+    PRUNED_NODES, REGISTRY, TEMPLATE_LOAD_SECONDS
+)
+from output_cache import OutputCache, cache_key
+from renditions import Rendition, RenditionError, RenditionPool
+from upstream_cache import RawJSON, ResponseCache
+from workflow_registry import OverrideError, TemplateError, WorkflowRegistry, find_unreachable, is_link
+
+logger = logging.getLogger(__name__)
+
+# 工作流目录
+WORKFLOWS_DIR = Path(__file__).parent / 'workflows'
+WORKFLOWS_DIR.mkdir(exist_ok=True)
+workflow_registry = WorkflowRegistry(WORKFLOWS_DIR)
+
+# /api/history 的输出格式，以及每次从持久化存储读取并输出的条数
+HISTORY_VIEWS = ('full', 'compact')
+HISTORY_PAGE_SIZE = 200
+
+# 图片代理转发给ComfyUI的请求头，以及回传给客户端的响应头
+PROXY_REQUEST_HEADERS = ('Range', 'If-Range', 'If-None-Match', 'If-Modified-Since')
+PROXY_RESPONSE_HEADERS = (
+    'Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified',
+    'Cache-Control', 'Content-Disposition'
+)
+
+# 本进程提交任务和订阅websocket事件使用同一个客户端ID
+CLIENT_ID = f"my-api-{uuid.uuid4().hex}"
+
+# 任务状态持久化存储：重启后恢复未结束的任务，历史任务不再访问ComfyUI
+job_store = JobStore(Config.JOB_STORE_PATH) if Config.JOB_STORE_ENABLED else None
+if job_store is not None and Config.JOB_STORE_RETENTION > 0:
+    job_store.prune(Config.JOB_STORE_RETENTION)
+job_tracker = JobTracker(store=job_store)
+
+# ComfyUI后端池，第一个后端用于不针对具体任务的接口
+backend_pool = BackendPool(Config.COMFYUI_BASE_URLS or [Config.COMFYUI_BASE_URL])
+
+# ComfyUI响应缓存：/queue、/system_stats 短时间共享，已完成任务的 /history 永久缓存
+status_cache = ResponseCache(max_entries=64)
+history_cache = ResponseCache(max_entries=Config.HISTORY_CACHE_SIZE)
+
+# 重复提交去重：工作流哈希 -> 第一次提交的 prompt_id
+dedup_store = ResponseCache(max_entries=Config.DEDUP_MAX_ENTRIES)
+_dedup_lock = threading.Lock()
+
+# 本地准入队列：按优先级放行任务，限制每个后端和每个调用方的在途任务数
+admission_queue = AdmissionQueue(
+    backend_pool, max_inflight=Config.ADMISSION_MAX_INFLIGHT, watermark=Config.ADMISSION_WATERMARK,
+    max_per_client=Config.ADMISSION_MAX_PER_CLIENT, max_queued=Config.ADMISSION_MAX_QUEUED
+)
+# 先扣除后端的缓存队列深度，准入队列放行时看到的是任务结束后的负载
+job_tracker.add_finish_listener(lambda job: backend_pool.note_finished(job.backend))
+job_tracker.add_finish_listener(lambda job: admission_queue.release(job.prompt_id))
+
+# 生成图片的本地磁盘缓存；任务完成后由后台线程预先下载
+output_cache = OutputCache(Config.OUTPUT_CACHE_DIR, Config.OUTPUT_CACHE_MAX_BYTES) if Config.OUTPUT_CACHE_ENABLED else None
+_prefetch_pool = ThreadPoolExecutor(max_workers=max(1, Config.OUTPUT_CACHE_WORKERS), thread_name_prefix='output-prefetch')
+# 输出图片的转码版本，结果存放在本地图片缓存中
+rendition_pool = RenditionPool(output_cache, Config.RENDITION_WORKERS) if output_cache is not None else None
+
+# 图床上传：任务完成后并发上传所有输出图片
+image_sink = LskySink(
+    Config.LSKY_UPLOAD_URL, Config.LSKY_TOKEN, strategy_id=Config.LSKY_STRATEGY_ID,
+    pool_size=max(1, Config.LSKY_UPLOAD_WORKERS), timeout=Config.LSKY_UPLOAD_TIMEOUT, verify=Config.LSKY_VERIFY_SSL
+) if Config.LSKY_UPLOAD_URL else None
+_upload_pool = ThreadPoolExecutor(max_workers=max(1, Config.LSKY_UPLOAD_WORKERS), thread_name_prefix='image-upload')
+
+
+def parse_rendition(args):
+    """从查询参数解析转码版本，没有转码参数时返回 None；无法转码时抛出 APIError"""
+    try:
+        rendition = Rendition.parse(args, Config.RENDITION_DEFAULT_FORMAT, Config.RENDITION_DEFAULT_QUALITY,
+                                    Config.RENDITION_MAX_SIZE)
+    except RenditionError as e:
+        raise APIError(str(e))
+    if rendition is not None and rendition_pool is None:
+        raise APIError('Image renditions require the local output cache (OUTPUT_CACHE_ENABLED)', 501)
+    if rendition is not None and not rendition_pool.available():
+        raise APIError('Image renditions require Pillow to be installed', 501)
+    return rendition
+
+
+def _upload_rendition():
+    if not Config.LSKY_UPLOAD_FORMAT:
+        return None
+    try:
+        return parse_rendition({
+            'format': Config.LSKY_UPLOAD_FORMAT,
+            'quality': Config.LSKY_UPLOAD_QUALITY,
+            'max_size': Config.LSKY_UPLOAD_MAX_SIZE or None
+        })
+    except APIError as e:
+        logger.warning('LSKY_UPLOAD_FORMAT ignored, uploading original images: %s', e)
+        return None
+
+
+# 上传到图床的转码版本，None 表示上传原图
+upload_rendition = _upload_rendition()
+
+# 调用方上传的输入图片，按内容哈希命名，每个后端只上传一次
+input_images = InputImageStore(Config.INPUT_IMAGE_SUBFOLDER, Config.INPUT_IMAGE_MAX_KNOWN, Config.INPUT_IMAGE_KNOWN_TTL)
+
+
+def _collect_backend_metrics():
+    BACKEND_QUEUE_DEPTH.clear()
+    BACKEND_HEALTHY.clear()
+    for backend in backend_pool.status():
+        # 只有一个后端时不做健康检查，队列深度没有意义
+        if len(backend_pool.backends) > 1:
+            BACKEND_QUEUE_DEPTH.set(backend['queue_depth'], backend=backend['base_url'])
+        BACKEND_HEALTHY.set(1 if backend['healthy'] else 0, backend=backend['base_url'])
+
+
+REGISTRY.add_collector(_collect_backend_metrics)
+
+
+class APIError(Exception):
+    """可以直接返回给客户端的请求错误"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def apply_prompt_text(template, workflow_data, prompt_text, target_node=None):
+    """把提示词写入目标文本节点，未指定目标节点时使用第一个文本节点"""
+    if not isinstance(prompt_text, str):
+        raise APIError('prompt must be a string')
+    if target_node:
+        # 目标节点必须是模板中存在的文本节点
+        if target_node not in template:
+            raise APIError(f'Target node {target_node} does not exist in workflow {template.name}')
+        if target_node not in template.text_nodes:
+            raise APIError(f'Target node {target_node} is not a text input node')
+    elif template.text_nodes:
+        # 没有指定目标节点时使用加载模板时找到的第一个文本节点
+        target_node = template.text_nodes[0]
+    else:
+        raise APIError('No suitable text input node found in workflow')
+    workflow_data[target_node]['inputs']['text'] = prompt_text
+
+
+def apply_input_image(template, workflow_data, image, target_node=None):
+    """把输入图片写入目标 LoadImage 节点，未指定目标节点时使用第一个"""
+    targets = dict(template.image_targets)
+    if target_node:
+        if target_node not in template:
+            raise APIError(f'Target node {target_node} does not exist in workflow {template.name}')
+        if target_node not in targets:
+            raise APIError(f'Target node {target_node} is not an image input node')
+    elif template.image_targets:
+        target_node = template.image_targets[0][0]
+    else:
+        raise APIError(f'No image input node (LoadImage) found in workflow {template.name}')
+    workflow_data[target_node]['inputs'][targets[target_node]] = image
+
+
+def prepare_input_image(fileobj, filename=None, content_type=None):
+    """计算上传图片的内容哈希并按哈希命名，返回 (文件名, sha256, 大小)"""
+    digest, size = hash_image(fileobj, Config.IMAGE_PROXY_CHUNK_SIZE)
+    if not size:
+        raise APIError('Uploaded image is empty')
+    if size > Config.INPUT_IMAGE_MAX_BYTES:
+        raise APIError(f'Image too large: {size} bytes, at most {Config.INPUT_IMAGE_MAX_BYTES} allowed', 413)
+    try:
+        return image_name(digest, filename, content_type), digest, size
+    except InputImageError as e:
+        raise APIError(str(e))
+
+
+def upload_input_image(fileobj, name, size, content_type=None):
+    """把输入图片转存到所有可用的后端，返回 {后端: known/exists/uploaded}
+
+    任务在准入队列放行时才选择后端，任何一个可用的后端都可能执行它；后端已有相同内容的图片时不再上传。
+    """
+    backends = [backend for backend in backend_pool.backends if backend.healthy] or [backend_pool.default]
+    return {
+        backend.base_url: input_images.ensure(backend.base_url, name, fileobj, size, content_type,
+                                              max_attempts=Config.COMFYUI_MAX_RETRIES)
+        for backend in backends
+    }
+
+
+def compile_node_updates(template, updates):
+    """按模板的输入类型表校验节点更新，返回赋值列表"""
+    try:
+        return template.compile_updates(updates)
+    except OverrideError as e:
+        raise APIError(str(e))
+
+
+def compile_params(template, values):
+    """按参数清单校验命名参数，返回赋值列表"""
+    try:
+        return template.compile_params(values)
+    except OverrideError as e:
+        raise APIError(str(e))
+
+
+def apply_node_updates(workflow_data, plan):
+    """执行 compile_node_updates 编译好的赋值"""
+    for node_id, input_name, value in plan:
+        workflow_data[node_id]['inputs'][input_name] = value
+
+
+def load_template(workflow_name):
+    """获取模板，模板格式错误时转换为 APIError"""
+    try:
+        return workflow_registry.get(workflow_name)
+    except TemplateError as e:
+        raise APIError(str(e), 500)
+
+
+# 请求级种子策略：fixed 所有任务使用同一个种子，random 每个任务随机生成，increment 批量中第 i 项使用 seed + i
+SEED_STRATEGIES = ('fixed', 'random', 'increment')
+# 服务端生成的种子以及派生种子的取值范围（DF_Random 等节点的种子为32位）
+SEED_RANGE = 2 ** 32
+
+
+def derived_seed(seed, offset):
+    """第 offset 个随机取值节点的种子：由主种子和节点序号哈希得到
+
+    不使用 seed+offset，否则 increment 批量中第 i 项的派生种子会与第 i+1 项的种子、派生种子重复。
+    """
+    digest = hashlib.blake2b(f'{seed}:{offset}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % SEED_RANGE
+
+
+def apply_seed(template, workflow_data, seed):
+    """把随机种子写入模板中所有带种子的节点
+
+    采样/噪声节点都使用这个种子；DF_Random 等随机取值节点按顺序使用由种子派生的不同种子，
+    避免取值范围相同的节点得到相同的结果。
+    """
+    if not isinstance(seed, int) or isinstance(seed, bool):
+        raise APIError('seed must be an integer')
+    for node_id, input_name in template.seed_targets:
+        workflow_data[node_id]['inputs'][input_name] = seed
+    # 没有采样节点时第一个随机取值节点使用种子本身，响应中的 seed（见 workflow_seed）可以直接用来复现
+    start = 1 if template.seed_targets else 0
+    for offset, (node_id, input_name) in enumerate(template.random_seed_targets, start):
+        workflow_data[node_id]['inputs'][input_name] = derived_seed(seed, offset) if offset else seed
+
+
+def seed_options(request_data):
+    """从请求中取出 seed / seed_strategy，返回 (策略, 种子)；两者都没有时返回 None
+
+    只给 seed 时按 fixed 处理；increment 没有给 seed 时随机选一个起始值。
+    """
+    seed = request_data.get('seed')
+    strategy = request_data.get('seed_strategy')
+    if seed is None and strategy is None:
+        return None
+    strategy = strategy or 'fixed'
+    if strategy not in SEED_STRATEGIES:
+        raise APIError(f'Invalid seed_strategy: {strategy}. Expected one of: {", ".join(SEED_STRATEGIES)}')
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+        raise APIError('seed must be a non-negative integer')
+    if strategy == 'fixed' and seed is None:
+        raise APIError('seed_strategy "fixed" requires a seed')
+    if strategy == 'increment' and seed is None:
+        seed = random.randrange(SEED_RANGE)
+    return strategy, seed
+
+
+def is_random_seeded(request_data):
+    """请求是否要求每次使用随机种子（这类请求不做去重）"""
+    return isinstance(request_data, dict) and request_data.get('seed_strategy') == 'random'
+
+
+def item_seed(options, index=0):
+    """按种子策略计算第 index 个任务的种子"""
+    strategy, seed = options
+    if strategy == 'random':
+        return random.randrange(SEED_RANGE)
+    if strategy == 'increment':
+        return seed + index
+    return seed
+
+
+def workflow_seed(workflow_name, workflow_data):
+    """工作流实际使用的种子（第一个带种子的节点），模板中没有可写入的种子时返回 None"""
+    template = workflow_registry.get(workflow_name)
+    targets = template.seed_targets or template.random_seed_targets
+    if not targets:
+        return None
+    node_id, input_name = targets[0]
+    return workflow_data[node_id]['inputs'][input_name]
+
+
+def build_workflow(workflow_name, request_data, default_seed=None, index=0):
+    """加载工作流模板并应用请求中的参数，返回最终的工作流数据
+
+    请求中的 seed / seed_strategy 在其他参数之后写入，覆盖参数或节点更新中的种子；请求中没有时使用
+    default_seed（批量请求的整体种子策略），index 为该任务在批量中的序号。
+    """
+    start = time.perf_counter()
+    # 加载基础工作流（模板只解析一次，这里拿到的是可修改的副本）
+    template = load_template(workflow_name)
+    workflow_data = template.instantiate()
+    
+    seed = default_seed
+    if isinstance(request_data, dict) and ('seed' in request_data or 'seed_strategy' in request_data):
+        seed = seed_options(request_data)
+        request_data = {key: value for key, value in request_data.items() if key not in ('seed', 'seed_strategy')}
+    
+    # 处理请求数据
+    if isinstance(request_data, dict) and 'params' in request_data:
+        # 命名参数：{"params": {"prompt": "...", "seed": 1}}，按模板的参数清单写入节点
+        apply_node_updates(workflow_data, compile_params(template, request_data['params']))
+    elif isinstance(request_data, dict) and 'prompt' in request_data:
+        # 新格式：{"prompt": "text", "target_node": "node_id"}
+        apply_prompt_text(template, workflow_data, request_data['prompt'], request_data.get('target_node'))
+    elif isinstance(request_data, dict):
+        # 保持对原有格式的支持：直接的节点更新，先整体校验再写入
+        apply_node_updates(workflow_data, compile_node_updates(template, request_data))
+    else:
+        raise APIError('Invalid request format. Expected either {"prompt": "text", "target_node": "node_id"} or node updates object')
+    if seed is not None:
+        apply_seed(template, workflow_data, item_seed(seed, index))
+    
+    TEMPLATE_LOAD_SECONDS.observe(time.perf_counter() - start, workflow=workflow_name)
+    return workflow_data
+
+
+def build_batch_workflows(workflow_name, batch_data):
+    """根据批量请求生成所有工作流变体
+
+    支持两种格式：
+    - {"items": [<单个请求体>, ...]}
+    - {"base": {<节点更新>}, "params": {<命名参数>}, "prompts": [...], "seeds": [...], "target_node": "id"}
+
+    两种格式都可以带整体的 seed / seed_strategy，按各项的序号计算种子；items 中单项自带的种子优先，
+    "seeds" 列表给出的种子优先于种子策略。
+    """
+    if not isinstance(batch_data, dict):
+        raise APIError('Invalid batch format. Expected {"items": [...]} or {"base": {...}, "prompts": [...], "seeds": [...]}')
+    batch_seed = seed_options(batch_data)
+
+    if 'items' in batch_data:
+        items = batch_data['items']
+        if not isinstance(items, list) or not items:
+            raise APIError('items must be a non-empty list')
+        _check_batch_size(len(items))
+        workflows = []
+        for index, item in enumerate(items):
+            try:
+                workflows.append(build_workflow(workflow_name, item, batch_seed, index))
+            except APIError as e:
+                raise APIError(f'items[{index}]: {e}', e.status_code)
+        return workflows
+
+    prompts = batch_data.get('prompts')
+    seeds = batch_data.get('seeds')
+    base = batch_data.get('base') or {}
+    if not prompts and not seeds:
+        raise APIError('Batch request needs "items", "prompts" or "seeds"')
+    if prompts and seeds and len(prompts) != len(seeds):
+        raise APIError('prompts and seeds must have the same length')
+    if not isinstance(base, dict):
+        raise APIError('base must be a node updates object')
+    count = len(prompts or seeds)
+    _check_batch_size(count)
+
+    template = load_template(workflow_name)
+    base_plan = compile_node_updates(template, base)
+    if 'params' in batch_data:
+        base_plan += compile_params(template, batch_data['params'])
+    workflows = []
+    for index in range(count):
+        workflow_data = template.instantiate()
+        apply_node_updates(workflow_data, base_plan)
+        try:
+            if prompts:
+                apply_prompt_text(template, workflow_data, prompts[index], batch_data.get('target_node'))
+            if seeds:
+                apply_seed(template, workflow_data, seeds[index])
+            elif batch_seed is not None:
+                apply_seed(template, workflow_data, item_seed(batch_seed, index))
+        except APIError as e:
+            raise APIError(f'item {index}: {e}', e.status_code)
+        workflows.append(workflow_data)
+    return workflows
+
+
+def _check_batch_size(count):
+    if count > Config.BATCH_MAX_ITEMS:
+        raise APIError(f'Batch too large: {count} items, at most {Config.BATCH_MAX_ITEMS} allowed')
+
+
+class BatchRegistry:
+    """批量任务ID到各个prompt_id的映射（内存中，按创建顺序淘汰）"""
+
+    def __init__(self, max_batches=None):
+        self.max_batches = max_batches or Config.BATCH_MAX_STORED
+        self._batches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, workflow_name, prompt_ids, errors):
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            self._batches[batch_id] = {
+                'batch_id': batch_id,
+                'workflow': workflow_name,
+                'created_at': time.time(),
+                'prompt_ids': prompt_ids,
+                'errors': errors
+            }
+            while len(self._batches) > self.max_batches:
+                self._batches.popitem(last=False)
+        return batch_id
+
+    def get(self, batch_id):
+        return self._batches.get(batch_id)
+
+
+batch_registry = BatchRegistry()
+
+
+def prompt_models(workflow_name, workflow_data):
+    """工作流用到的 checkpoint / UNET 模型，用于选择已加载模型的后端"""
+    return workflow_models(workflow_registry.get(workflow_name), workflow_data)
+
+
+def workflow_hash(workflow_data):
+    """最终工作流图的规范化哈希，_meta（节点标题）不影响执行结果，不参与计算"""
+    graph = {
+        node_id: {key: value for key, value in node.items() if key != '_meta'}
+        for node_id, node in workflow_data.items()
+    }
+    canonical = json.dumps(graph, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def dedup_key(workflow_name, workflow_data):
+    """去重使用的工作流哈希；含有未固定种子的不确定性节点时返回 None，不做去重"""
+    template = workflow_registry.get(workflow_name)
+    for node_id, input_name in template.random_nodes:
+        seed = workflow_data[node_id].get('inputs', {}).get(input_name)
+        if not isinstance(seed, int) or isinstance(seed, bool) or seed < 0:
+            return None
+    return workflow_hash(workflow_data)
+
+
+def claim_duplicate(key, prompt_id, workflow_name=None, total_nodes=0):
+    """查找相同工作流的任务：已完成或仍在进行时返回该任务，否则把 prompt_id 登记为该哈希的任务并返回 None
+
+    查找与登记在同一把锁内完成，并且同时在任务状态表中登记 prompt_id，提交到ComfyUI之前到达的重复请求
+    也会复用它，同时到达的重复请求只有一个会真正提交。提交失败时调用方用 job_tracker.fail() 标记，
+    失败的任务不复用。
+    """
+    with _dedup_lock:
+        hit, existing = dedup_store.lookup(key)
+        if hit:
+            job = job_tracker.get(existing)
+            if job is not None and job.status != 'failed':
+                DEDUP_LOOKUPS.inc(result='hit' if job.finished else 'attached')
+                return job
+        job_tracker.register(prompt_id, workflow_name, None, total_nodes)
+        dedup_store.store(key, prompt_id, ttl=Config.DEDUP_TTL)
+    DEDUP_LOOKUPS.inc(result='miss')
+    return None
+
+
+def choose_backend(workflow_name, workflow_data, exclude=()):
+    """为工作流选择后端，返回 (base_url, 工作流用到的模型)"""
+    models = prompt_models(workflow_name, workflow_data)
+    return backend_pool.choose(models, exclude).base_url, models
+
+
+def backend_for(prompt_id):
+    """返回任务提交到的后端，未知任务使用默认后端"""
+    job = job_tracker.get(prompt_id)
+    if job is not None and job.backend:
+        return job.backend
+    return backend_pool.default.base_url
+
+
+def prune_workflow(workflow_name, workflow_data):
+    """去掉输出节点用不到的节点和调试节点，返回 (提交的工作流, 去掉的节点ID)
+
+    一般情况下直接使用模板上缓存的裁剪结果；请求把连线改到了被裁剪的节点上时，按实际连线重新计算。
+    原工作流不被修改，去重和种子仍按完整的工作流计算。
+    """
+    if not Config.WORKFLOW_PRUNE_ENABLED:
+        return workflow_data, ()
+    try:
+        template = workflow_registry.get(workflow_name)
+    except (FileNotFoundError, TemplateError):
+        return workflow_data, ()
+    removed = template.unreachable_nodes(Config.WORKFLOW_PRUNE_OUTPUT_NODES, Config.WORKFLOW_PRUNE_DEBUG_NODES)
+    if not removed:
+        return workflow_data, ()
+    removed_set = set(removed)
+    relinked = any(
+        is_link(value) and value[0] in removed_set
+        for node_id, node in workflow_data.items() if node_id not in removed_set
+        for value in node.get('inputs', {}).values()
+    )
+    if relinked:
+        removed = find_unreachable(workflow_data, Config.WORKFLOW_PRUNE_OUTPUT_NODES, Config.WORKFLOW_PRUNE_DEBUG_NODES)
+        removed_set = set(removed)
+    return {node_id: node for node_id, node in workflow_data.items() if node_id not in removed_set}, removed
+
+
+def workflow_schema(workflow_name):
+    """工作流的节点与可覆盖输入；开启裁剪时附带按模板连线会被裁剪的节点"""
+    template = load_template(workflow_name)
+    pruned = ()
+    if Config.WORKFLOW_PRUNE_ENABLED:
+        pruned = template.unreachable_nodes(Config.WORKFLOW_PRUNE_OUTPUT_NODES, Config.WORKFLOW_PRUNE_DEBUG_NODES)
+    return {'workflow': workflow_name, 'nodes': template.schema(), 'pruned_nodes': list(pruned)}
+
+
+def new_prompt_payload(workflow_name, workflow_data, backend, prompt_id=None):
+    """生成提交给 /prompt 的请求体，并预先登记到任务状态表
+
+    使用进程级客户端ID，prompt_id 在本地生成，这样websocket事件先于HTTP响应到达时也不会丢失。
+    在本地排过队的任务沿用排队时分配的 prompt_id。开启裁剪时提交裁剪后的工作流，进度按实际执行的节点数计算。
+    """
+    prompt_id = prompt_id or str(uuid.uuid4())
+    prompt, removed = prune_workflow(workflow_name, workflow_data)
+    if removed:
+        PRUNED_NODES.inc(len(removed), workflow=workflow_name)
+        logger.debug('Pruned %d of %d nodes: %s', len(removed), len(workflow_data), ', '.join(removed),
+                     extra={'prompt_id': prompt_id, 'workflow': workflow_name})
+    ensure_event_stream(backend, CLIENT_ID, job_tracker)
+    job_tracker.register(prompt_id, workflow_name, backend, len(prompt),
+                         inputs_hash=workflow_hash(workflow_data), client_id=CLIENT_ID)
+    return {
+        "prompt": prompt,
+        "client_id": CLIENT_ID,
+        "prompt_id": prompt_id
+    }
+
+
+def record_prompt_response(payload, prompt_data, workflow_name, backend, models=()):
+    """根据ComfyUI /prompt 的响应更新任务状态表和后端负载"""
+    backend_pool.note_submitted(backend, models)
+    prompt_id = payload['prompt_id']
+    if prompt_data.get('prompt_id') != prompt_id:
+        # 旧版ComfyUI不接受客户端指定的prompt_id，改用返回的ID
+        job = job_tracker.get(prompt_id)
+        job_tracker.forget(prompt_id)
+        job_tracker.register(prompt_data.get('prompt_id'), workflow_name, backend, len(payload['prompt']),
+                             inputs_hash=job.inputs_hash if job else None, client_id=CLIENT_ID)
+    job_tracker.set_number(prompt_data.get('prompt_id'), prompt_data.get('number'))
+    JOBS_SUBMITTED.inc(workflow=workflow_name, backend=backend)
+    logger.info('Prompt submitted, queue number %s', prompt_data.get('number'), extra={
+        'prompt_id': prompt_data.get('prompt_id'), 'workflow': workflow_name, 'backend': backend})
+    if prompt_data.get('node_errors'):
+        logger.warning('ComfyUI reported node errors: %s', LazyJSON(prompt_data['node_errors']),
+                       extra={'prompt_id': prompt_data.get('prompt_id'), 'workflow': workflow_name})
+
+
+def fetch_upstream_raw(endpoint, backend=None):
+    """GET /queue、/system_stats 等接口，返回 RawJSON；TTL内及并发的相同请求共享一次上游调用"""
+    client = get_client(backend or backend_pool.default.base_url)
+
+    def load():
+        return RawJSON(client.request('GET', endpoint).content)
+
+    if Config.UPSTREAM_CACHE_TTL <= 0:
+        return load()
+    return status_cache.fetch((endpoint, client.base_url), load, ttl=Config.UPSTREAM_CACHE_TTL)
+
+
+def fetch_upstream_json(endpoint, backend=None):
+    """fetch_upstream_raw 解析后的JSON"""
+    return fetch_upstream_raw(endpoint, backend).data
+
+
+def fetch_history(prompt_id, backend=None):
+    """GET /history/<prompt_id>，返回 {prompt_id: entry}，任务未结束时为空字典
+
+    任务只有执行结束后才会写入ComfyUI历史记录，之后不再变化，因此找到后永久缓存。
+    """
+    client = get_client(backend or backend_pool.default.base_url)
+    return history_cache.fetch(
+        ('/history/{prompt_id}', client.base_url, prompt_id),
+        lambda: json_codec.loads(client.request('GET', f'/history/{prompt_id}').content),
+        cacheable=lambda data: prompt_id in data
+    )
+
+
+def history_entry(job):
+    """把已结束的任务转换为ComfyUI /history 条目的格式（不含工作流图）"""
+    entry = {
+        'outputs': job.outputs,
+        'status': {
+            'status_str': 'success' if job.status == 'completed' else 'error',
+            'completed': job.status == 'completed',
+            'messages': [],
+        },
+    }
+    if job.status == 'failed':
+        entry['status']['messages'].append(['execution_error', {'prompt_id': job.prompt_id,
+                                                                 'exception_message': job.error}])
+    return entry
+
+
+def stored_history(prompt_id):
+    """本服务跟踪到已结束的任务返回 {prompt_id: entry}，不访问ComfyUI；否则返回 None"""
+    job = job_tracker.get(prompt_id)
+    if job is None or not job.finished:
+        return None
+    return {prompt_id: history_entry(job)}
+
+
+def compact_history_entry(job):
+    """精简的历史条目：状态、耗时和图片引用，不含节点输出的其他内容"""
+    return {
+        'workflow': job.workflow,
+        'status': job.status,
+        'submitted_at': job.submitted_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'execution_time': round(job.finished_at - job.started_at, 3) if job.started_at and job.finished_at else None,
+        'images': [
+            {'filename': image['filename'], 'subfolder': image.get('subfolder', ''), 'type': image.get('type', 'output')}
+            for image in iter_output_images(job.outputs)
+        ],
+        'error': job.error,
+    }
+
+
+def history_query(args):
+    """解析 /api/history 的查询参数，参数无效时抛出 APIError
+
+    limit（兼容ComfyUI的 max_items）、offset、since（提交时间下限，Unix 时间戳）、workflow、
+    status（逗号分隔，默认 completed,failed）、view（full 或 compact）。
+    """
+    def number(name, convert):
+        value = args.get(name)
+        if value is None or value == '':
+            return None
+        try:
+            value = convert(value)
+        except ValueError:
+            raise APIError(f'{name} must be a number')
+        if value < 0:
+            raise APIError(f'{name} must not be negative')
+        return value
+
+    limit = number('limit', int)
+    if limit is None:
+        limit = number('max_items', int)
+    statuses = {status for status in (args.get('status') or '').split(',') if status} or FINISHED_STATUSES
+    unknown = statuses - JOB_STATUSES
+    if unknown:
+        raise APIError(f"Unknown status {', '.join(sorted(unknown))}, expected one of {', '.join(sorted(JOB_STATUSES))}")
+    view = args.get('view') or 'full'
+    if view not in HISTORY_VIEWS:
+        raise APIError(f"view must be one of {', '.join(HISTORY_VIEWS)}")
+    query = {
+        'limit': limit,
+        'offset': number('offset', int) or 0,
+        'since': number('since', float),
+        'workflow': args.get('workflow') or None,
+        'statuses': statuses,
+        'view': view,
+    }
+    if job_store is None and (query['offset'] or query['since'] is not None or query['workflow']
+                              or statuses != FINISHED_STATUSES or view != 'full'):
+        # 没有持久化存储时原样转发ComfyUI的历史记录，只支持 limit
+        raise APIError('Filtering history requires JOB_STORE_ENABLED, only limit is supported without it')
+    return query
+
+
+def iter_history_json(limit=None, offset=0, since=None, workflow=None, statuses=FINISHED_STATUSES, view='full'):
+    """从持久化存储逐页读取任务，边编码边输出 {prompt_id: entry, ...}（按提交时间倒序）
+
+    每次产出一页（HISTORY_PAGE_SIZE 条）编码后的字节，整个响应不会同时出现在内存中。
+    """
+    entry = compact_history_entry if view == 'compact' else history_entry
+    yield b'{'
+    separator = b''
+    page = []
+    for job in job_store.iter_jobs(statuses, workflow, since, offset, limit, page_size=HISTORY_PAGE_SIZE):
+        page.append(json_codec.dumps(job.prompt_id) + b':' + json_codec.dumps(entry(job)))
+        if len(page) >= HISTORY_PAGE_SIZE:
+            yield separator + b','.join(page)
+            separator = b','
+            page = []
+    if page:
+        yield separator + b','.join(page)
+    yield b'}'
+
+
+def cached_history(prompt_id, backend=None):
+    """只查缓存：已完成任务返回 {prompt_id: entry}，否则返回 None"""
+    client = get_client(backend or backend_pool.default.base_url)
+    _, history = history_cache.lookup(('/history/{prompt_id}', client.base_url, prompt_id))
+    return history
+
+
+def view_params(image_data):
+    """ComfyUI /view 的查询参数"""
+    return {
+        'filename': image_data['filename'],
+        'subfolder': image_data.get('subfolder', ''),
+        'type': image_data.get('type', 'output')
+    }
+
+
+def view_url(image_data, base_url=None):
+    """构建ComfyUI /view 图片地址"""
+    query = urlencode(view_params(image_data))
+    return get_client(base_url or backend_pool.default.base_url).url(f"/view?{query}")
+
+
+def iter_output_images(outputs):
+    """按节点顺序遍历所有输出图片"""
+    for node_output in outputs.values():
+        yield from node_output.get('images', [])
+
+
+def extract_images(outputs, base_url=None):
+    """从输出节点中提取图片信息，保留图片自身的类型（output/temp）"""
+    return [
+        {
+            'url': view_url(image_data, base_url),
+            'filename': image_data['filename'],
+            'subfolder': image_data.get('subfolder', ''),
+            'type': image_data.get('type', 'output')
+        }
+        for image_data in iter_output_images(outputs)
+    ]
+
+
+def output_image(outputs, index):
+    """按 extract_images 的顺序取第 index 张输出图片"""
+    images = list(iter_output_images(outputs))
+    if not 0 <= index < len(images):
+        raise APIError(f'Image {index} not found, the task has {len(images)} images', 404)
+    return images[index]
+
+
+def tracked_outputs(prompt_id):
+    """本服务跟踪到已完成的任务返回 (backend, outputs)，否则返回 None"""
+    job = job_tracker.get(prompt_id)
+    if job is None or job.status != 'completed' or not job.outputs:
+        return None
+    return job.backend, job.outputs
+
+
+def cache_output(prompt_id, backend, image_data, index=None):
+    """从ComfyUI下载一张输出图片写入本地缓存，已缓存时直接返回"""
+    key = cache_key(prompt_id, image_data)
+    cached = output_cache.get(key)
+    if cached is not None:
+        return cached
+    response = get_client(backend).request('GET', '/view', params=view_params(image_data), stream=True)
+    writer = output_cache.writer(key, response.headers.get('Content-Type'), index)
+    try:
+        for chunk in response.raw.stream(Config.IMAGE_PROXY_CHUNK_SIZE, decode_content=True):
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        response.close()
+    return writer.commit()
+
+
+def _prefetch_outputs(job):
+    for index, image_data in enumerate(iter_output_images(job.outputs)):
+        try:
+            cache_output(job.prompt_id, job.backend, image_data, index)
+        except Exception as e:
+            logger.warning('Failed to cache output %s: %s', image_data.get('filename'), e,
+                           extra={'prompt_id': job.prompt_id, 'backend': job.backend})
+
+
+def prefetch_outputs(job):
+    """任务完成后在后台把输出图片下载到本地缓存，赶在ComfyUI清理 temp 目录之前"""
+    if output_cache is None or job.status != 'completed' or not job.outputs:
+        return
+    _prefetch_pool.submit(_prefetch_outputs, job)
+
+
+def output_rendition(prompt_id, backend, image_data, rendition, index=None):
+    """提交一张输出图片的转码，返回结果为 CachedOutput 的 Future
+
+    原图不在本地缓存中时先在当前线程下载，编码在转码线程池中进行。
+    """
+    source = output_cache.get_by_index(prompt_id, index) if index is not None else None
+    if source is None:
+        source = cache_output(prompt_id, backend, image_data, index)
+    return rendition_pool.submit(source, rendition)
+
+
+@contextmanager
+def open_output(prompt_id, backend, image_data, index=None, rendition=None):
+    """打开一张输出图片用于读取，返回 (文件对象, 大小, Content-Type)
+
+    启用本地缓存时先写入缓存再读取文件，否则直接读取ComfyUI响应的底层连接。指定 rendition 时读取转码版本
+    （需要本地缓存）。
+    """
+    if rendition is not None:
+        cached = output_rendition(prompt_id, backend, image_data, rendition, index).result()
+        with open(cached.path, 'rb') as f:
+            yield f, cached.size, cached.content_type
+        return
+    if output_cache is not None:
+        cached = cache_output(prompt_id, backend, image_data, index)
+        with open(cached.path, 'rb') as f:
+            yield f, cached.size, cached.content_type
+        return
+    response = get_client(backend).request('GET', '/view', params=view_params(image_data),
+                                           headers={'Accept-Encoding': 'identity'}, stream=True)
+    try:
+        size = response.headers.get('Content-Length')
+        if size is None:
+            # 没有 Content-Length 时无法流式构造请求体，只能先读完
+            yield BytesIO(response.content), len(response.content), response.headers.get('Content-Type')
+        else:
+            yield response.raw, int(size), response.headers.get('Content-Type')
+    finally:
+        response.close()
+
+
+def _upload_output(job, index, image_data):
+    attempts = max(1, Config.LSKY_UPLOAD_RETRIES)
+    extra = {'prompt_id': job.prompt_id, 'workflow': job.workflow}
+    filename = upload_rendition.filename(image_data['filename']) if upload_rendition else image_data['filename']
+    start = time.perf_counter()
+    for attempt in range(1, attempts + 1):
+        try:
+            output = open_output(job.prompt_id, job.backend, image_data, index, upload_rendition)
+            with output as (fileobj, size, content_type):
+                url = image_sink.upload(filename, fileobj, content_type, size)
+        except (requests.exceptions.RequestException, UploadError, OSError) as e:
+            retryable = not isinstance(e, UploadError) or e.retryable
+            if retryable and attempt < attempts:
+                delay = random.uniform(0, Config.COMFYUI_RETRY_BACKOFF * (2 ** (attempt - 1)))
+                logger.warning('Upload of %s failed (%s), retrying in %.2f seconds', image_data['filename'], e, delay,
+                               extra=extra)
+                time.sleep(delay)
+                continue
+            logger.error('Upload of %s failed: %s', image_data['filename'], e, extra=extra)
+            IMAGE_UPLOADS.inc(status='failed')
+            job_tracker.set_upload(job, index, status='failed', error=str(e))
+            return
+        except Exception as e:
+            # 其他异常（例如生成缩略图时的解码错误）不重试，也不能让该图片一直停留在 pending
+            logger.exception('Upload of %s failed', image_data['filename'], extra=extra)
+            IMAGE_UPLOADS.inc(status='failed')
+            job_tracker.set_upload(job, index, status='failed', error=f'{type(e).__name__}: {e}')
+            return
+        IMAGE_UPLOAD_SECONDS.observe(time.perf_counter() - start)
+        IMAGE_UPLOADS.inc(status='uploaded')
+        logger.info('Uploaded %s to %s', image_data['filename'], url, extra=extra)
+        job_tracker.set_upload(job, index, status='uploaded', url=url)
+        return
+
+
+def upload_outputs(job):
+    """任务完成后把所有输出图片并发上传到图床，结果记录在 job.uploads 中"""
+    if image_sink is None or job.status != 'completed' or not job.outputs:
+        return
+    images = list(iter_output_images(job.outputs))
+    job.uploads = [
+        {'filename': image_data['filename'], 'status': 'pending', 'url': None, 'error': None}
+        for image_data in images
+    ]
+    for index, image_data in enumerate(images):
+        _upload_pool.submit(_upload_output, job, index, image_data)
+
+
+def attach_uploads(prompt_id, images):
+    """把图床地址合并到 extract_images 的结果中（只有本服务跟踪的任务才有）"""
+    job = job_tracker.get(prompt_id)
+    if job is None or not job.uploads or len(job.uploads) != len(images):
+        return images
+    for image, upload in zip(images, job.uploads):
+        image['upload_status'] = upload['status']
+        image['upload_url'] = upload['url']
+    return images
+
+
+# 配置了图床时上传任务顺带写入本地缓存，不再单独预取
+job_tracker.add_finish_listener(upload_outputs if image_sink is not None else prefetch_outputs)
+
+
+def proxy_request_headers(headers):
+    """从客户端请求中挑出需要转发的条件/范围请求头；图片不再压缩，要求上游返回原始字节"""
+    forwarded = {name: headers[name] for name in PROXY_REQUEST_HEADERS if name in headers}
+    forwarded['Accept-Encoding'] = 'identity'
+    return forwarded
+
+
+def proxy_response_headers(headers):
+    return {name: headers[name] for name in PROXY_RESPONSE_HEADERS if name in headers}
+
+
+def job_result(job):
+    """构建任务结束（或等待超时）时返回给客户端的数据"""
+    result = {
+        'prompt_id': job.prompt_id,
+        'status': job.status,
+        'client_id': CLIENT_ID
+    }
+    if job.status == 'completed':
+        result['outputs'] = job.outputs
+        result['images'] = extract_images(job.outputs, job.backend)
+        result['execution_time'] = round(job.finished_at - job.started_at, 3) if job.started_at else None
+        if job.uploads is not None:
+            result['uploads'] = job.uploads
+    elif job.status == 'failed':
+        result['message'] = job.error or 'Task failed'
+    else:
+        result['message'] = 'Timed out waiting for the task, poll /api/task_status for the result'
+        result['progress'] = job.progress()
+        result['local_queue_position'] = admission_queue.position(job.prompt_id)
+    return result
+
+
+def batch_status(batch):
+    """汇总批量任务中每个prompt的状态"""
+    counts = {'pending': 0, 'running': 0, 'completed': 0, 'failed': 0, 'unknown': 0}
+    items = []
+    for index, prompt_id in enumerate(batch['prompt_ids']):
+        job = job_tracker.get(prompt_id) if prompt_id else None
+        if index in batch['errors'] and job is None:
+            item = {'prompt_id': prompt_id, 'status': 'failed', 'message': batch['errors'][index]}
+        elif job is None:
+            item = {'prompt_id': prompt_id, 'status': 'unknown'}
+        else:
+            status = job.status
+            item = {'prompt_id': prompt_id, 'status': status}
+            if status == 'completed':
+                item['images'] = extract_images(job.outputs, job.backend)
+            elif status == 'failed':
+                item['message'] = job.error or 'Task failed'
+            elif status == 'running':
+                item['progress'] = job.progress()
+            else:
+                item['local_queue_position'] = admission_queue.position(prompt_id)
+                item['queue_position'] = job_tracker.queue_position(job)
+        counts[item['status']] += 1
+        items.append(item)
+    return {
+        'batch_id': batch['batch_id'],
+        'workflow': batch['workflow'],
+        'created_at': batch['created_at'],
+        'total': len(items),
+        'finished': counts['pending'] + counts['running'] == 0,
+        'counts': counts,
+        'items': items
+    }
+
+
+def queue_item_prompt_id(item):
+    """取出队列项中的prompt_id（ComfyUI返回 [number, prompt_id, prompt, extra, outputs] 列表）"""
+    if isinstance(item, dict):
+        return item.get('prompt_id')
+    return item[1] if len(item) > 1 else None
+
+
+def tracked_task_status(prompt_id):
+    """从任务状态表构建状态响应；任务未被跟踪或事件流离线时返回 None"""
+    job = job_tracker.get(prompt_id)
+    if job is None:
+        return None
+    if admission_queue.is_queued(prompt_id):
+        return {
+            'status': 'pending',
+            'message': 'Task is waiting in the local queue',
+            'local_queue_position': admission_queue.position(prompt_id),
+            'queue_position': None
+        }
+    if not job.finished and (job.rehydrated or not is_stream_connected(job.backend)):
+        return None
+
+    if job.status == 'pending':
+        return {
+            'status': 'pending',
+            'message': 'Task is waiting in queue',
+            'local_queue_position': None,
+            'queue_position': job_tracker.queue_position(job)
+        }
+    if job.status == 'running':
+        return {
+            'status': 'running',
+            'message': 'Task is currently running',
+            'progress': job.progress()
+        }
+    if job.status == 'failed':
+        return {
+            'status': 'failed',
+            'message': job.error or 'Task failed'
+        }
+    result = {
+        'status': 'completed',
+        'message': 'Task completed successfully' if job.outputs else 'Task completed but no outputs found',
+        'outputs': job.outputs
+    }
+    if job.uploads is not None:
+        result['uploads'] = job.uploads
+    return result
+
+
+def _resume_jobs(jobs):
+    """重启前未结束的任务：事件发往旧进程的客户端ID，改为定期查询ComfyUI直到任务结束
+
+    先查 /queue 再查 /history：ComfyUI先写入历史记录再移出队列，两处都找不到的任务已经丢失
+    （例如ComfyUI也重启了），标记为失败。
+    """
+    while jobs:
+        for backend in {job.backend for job in jobs}:
+            try:
+                queue_data = json_codec.loads(get_client(backend).request('GET', '/queue').content)
+            except Exception as e:
+                logger.warning('Resume: error checking queue: %s', e, extra={'backend': backend})
+                continue
+            queued = {
+                queue_item_prompt_id(item)
+                for item in queue_data.get('queue_running', []) + queue_data.get('queue_pending', [])
+            }
+            for job in [job for job in jobs if job.backend == backend]:
+                try:
+                    history = fetch_history(job.prompt_id, backend)
+                except Exception as e:
+                    logger.warning('Resume: error checking history: %s', e, extra={'prompt_id': job.prompt_id})
+                    continue
+                if job.prompt_id in history:
+                    job_tracker.complete_from_history(job.prompt_id, history[job.prompt_id])
+                elif job.prompt_id not in queued:
+                    job_tracker.fail(job.prompt_id, 'Task was lost while the service was restarting')
+        jobs = [job for job in jobs if not job.finished]
+        if jobs:
+            time.sleep(Config.RUN_OFFLINE_POLL_INTERVAL)
+
+
+def resume_jobs():
+    """从持久化存储恢复未结束的任务；还在本地队列中、没有提交到ComfyUI的任务无法恢复，标记为失败"""
+    jobs = []
+    for job in job_tracker.rehydrate():
+        if job.backend is None:
+            job_tracker.fail(job.prompt_id, 'Service restarted before the task was submitted to ComfyUI')
+        else:
+            jobs.append(job)
+    if jobs:
+        logger.info('Resuming %d unfinished tasks from the job store', len(jobs))
+        threading.Thread(target=_resume_jobs, args=(jobs,), name='job-resume', daemon=True).start()
+
+
+resume_jobs()
@@ -0,0 +1,56 @@
+"""测试公共配置与夹具
+
+service/app 在导入时按 Config 创建任务存储、磁盘缓存等全局对象，因此在这里先关闭会写入仓库目录或
+依赖外部服务的功能。桩服务（fake_comfyui.py 等）与基准测试共用 benchmarks/ 目录下的实现。
+"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+
+from config import Config  # noqa: E402
+
+Config.JOB_STORE_ENABLED = False
+Config.OUTPUT_CACHE_ENABLED = False
+Config.DEDUP_ENABLED = False
+Config.ADMISSION_ENABLED = False
+Config.LSKY_UPLOAD_URL = ''
+Config.COMFYUI_WS_ENABLED = True
+Config.UPSTREAM_CACHE_TTL = 0
+# 后端池的后台刷新只在启动时跑一轮，测试中显式调用 refresh()
+Config.BACKEND_REFRESH_INTERVAL = 3600
+
+from fake_comfyui import start_fake_comfyui  # noqa: E402
+
+
+@pytest.fixture
+def comfyui():
+    """每个测试一个独立的 fake ComfyUI，返回 (server, base_url)"""
+    server, base_url = start_fake_comfyui(image_size=4096)
+    yield server, base_url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def wait_until():
+    """轮询直到 predicate() 为真，超时则测试失败"""
+    def wait(predicate, timeout=5.0, message='condition not met'):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return
+            time.sleep(0.02)
+        pytest.fail(f'timed out: {message}')
+    return wait
+
+
+@pytest.fixture
+def client():
+    import app
+    return app.app.test_client()
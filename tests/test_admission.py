@@ -0,0 +1,128 @@
+"""本地准入队列：后端负载包含其他客户端直接提交到ComfyUI的任务"""
+import time
+
+import pytest
+
+import app
+import async_app
+import service
+from admission import AdmissionQueue, Ticket
+from backend_pool import BackendPool
+from config import Config
+
+BACKEND = 'http://comfyui.invalid'
+
+
+@pytest.fixture
+def pool():
+    return BackendPool([BACKEND])
+
+
+@pytest.fixture
+def admission(pool):
+    """启动放行线程，返回 (queue, dispatched)；dispatched 为已放行的 prompt_id"""
+    queue = AdmissionQueue(pool, max_inflight=2, watermark=1)
+    dispatched = []
+
+    def dispatch(ticket, backend):
+        dispatched.append(ticket.prompt_id)
+        pool.note_submitted(backend)
+
+    queue.start(dispatch, poll_interval=0.02)
+    return queue, dispatched
+
+
+def ticket(prompt_id):
+    return Ticket(prompt_id, 'test', {})
+
+
+def held(dispatched):
+    """放行线程每 poll_interval 重新检查一次，等待几轮后仍没有放行"""
+    time.sleep(0.2)
+    return not dispatched
+
+
+def set_queue_depth(server, depth):
+    """模拟其他客户端直接提交到ComfyUI的任务；直接放入 running 的条目不会被桩服务执行"""
+    with server.lock:
+        server.running[:] = [[n, f'other-{n}', {}, {}, []] for n in range(depth)]
+
+
+def test_external_queue_depth_holds_tickets_until_below_watermark(comfyui, wait_until):
+    server, base_url = comfyui
+    pool = BackendPool([base_url])
+    queue = AdmissionQueue(pool, max_inflight=2, watermark=1)
+    dispatched = []
+    queue.start(lambda ticket, backend: dispatched.append(ticket.prompt_id), poll_interval=0.02)
+    backend = pool.get(base_url)
+
+    set_queue_depth(server, 2)
+    pool.refresh(backend)
+    assert queue.submit(ticket('a')) is None
+    assert queue.position('a') == 1
+    # 只有一个后端时也启动了刷新线程
+    assert pool._thread is not None
+
+    # 降到 1 仍不低于低水位
+    set_queue_depth(server, 1)
+    pool.refresh(backend)
+    assert held(dispatched)
+    assert queue.is_queued('a')
+
+    set_queue_depth(server, 0)
+    pool.refresh(backend)
+    wait_until(lambda: dispatched == ['a'], message='release below watermark')
+    assert queue.stats()['inflight'] == {base_url: 1}
+
+
+def test_finished_jobs_are_deducted_from_cached_depth(pool, admission, wait_until):
+    queue, dispatched = admission
+    backend = pool.get(BACKEND)
+
+    assert queue.submit(ticket('a')) == BACKEND
+    pool.note_submitted(BACKEND)
+    assert queue.submit(ticket('b')) == BACKEND
+    pool.note_submitted(BACKEND)
+    assert backend.queue_depth == 2
+    assert queue.submit(ticket('c')) is None
+
+    # 与 service 中的结束回调顺序一致：先扣除队列深度再归还名额
+    pool.note_finished(BACKEND)
+    queue.release('a')
+    assert held(dispatched)
+
+    pool.note_finished(BACKEND)
+    queue.release('b')
+    wait_until(lambda: dispatched == ['c'], message='release after both finished')
+    assert backend.queue_depth == 1
+
+
+def test_unavailable_backend_requeues_instead_of_failing(comfyui, client, monkeypatch, wait_until):
+    server, base_url = comfyui
+    pool = BackendPool([base_url])
+    for target in (service, app, service.admission_queue):
+        monkeypatch.setattr(target, 'backend_pool', pool)
+    monkeypatch.setattr(Config, 'ADMISSION_ENABLED', True)
+    monkeypatch.setattr(Config, 'COMFYUI_RETRY_BACKOFF', 0.01)
+    # 前两次提交时ComfyUI队列已满，返回 503
+    enqueue, attempts = server.enqueue, []
+
+    def flaky_enqueue(payload):
+        attempts.append(payload['prompt_id'])
+        return enqueue(payload) if len(attempts) > 2 else None
+
+    monkeypatch.setattr(server, 'enqueue', flaky_enqueue)
+
+    response = client.post('/api/workflow/sdxl', json={'prompt': 'requeue'})
+    assert response.status_code == 202
+    prompt_id = response.get_json()['prompt_id']
+    # 两次重新排队之间任务状态会短暂移除
+    wait_until(lambda: getattr(service.job_tracker.get(prompt_id), 'status', None) == 'completed',
+               message='completion after requeue')
+    assert attempts == [prompt_id] * 3
+
+
+def test_async_server_refuses_to_start_with_admission(monkeypatch):
+    monkeypatch.setattr(Config, 'ADMISSION_ENABLED', True)
+    with pytest.raises(RuntimeError, match='ADMISSION_ENABLED'):
+        async_app.create_app()
@@ -0,0 +1,133 @@
+"""多后端：按队列深度路由、任务固定到提交时的后端、健康检查剔除与恢复"""
+import pytest
+
+import app
+import service
+from backend_pool import BackendPool
+from comfy_client import get_client
+from config import Config
+from fake_comfyui import start_fake_comfyui
+
+WORKFLOW = 'sdxl'
+
+
+@pytest.fixture
+def backends(monkeypatch, wait_until):
+    """三个 fake ComfyUI 组成的后端池，返回 [(server, base_url)]；websocket关闭，状态都从后端查询"""
+    monkeypatch.setattr(Config, 'COMFYUI_WS_ENABLED', False)
+    stubs = [start_fake_comfyui(image_size=4096) for _ in range(3)]
+    pool = BackendPool([base_url for _, base_url in stubs], max_failures=2)
+    monkeypatch.setattr(service, 'backend_pool', pool)
+    monkeypatch.setattr(app, 'backend_pool', pool)
+    # 后台刷新线程跑完第一轮后长时间休眠，之后由测试显式调用 refresh()
+    pool.start()
+    wait_until(lambda: all(backend.last_checked for backend in pool.backends), message='initial refresh')
+    yield stubs
+    for server, _ in stubs:
+        server.shutdown()
+        server.server_close()
+
+
+def set_queue_depth(server, depth):
+    """直接放入 running 的条目不会被桩服务的工作线程执行，用来模拟繁忙的后端"""
+    with server.lock:
+        server.running[:] = [[n, f'busy-{n}', {}, {}, []] for n in range(depth)]
+
+
+def refresh_all():
+    for backend in service.backend_pool.backends:
+        service.backend_pool.refresh(backend)
+
+
+def submit(client):
+    response = client.post(f'/api/workflow/{WORKFLOW}', json={})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['prompt_id']
+
+
+def submissions(server):
+    return server.number
+
+
+def test_routes_to_least_loaded_backend(backends, client):
+    (busy, _), (idle, idle_url), (medium, medium_url) = backends
+    set_queue_depth(busy, 5)
+    set_queue_depth(medium, 2)
+    refresh_all()
+
+    prompt_id = submit(client)
+    assert service.job_tracker.get(prompt_id).backend == idle_url
+    assert (submissions(busy), submissions(idle), submissions(medium)) == (0, 1, 0)
+
+    set_queue_depth(idle, 8)
+    refresh_all()
+    prompt_id = submit(client)
+    assert service.job_tracker.get(prompt_id).backend == medium_url
+    assert submissions(busy) == 0
+
+
+def test_task_status_history_and_image_follow_the_submitting_backend(backends, client, wait_until):
+    (default, _), (target, target_url), (other, _) = backends
+    set_queue_depth(default, 3)
+    set_queue_depth(other, 3)
+    refresh_all()
+    prompt_id = submit(client)
+    assert service.job_tracker.get(prompt_id).backend == target_url
+    wait_until(lambda: prompt_id in target.history, message='fake execution')
+    default_calls, other_calls = dict(default.calls), dict(other.calls)
+
+    status = client.get(f'/api/task_status/{prompt_id}').get_json()
+    assert status['status'] == 'completed'
+    history = client.get(f'/api/history/{prompt_id}').get_json()
+    assert prompt_id in history
+    images = client.get(f'/api/image/{prompt_id}').get_json()['images']
+    assert images and images[0]['url'].startswith(target_url)
+    content = client.get(f'/api/image/{prompt_id}/0/content')
+    assert content.status_code == 200
+    assert content.get_data() == target.image_bytes(images[0]['filename'])
+
+    assert target.calls.get('/history/<id>', 0) >= 1
+    assert target.calls.get('/view', 0) == 1
+    # 其他后端没有收到任何与该任务有关的请求
+    assert default.calls == default_calls
+    assert other.calls == other_calls
+
+
+def test_failed_health_checks_eject_and_recovery_readmits(backends, client):
+    (first, _), (flaky, flaky_url), (third, third_url) = backends
+    set_queue_depth(first, 5)
+    set_queue_depth(third, 2)
+    flaky.error_rate = 1.0
+    refresh_all()
+    backend = service.backend_pool.get(flaky_url)
+    assert backend.healthy, 'one failure is below max_failures'
+    refresh_all()
+    assert not backend.healthy
+
+    status = {b['base_url']: b for b in client.get('/api/backends').get_json()['backends']}
+    assert status[flaky_url]['healthy'] is False
+    assert status[flaky_url]['failures'] == 2
+    prompt_id = submit(client)
+    assert service.job_tracker.get(prompt_id).backend == third_url
+    assert submissions(flaky) == 0
+
+    flaky.error_rate = 0.0
+    refresh_all()
+    assert backend.healthy and backend.failures == 0
+    prompt_id = submit(client)
+    assert service.job_tracker.get(prompt_id).backend == flaky_url
+
+
+def test_connection_failure_on_submit_fails_over(backends, client):
+    (first, _), (dead, dead_url), (third, third_url) = backends
+    set_queue_depth(first, 5)
+    set_queue_depth(third, 2)
+    refresh_all()
+    dead.shutdown()
+    dead.server_close()
+    # 桩服务停止后，连接池里的长连接仍由处理线程服务，关掉它们才会真正连接失败
+    get_client(dead_url).session.close()
+
+    prompt_id = submit(client)
+    assert service.job_tracker.get(prompt_id).backend == third_url
+    assert not service.backend_pool.get(dead_url).healthy
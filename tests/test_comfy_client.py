@@ -0,0 +1,36 @@
+"""ComfyUI客户端的重试：请求线程不等待退避，状态码重试只用于幂等方法"""
+import pytest
+import requests
+
+from comfy_client import ComfyUIClient
+
+
+@pytest.fixture
+def failing(comfyui):
+    """所有请求都返回 500 的 fake ComfyUI，返回 (server, client)"""
+    server, base_url = comfyui
+    server.error_rate = 1.0
+    client = ComfyUIClient(base_url, max_retries=3, retry_backoff=0.01)
+    yield server, client
+    client.close()
+
+
+def test_request_thread_fails_fast(failing):
+    server, client = failing
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.request('GET', '/system_stats')
+    assert server.calls['/system_stats'] == 1
+
+
+def test_background_request_backs_off(failing):
+    server, client = failing
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.request('GET', '/system_stats', backoff=True)
+    assert server.calls['/system_stats'] == 3
+
+
+def test_prompt_is_not_replayed_after_server_error(failing):
+    server, client = failing
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.request('POST', '/prompt', json={'prompt': {}}, backoff=True)
+    assert server.calls['/prompt'] == 1
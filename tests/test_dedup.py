@@ -0,0 +1,150 @@
+"""重复提交去重：同步和 asyncio 两种服务模式复用同一个任务，已完成任务的响应与 /api/image 的图片一致；
+提交到ComfyUI之前到达的重复请求也复用该任务"""
+import asyncio
+import threading
+import uuid
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import app
+import async_app
+import service
+from backend_pool import BackendPool
+from config import Config
+
+WORKFLOW = 'sdxl'
+
+
+@pytest.fixture
+def backend(comfyui, monkeypatch):
+    """去重开启、后端池只包含 fake ComfyUI，返回 (server, base_url)"""
+    server, base_url = comfyui
+    pool = BackendPool([base_url])
+    for module in (service, app, async_app):
+        monkeypatch.setattr(module, 'backend_pool', pool)
+    monkeypatch.setattr(Config, 'DEDUP_ENABLED', True)
+    return server, base_url
+
+
+def unique_request():
+    # 去重表是进程级的，每个测试使用不同的提示词
+    return {'prompt': f'dedup {uuid.uuid4()}'}
+
+
+def test_duplicate_submissions_share_the_task_and_return_images(backend, client, wait_until):
+    server, _ = backend
+    body = unique_request()
+
+    first = client.post(f'/api/workflow/{WORKFLOW}', json=body).get_json()
+    second = client.post(f'/api/workflow/{WORKFLOW}', json=body).get_json()
+    assert second['deduplicated'] is True
+    assert second['prompt_id'] == first['prompt_id']
+    assert server.calls.get('/prompt', 0) == 1
+
+    prompt_id = first['prompt_id']
+    wait_until(lambda: service.job_tracker.get(prompt_id).status == 'completed', message='completion')
+    completed = client.post(f'/api/workflow/{WORKFLOW}', json=body).get_json()
+    assert completed['task_status'] == 'completed'
+    images = client.get(f'/api/image/{prompt_id}').get_json()['images']
+    assert completed['images'] == images
+    assert all(image['content_url'] for image in completed['images'])
+    assert client.get(completed['images'][0]['content_url']).status_code == 200
+
+    # 要求重新生成时不复用
+    fresh = client.post(f'/api/workflow/{WORKFLOW}', json=body, headers={'X-No-Dedup': '1'}).get_json()
+    assert fresh['prompt_id'] != prompt_id
+    assert 'deduplicated' not in fresh
+
+
+def test_async_submissions_are_deduplicated(backend):
+    server, _ = backend
+    body = unique_request()
+
+    async def post(client, **kwargs):
+        response = await client.post(f'/api/workflow/{WORKFLOW}', json=body, **kwargs)
+        assert response.status == 200
+        return await response.json()
+
+    async def run():
+        async with TestClient(TestServer(async_app.create_app())) as client:
+            first = await post(client)
+            second = await post(client)
+            assert second['deduplicated'] is True
+            assert second['prompt_id'] == first['prompt_id']
+            assert server.calls.get('/prompt', 0) == 1
+
+            prompt_id = first['prompt_id']
+            while service.job_tracker.get(prompt_id).status != 'completed':
+                await asyncio.sleep(0.02)
+            completed = await post(client)
+            assert completed['task_status'] == 'completed'
+            response = await client.get(f'/api/image/{prompt_id}')
+            assert completed['images'] == (await response.json())['images']
+            assert all(image['content_url'] for image in completed['images'])
+
+            fresh = await post(client, headers={'X-No-Dedup': 'true'})
+            assert fresh['prompt_id'] != prompt_id
+
+    asyncio.run(asyncio.wait_for(run(), timeout=10))
+
+
+def test_duplicate_during_submission_attaches_to_claimed_task(backend, client, monkeypatch, wait_until):
+    server, _ = backend
+    body = unique_request()
+    # 第一个请求停在 /prompt 上，直到第二个请求返回
+    enqueue, entered, proceed = server.enqueue, threading.Event(), threading.Event()
+
+    def slow_enqueue(payload):
+        entered.set()
+        proceed.wait(5)
+        return enqueue(payload)
+
+    monkeypatch.setattr(server, 'enqueue', slow_enqueue)
+    first = {}
+
+    def submit():
+        with app.app.test_client() as other:
+            first.update(other.post(f'/api/workflow/{WORKFLOW}', json=body).get_json())
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+    try:
+        assert entered.wait(5)
+        second = client.post(f'/api/workflow/{WORKFLOW}', json=body).get_json()
+    finally:
+        proceed.set()
+        thread.join(5)
+    assert second['deduplicated'] is True
+    assert second['prompt_id'] == first['prompt_id']
+    assert server.calls.get('/prompt', 0) == 1
+
+
+def test_failed_submission_is_not_reused(backend, client, monkeypatch):
+    server, _ = backend
+    body = unique_request()
+    monkeypatch.setattr(server, 'node_errors', {'3': {'errors': [{'message': 'Value not in list'}]}})
+
+    failed = client.post(f'/api/workflow/{WORKFLOW}', json=body)
+    assert failed.status_code == 502
+    assert 'Value not in list' in failed.get_json()['response']
+
+    monkeypatch.setattr(server, 'node_errors', {})
+    retried = client.post(f'/api/workflow/{WORKFLOW}', json=body).get_json()
+    assert 'deduplicated' not in retried
+    assert server.calls.get('/prompt', 0) == 2
+
+
+def test_async_passes_upstream_validation_errors_through(backend):
+    server, _ = backend
+    server.node_errors = {'3': {'errors': [{'message': 'Value not in list'}]}}
+
+    async def run():
+        async with TestClient(TestServer(async_app.create_app())) as client:
+            response = await client.post(f'/api/workflow/{WORKFLOW}', json=unique_request())
+            assert response.status == 502
+            return await response.json()
+
+    body = asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert body['status_code'] == 400
+    assert 'Value not in list' in body['response']
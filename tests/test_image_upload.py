@@ -0,0 +1,123 @@
+"""任务完成后上传到兰空图床：多张图片并发上传、5xx 重试、图床地址写入任务状态和持久化存储"""
+import time
+import uuid
+
+import pytest
+
+import service
+from config import Config
+from fake_lsky import start_fake_lsky
+from image_sink import LskySink
+from job_store import JobStore
+
+TOKEN = 'test-token'
+IMAGES = 4
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setattr(service.job_tracker, 'store', store)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def lsky(monkeypatch):
+    """返回 start(**options) -> 桩服务；service.image_sink 指向该桩服务"""
+    servers = []
+    monkeypatch.setattr(Config, 'COMFYUI_RETRY_BACKOFF', 0.01)
+
+    def start(token=TOKEN, **options):
+        server, upload_url = start_fake_lsky(token=TOKEN, **options)
+        servers.append(server)
+        monkeypatch.setattr(service, 'image_sink', LskySink(upload_url, token, pool_size=IMAGES))
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def completed_job(base_url):
+    """登记一个在 fake ComfyUI 上完成、输出 IMAGES 张图片的任务"""
+    prompt_id = str(uuid.uuid4())
+    service.job_tracker.register(prompt_id, 'test', base_url, 1, client_id=service.CLIENT_ID)
+    images = [{'filename': f'{prompt_id}_{n}.png', 'subfolder': '', 'type': 'output'} for n in range(IMAGES)]
+    return service.job_tracker.complete_from_history(prompt_id, {
+        'outputs': {'9': {'images': images}},
+        'status': {'status_str': 'success', 'completed': True},
+    })
+
+
+def upload(job, wait_until):
+    service.upload_outputs(job)
+    wait_until(lambda: all(item['status'] != 'pending' for item in job.uploads), timeout=10, message='uploads')
+    return job.uploads
+
+
+def test_uploads_all_images_concurrently_and_persists_urls(comfyui, lsky, store, client, wait_until):
+    _, base_url = comfyui
+    server = lsky(latency=0.3)
+    job = completed_job(base_url)
+
+    start = time.monotonic()
+    uploads = upload(job, wait_until)
+    elapsed = time.monotonic() - start
+
+    assert [item['status'] for item in uploads] == ['uploaded'] * IMAGES
+    assert len({item['url'] for item in uploads}) == IMAGES
+    assert sorted(server.uploads) == sorted(item['filename'] for item in uploads)
+    # 逐张上传至少需要 IMAGES * latency
+    assert elapsed < 0.3 * IMAGES * 0.75
+
+    stored = store.get(job.prompt_id)
+    assert stored.uploads == uploads
+    images = client.get(f'/api/image/{job.prompt_id}').get_json()['images']
+    assert [image['upload_url'] for image in images] == [item['url'] for item in uploads]
+
+
+def test_retries_server_errors(comfyui, lsky, store, wait_until):
+    _, base_url = comfyui
+    # 每两次请求有一次返回 500
+    server = lsky(fail_every=2)
+    job = completed_job(base_url)
+
+    uploads = upload(job, wait_until)
+
+    assert [item['status'] for item in uploads] == ['uploaded'] * IMAGES
+    assert server.requests > IMAGES
+    assert len(server.uploads) == IMAGES
+    assert store.get(job.prompt_id).uploads == uploads
+
+
+def test_rejected_upload_is_not_retried(comfyui, lsky, store, wait_until):
+    _, base_url = comfyui
+    server = lsky(token='wrong-token')
+    job = completed_job(base_url)
+
+    uploads = upload(job, wait_until)
+
+    assert [item['status'] for item in uploads] == ['failed'] * IMAGES
+    assert all('Unauthenticated' in item['error'] for item in uploads)
+    assert server.rejected == IMAGES
+    assert not server.uploads
+    assert store.get(job.prompt_id).uploads == uploads
+
+
+def test_unexpected_error_marks_upload_failed(comfyui, lsky, store, monkeypatch, wait_until):
+    _, base_url = comfyui
+    server = lsky()
+    job = completed_job(base_url)
+
+    def broken(*args, **kwargs):
+        raise ValueError('cannot decode image')
+
+    monkeypatch.setattr(service, 'open_output', broken)
+    uploads = upload(job, wait_until)
+
+    assert [item['status'] for item in uploads] == ['failed'] * IMAGES
+    assert all('cannot decode image' in item['error'] for item in uploads)
+    assert not server.uploads
+    assert store.get(job.prompt_id).uploads == uploads
@@ -0,0 +1,30 @@
+"""输入图片：本地记录命中时不访问后端，记录过期后重新确认，后端已删除的图片会重新上传"""
+import io
+import time
+
+from input_images import InputImageStore
+
+NAME = '0123456789abcdef0123456789abcdef.png'
+IMAGE = b'\x89PNG\r\n\x1a\n' + b'\0' * 64
+
+
+def ensure(store, base_url):
+    return store.ensure(base_url, NAME, io.BytesIO(IMAGE), len(IMAGE), 'image/png')
+
+
+def test_known_images_are_rechecked_after_ttl(comfyui):
+    server, base_url = comfyui
+    store = InputImageStore('api', ttl=0.2)
+
+    assert ensure(store, base_url) == 'uploaded'
+    assert server.inputs[f'api/{NAME}'] == IMAGE
+    assert ensure(store, base_url) == 'known'
+    assert server.calls.get('/upload/image') == 1
+
+    # 后端的 input 目录被清理
+    server.inputs.clear()
+    assert ensure(store, base_url) == 'known'
+    time.sleep(0.25)
+    assert ensure(store, base_url) == 'uploaded'
+    assert server.inputs[f'api/{NAME}'] == IMAGE
+    assert server.calls.get('/upload/image') == 2
@@ -0,0 +1,60 @@
+"""日志：消息参数和异常堆栈在监听线程中格式化，可变参数在记录时先生成消息"""
+import io
+import json
+import logging
+
+import pytest
+
+import app_logging
+from app_logging import LazyJSON, QueueHandler, configure_logging
+
+
+@pytest.fixture
+def output():
+    """JSON 格式日志写入 StringIO，测试结束后恢复默认配置"""
+    stream = io.StringIO()
+    configure_logging('INFO', 'json', stream)
+
+    def lines():
+        # stop() 等待队列中的记录全部写出
+        app_logging._listener.stop()
+        app_logging._listener.start()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield lines
+    configure_logging()
+
+
+def record(msg, args, exc_info=None):
+    return logging.LogRecord('test', logging.ERROR, __file__, 1, msg, args, exc_info)
+
+
+def test_prepare_defers_formatting_of_immutable_args_and_tracebacks():
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        prepared = QueueHandler(None).prepare(record('Upload of %s failed after %d attempts', ('a.png', 3),
+                                                     exc_info=True))
+    assert prepared.args == ('a.png', 3)
+    assert prepared.exc_info is not None and prepared.exc_text is None
+
+
+def test_prepare_formats_mutable_args_immediately():
+    data = {'3': 'missing input'}
+    prepared = QueueHandler(None).prepare(record('Node errors: %s', (LazyJSON(data),)))
+    data['3'] = 'changed'
+    assert prepared.args is None
+    assert prepared.getMessage() == 'Node errors: {"3": "missing input"}'
+
+
+def test_listener_writes_message_and_traceback(output):
+    logger = logging.getLogger('test')
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        logger.exception('Upload of %s failed', 'a.png', extra={'prompt_id': 'p1'})
+
+    entry, = output()
+    assert entry['message'] == 'Upload of a.png failed'
+    assert entry['prompt_id'] == 'p1'
+    assert 'ValueError: boom' in entry['exc_info']
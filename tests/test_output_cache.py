@@ -0,0 +1,93 @@
+"""本地图片缓存：淘汰时删除映射，index.jsonl 不无限增长；正在使用的文件不被删除，超过上限的图片不缓存"""
+import os
+
+import output_cache
+from output_cache import OutputCache
+
+
+def write(cache, prompt_id, index, data):
+    """写入缓存，返回 (key, commit() 返回的 CachedOutput)"""
+    key = (prompt_id, 'output', '', f'{prompt_id}_{index}.png')
+    writer = cache.writer(key, 'image/png', index)
+    writer.write(data)
+    return key, writer.commit()
+
+
+def put(cache, prompt_id, index, data):
+    return write(cache, prompt_id, index, data)[0]
+
+
+def read(cached):
+    with open(cached.path, 'rb') as f:
+        return f.read()
+
+
+def index_lines(cache):
+    with open(cache.index_path, encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+
+def test_eviction_drops_keys_and_index_entries(tmp_path):
+    cache = OutputCache(tmp_path, max_bytes=3000)
+    keys = [put(cache, f'p{n}', 0, bytes([n]) * 1000) for n in range(10)]
+
+    assert cache.stats()['blobs'] == 3
+    assert len(cache._keys) == 3
+    assert len(cache._by_index) == 3
+    assert len(cache._digest_keys) == 3
+    assert cache.get(keys[0]) is None
+    assert cache.get_by_index('p0', 0) is None
+    assert cache.get_by_index('p9', 0).size == 1000
+
+
+def test_shared_blob_keeps_all_keys_until_evicted(tmp_path):
+    cache = OutputCache(tmp_path, max_bytes=2500)
+    first = put(cache, 'a', 0, b'x' * 1000)
+    second = put(cache, 'b', 0, b'x' * 1000)
+    assert cache.get(first).digest == cache.get(second).digest
+    put(cache, 'c', 0, b'y' * 1000)
+    put(cache, 'd', 0, b'z' * 1000)
+    assert cache.get(first) is None and cache.get(second) is None
+    assert cache.get_by_index('a', 0) is None and cache.get_by_index('b', 0) is None
+
+
+def test_index_file_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_cache, 'INDEX_COMPACT_MIN_LINES', 10)
+    cache = OutputCache(tmp_path, max_bytes=5000)
+    for n in range(100):
+        put(cache, f'p{n}', 0, n.to_bytes(2, 'big') * 500)
+        assert index_lines(cache) <= max(10, 2 * len(cache._keys)) + 1
+
+    # 重启后只加载仍然存在的图片
+    reloaded = OutputCache(tmp_path, max_bytes=5000)
+    assert set(reloaded._keys) == set(cache._keys)
+    assert index_lines(reloaded) == len(reloaded._keys)
+    assert len(os.listdir(reloaded.tmp_dir)) == 0
+
+
+def test_file_in_use_survives_eviction(tmp_path):
+    cache = OutputCache(tmp_path, max_bytes=2500)
+    key = put(cache, 'a', 0, b'a' * 1000)
+    serving = cache.get(key)
+    put(cache, 'b', 0, b'b' * 1000)
+    put(cache, 'c', 0, b'c' * 1000)
+
+    # 已从索引中淘汰，但正在发送的文件仍然完整
+    assert cache.get(key) is None
+    assert cache.stats()['bytes'] == 2000
+    assert read(serving) == b'a' * 1000
+    serving.release()
+    assert not os.path.exists(serving.path)
+
+
+def test_oversize_output_is_served_but_not_cached(tmp_path):
+    cache = OutputCache(tmp_path, max_bytes=1000)
+    kept = put(cache, 'small', 0, b's' * 500)
+    key, cached = write(cache, 'big', 0, b'b' * 2000)
+
+    assert read(cached) == b'b' * 2000
+    assert cache.get(key) is None
+    assert cache.get(kept) is not None
+    assert cache.stats()['blobs'] == 1
+    del cached
+    assert os.listdir(cache.tmp_dir) == []
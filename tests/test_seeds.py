@@ -0,0 +1,48 @@
+"""种子策略：批量 increment 时各项的随机取值节点种子互不重复，相同种子可以复现"""
+import json
+
+import pytest
+
+import service
+from workflow_registry import WorkflowRegistry
+
+SAMPLER_AND_RANDOM = {
+    '1': {'class_type': 'KSampler', 'inputs': {'seed': 0}},
+    '2': {'class_type': 'DF_Random', 'inputs': {'seed': 0}},
+    '3': {'class_type': 'DF_Random', 'inputs': {'seed': 0}},
+}
+RANDOM_ONLY = {
+    '2': {'class_type': 'DF_Random', 'inputs': {'seed': 0}},
+    '3': {'class_type': 'easy seed', 'inputs': {'seed': 0}},
+}
+
+
+@pytest.fixture(autouse=True)
+def registry(tmp_path, monkeypatch):
+    for name, data in (('sampler', SAMPLER_AND_RANDOM), ('random', RANDOM_ONLY)):
+        (tmp_path / f'{name}.json').write_text(json.dumps(data), encoding='utf-8')
+    monkeypatch.setattr(service, 'workflow_registry', WorkflowRegistry(tmp_path))
+
+
+def seeds(workflow):
+    return [workflow[node_id]['inputs']['seed'] for node_id in sorted(workflow)]
+
+
+def test_increment_batch_random_seeds_do_not_collide():
+    batch = {'items': [{}, {}, {}], 'seed': 100, 'seed_strategy': 'increment'}
+    workflows = service.build_batch_workflows('sampler', batch)
+
+    assert [workflow['1']['inputs']['seed'] for workflow in workflows] == [100, 101, 102]
+    values = [value for workflow in workflows for value in seeds(workflow)]
+    assert len(set(values)) == len(values)
+    # 用响应中的种子单独提交得到相同的工作流
+    assert service.build_workflow('sampler', {'seed': 101}) == workflows[1]
+
+
+def test_random_only_template_uses_seed_for_first_node():
+    workflows = service.build_batch_workflows('random', {'items': [{}, {}], 'seed': 7, 'seed_strategy': 'increment'})
+
+    assert [workflow['2']['inputs']['seed'] for workflow in workflows] == [7, 8]
+    values = [value for workflow in workflows for value in seeds(workflow)]
+    assert len(set(values)) == len(values)
+    assert [service.workflow_seed('random', workflow) for workflow in workflows] == [7, 8]
@@ -0,0 +1,97 @@
+"""websocket事件驱动的任务状态：事件 -> /api/task_status，不访问ComfyUI；断线重连后用 /history 补齐"""
+import uuid
+
+import pytest
+
+import service
+from comfy_events import ensure_event_stream
+
+
+@pytest.fixture
+def tracked(comfyui, wait_until):
+    """连接到 fake ComfyUI 的事件流，返回 (server, base_url, stream)"""
+    server, base_url = comfyui
+    stream = ensure_event_stream(base_url, service.CLIENT_ID, service.job_tracker)
+    assert stream is not None, 'websocket-client is required'
+    wait_until(lambda: stream.connected and server.ws_clients.get(service.CLIENT_ID), message='websocket connect')
+    return server, base_url, stream
+
+
+def register(base_url, total_nodes):
+    prompt_id = str(uuid.uuid4())
+    service.job_tracker.register(prompt_id, 'test', base_url, total_nodes, client_id=service.CLIENT_ID)
+    return prompt_id
+
+
+def task_status(client, prompt_id):
+    response = client.get(f'/api/task_status/{prompt_id}')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_events_drive_task_status_without_upstream_calls(tracked, client, wait_until):
+    server, base_url, _ = tracked
+    prompt_id = register(base_url, total_nodes=2)
+    calls_before = dict(server.calls)
+
+    def send(event, **data):
+        server.send_event(service.CLIENT_ID, event, {'prompt_id': prompt_id, **data})
+
+    send('execution_start')
+    send('executing', node='1')
+    send('progress', node='1', value=2, max=4)
+    wait_until(lambda: task_status(client, prompt_id).get('progress', {}).get('value') == 2, message='progress')
+    status = task_status(client, prompt_id)
+    assert status['status'] == 'running'
+    assert status['progress']['node'] == '1'
+    assert status['progress']['node_percent'] == 50.0
+    # 两个节点中第一个完成一半
+    assert status['progress']['percent'] == 25.0
+
+    send('executed', node='1', output={})
+    send('executing', node='2')
+    send('progress', node='2', value=1, max=4)
+    wait_until(lambda: task_status(client, prompt_id).get('progress', {}).get('node') == '2', message='node 2')
+    assert task_status(client, prompt_id)['progress']['percent'] == 62.5
+
+    image = {'filename': f'{prompt_id}_2.png', 'subfolder': '', 'type': 'output'}
+    send('executed', node='2', output={'images': [image]})
+    send('executing', node=None)
+    wait_until(lambda: task_status(client, prompt_id)['status'] == 'completed', message='completion')
+    assert task_status(client, prompt_id)['outputs'] == {'2': {'images': [image]}}
+
+    # 状态全部来自内存状态表
+    assert server.calls == calls_before
+
+
+def test_execution_error_marks_task_failed(tracked, client, wait_until):
+    server, base_url, _ = tracked
+    prompt_id = register(base_url, total_nodes=1)
+    server.send_event(service.CLIENT_ID, 'execution_error', {
+        'prompt_id': prompt_id, 'node_id': '1', 'exception_message': 'out of memory'})
+    wait_until(lambda: task_status(client, prompt_id)['status'] == 'failed', message='failure')
+    assert task_status(client, prompt_id)['message'] == 'out of memory'
+
+
+def test_reconnect_resyncs_missed_completion_from_history(tracked, client, wait_until):
+    server, base_url, stream = tracked
+    prompt_id = register(base_url, total_nodes=1)
+    server.send_event(service.CLIENT_ID, 'execution_start', {'prompt_id': prompt_id})
+    wait_until(lambda: service.job_tracker.get(prompt_id).status == 'running', message='running')
+
+    # 断线期间任务完成，完成事件没有送达
+    outputs = {'9': {'images': [{'filename': f'{prompt_id}_9.png', 'subfolder': '', 'type': 'output'}]}}
+    server.history[prompt_id] = {
+        'prompt': [0, prompt_id, {}, {}, []],
+        'outputs': outputs,
+        'status': {'status_str': 'success', 'completed': True, 'messages': []},
+    }
+    history_calls = server.calls.get('/history/<id>', 0)
+    server.drop_ws(service.CLIENT_ID)
+
+    wait_until(lambda: service.job_tracker.get(prompt_id).finished, message='resync after reconnect')
+    assert server.calls.get('/history/<id>', 0) > history_calls
+    wait_until(lambda: stream.connected, message='reconnect')
+    status = task_status(client, prompt_id)
+    assert status['status'] == 'completed'
+    assert status['outputs'] == outputs
@@ -0,0 +1,77 @@
+"""工作流模板：errors() 校验全部模板时不挤掉缓存中的模板，结果按文件修改时间复用；种子节点按文件顺序"""
+import json
+import os
+
+import pytest
+
+import workflow_registry
+from workflow_registry import WorkflowRegistry, WorkflowTemplate
+
+VALID = {'1': {'class_type': 'KSampler', 'inputs': {'seed': 1}}}
+UI_EXPORT = {'nodes': [], 'links': []}
+
+
+def write(directory, name, data, mtime=None):
+    path = directory / f'{name}.json'
+    path.write_text(json.dumps(data), encoding='utf-8')
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """记录每次读取的模板文件名"""
+    names = []
+    load_json = workflow_registry._load_json
+
+    def counting(path, what):
+        names.append(path.name)
+        return load_json(path, what)
+
+    monkeypatch.setattr(workflow_registry, '_load_json', counting)
+    return names
+
+
+def test_errors_does_not_evict_cached_templates(tmp_path, parses):
+    for name in ('a', 'b', 'c', 'd'):
+        write(tmp_path, name, VALID)
+    write(tmp_path, 'broken', UI_EXPORT)
+    registry = WorkflowRegistry(tmp_path, max_entries=2)
+    a, b = registry.get('a'), registry.get('b')
+
+    errors = registry.errors()
+    assert list(errors) == ['broken']
+    assert 'UI export' in errors['broken']
+    assert list(registry._templates) == ['a', 'b']
+    assert registry.get('a') is a and registry.get('b') is b
+
+    # 文件未修改时不重复解析
+    parses.clear()
+    assert registry.errors() == errors
+    assert parses == []
+
+
+def test_errors_revalidates_modified_templates(tmp_path, parses):
+    write(tmp_path, 'a', VALID, mtime=1_000_000_000)
+    registry = WorkflowRegistry(tmp_path)
+    assert registry.errors() == {}
+
+    write(tmp_path, 'a', UI_EXPORT, mtime=2_000_000_000)
+    assert list(registry.errors()) == ['a']
+    write(tmp_path, 'a', VALID, mtime=3_000_000_000)
+    parses.clear()
+    assert registry.errors() == {}
+    assert parses == ['a.json']
+
+
+def test_seed_targets_follow_template_order(tmp_path):
+    data = {
+        '3': {'class_type': 'RandomNoise', 'inputs': {'noise_seed': 1}},
+        '10': {'class_type': 'KSampler', 'inputs': {'seed': 2}},
+        '5': {'class_type': 'easy seed', 'inputs': {'seed': 3}},
+        '7': {'class_type': 'KSamplerAdvanced', 'inputs': {'noise_seed': 4}},
+        '4': {'class_type': 'DF_Random', 'inputs': {'seed': 5}},
+    }
+    template = WorkflowTemplate('order', tmp_path / 'order.json', data, None)
+    assert template.seed_targets == [('3', 'noise_seed'), ('10', 'seed'), ('7', 'noise_seed')]
+    assert template.random_seed_targets == [('5', 'seed'), ('4', 'seed')]
@@ -0,0 +1,155 @@
+"""ComfyUI响应缓存：短TTL缓存加单飞合并
+
+同一个key同时只有一个请求发往上游，其余调用者等待并共享结果。
+/queue、/system_stats 按TTL缓存；已出现在 /history 中的任务不会再变化，永久缓存（LRU限制数量）。
+缓存的是解析后的JSON（/queue、/system_stats 为保留原始字节的 RawJSON），调用者不能修改返回值。
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+import json_codec
+from metrics import UPSTREAM_CACHE
+
+
+class RawJSON:
+    """上游的JSON响应体：原样转发时直接使用 content，需要读取内容时才解析（只解析一次）"""
+
+    __slots__ = ('content', '_data')
+    _UNPARSED = object()
+
+    def __init__(self, content):
+        self.content = content
+        self._data = self._UNPARSED
+
+    @property
+    def data(self):
+        if self._data is self._UNPARSED:
+            self._data = json_codec.loads(self.content)
+        return self._data
+
+
+class _Flight:
+    """一次进行中的上游请求"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class ResponseCache:
+    """key -> JSON 的缓存，ttl 为 None 的条目永不过期"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """返回 (是否命中, 值)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def store(self, key, value, ttl=None):
+        if self.max_entries <= 0:
+            return
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def fetch(self, key, loader, ttl=None, cacheable=None, label=None):
+        """取缓存，未命中时调用 loader()；并发的相同请求只调用一次 loader
+
+        cacheable(value) 返回 False 时结果只分享给同时等待的调用者，不写入缓存。
+        """
+        label = label or key[0]
+        hit, value = self.lookup(key)
+        if hit:
+            UPSTREAM_CACHE.inc(endpoint=label, result='hit')
+            return value
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            UPSTREAM_CACHE.inc(endpoint=label, result='coalesced')
+            return flight.wait()
+
+        UPSTREAM_CACHE.inc(endpoint=label, result='miss')
+        try:
+            value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        else:
+            flight.value = value
+            if cacheable is None or cacheable(value):
+                self.store(key, value, ttl)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    async def fetch_async(self, key, loader, ttl=None, cacheable=None, label=None):
+        """fetch() 的 asyncio 版本，loader 为返回协程的函数；只能在同一个事件循环中使用"""
+        label = label or key[0]
+        hit, value = self.lookup(key)
+        if hit:
+            UPSTREAM_CACHE.inc(endpoint=label, result='hit')
+            return value
+
+        future = self._async_inflight.get(key)
+        if future is not None:
+            UPSTREAM_CACHE.inc(endpoint=label, result='coalesced')
+            # shield：某个等待者被取消时不影响正在进行的请求
+            return await asyncio.shield(future)
+
+        UPSTREAM_CACHE.inc(endpoint=label, result='miss')
+        future = self._async_inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            if cacheable is None or cacheable(value):
+                self.store(key, value, ttl)
+            return value
+        finally:
+            if not future.done():
+                future.cancel()
+            self._async_inflight.pop(key, None)
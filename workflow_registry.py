@@ -0,0 +1,520 @@
+"""工作流模板注册表：每个模板只解析一次，按文件修改时间失效，LRU限制数量
+
+加载时检查模板格式（只接受API格式，拒绝界面导出的 nodes/links 格式），并为每个节点建立可覆盖输入的
+类型表。请求中的节点更新先按类型表校验并编译成 (节点ID, 输入名, 值) 的赋值列表，再写入工作流副本。
+
+模板旁可以放一个参数清单 <名称>.params.json，把 prompt、seed、width 等命名参数映射到节点输入：
+
+    {"seed": {"targets": ["51.seed", "176.seed"], "type": "int", "min": 0, "description": "随机种子"}}
+
+清单在加载模板时校验并编译，应用参数只是固定的几次赋值。
+
+提交前可以裁剪工作流：从输出节点沿 [节点ID, 输出序号] 连线反向遍历，去掉输出用不到的节点和只用于显示的
+调试节点，每个模板的裁剪结果只计算一次。
+"""
+import copy
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from config import Config
+
+# 可以直接写入提示词的文本节点类型
+TEXT_NODE_TYPES = ['Text Multiline', 'CLIPTextEncode']
+
+# 采样/噪声节点及其随机种子输入（SamplerCustomAdvanced 没有种子输入，噪声来自连接的 RandomNoise 节点）
+SEED_INPUTS = {
+    'KSampler': 'seed',
+    'KSamplerAdvanced': 'noise_seed',
+    'SamplerCustom': 'noise_seed',
+    'RandomNoise': 'noise_seed',
+}
+
+# 读取输入图片的节点及其文件名输入
+IMAGE_INPUTS = {
+    'LoadImage': 'image',
+    'LoadImageMask': 'image',
+}
+
+# 参数清单文件的后缀，以及参数类型对应的取值检查
+PARAMS_SUFFIX = '.params.json'
+PARAM_TYPES = {
+    'string': lambda value: isinstance(value, str),
+    'int': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'float': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'boolean': lambda value: isinstance(value, bool),
+}
+
+# 每次执行都可能产生不同结果的节点及其种子输入：种子为固定的非负整数时结果可复现，
+# 否则（缺省、-1 表示随机、或连线到其他节点）同一个工作流不能复用之前的结果
+NONDETERMINISTIC_NODES = {
+    'DF_Random': 'seed',
+    'Seed (rgthree)': 'seed',
+    'easy seed': 'seed',
+    'Random Prompts': 'seed',
+}
+
+
+class TemplateError(ValueError):
+    """模板文件不是可以提交给ComfyUI的API格式工作流"""
+
+
+class OverrideError(ValueError):
+    """请求中的节点更新与模板不匹配"""
+
+
+def is_link(value):
+    """连线输入的格式为 [来源节点ID, 输出序号]"""
+    return (isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+            and isinstance(value[1], int) and not isinstance(value[1], bool))
+
+
+def input_kind(value):
+    """输入值的类型：link、boolean、number、string，其他（列表、对象、null）为 any
+
+    API格式中 cfg 等浮点参数经常保存为整数，因此整数和浮点数不作区分，由ComfyUI按节点定义校验。
+    """
+    if is_link(value):
+        return 'link'
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    return 'any'
+
+
+def _accepts(kind, value):
+    """判断新值能否写入某种类型的输入；连线输入可以改为另一条连线，也可以改为固定值"""
+    if kind == 'any':
+        return True
+    if kind == 'link':
+        return is_link(value) or input_kind(value) in ('boolean', 'number', 'string')
+    return input_kind(value) == kind
+
+
+def find_unreachable(data, output_classes, debug_classes):
+    """按文件顺序返回从输出节点出发沿连线到达不了的节点ID
+
+    调试节点（如 ShowText|pysssss）不作为输出，但被其他需要的节点引用时仍然保留。模板中没有已知的输出
+    节点时，把没有被任何节点引用的非调试节点都当作输出，避免裁掉自定义保存节点。
+    """
+    roots = [
+        node_id for node_id, node in data.items()
+        if node.get('class_type') in output_classes and node.get('class_type') not in debug_classes
+    ]
+    if not roots:
+        linked = {value[0] for node in data.values() for value in node.get('inputs', {}).values() if is_link(value)}
+        roots = [
+            node_id for node_id, node in data.items()
+            if node_id not in linked and node.get('class_type') not in debug_classes
+        ]
+    reachable = set()
+    stack = list(roots)
+    while stack:
+        node_id = stack.pop()
+        if node_id in reachable or node_id not in data:
+            continue
+        reachable.add(node_id)
+        stack.extend(value[0] for value in data[node_id].get('inputs', {}).values() if is_link(value))
+    return [node_id for node_id in data if node_id not in reachable]
+
+
+def _check_api_format(data):
+    """检查模板格式，返回出错原因，格式正确时返回 None"""
+    if not isinstance(data, dict):
+        return 'the workflow must be a JSON object'
+    if isinstance(data.get('nodes'), list) and 'links' in data:
+        return ('this is a ComfyUI UI export (nodes/links), which cannot be submitted to /prompt; '
+                'export it again with "Save (API Format)"')
+    if not data:
+        return 'the workflow has no nodes'
+    for node_id, node in data.items():
+        if not isinstance(node, dict) or not isinstance(node.get('class_type'), str):
+            return f'node {node_id} has no class_type'
+        inputs = node.get('inputs', {})
+        if not isinstance(inputs, dict):
+            return f'node {node_id} inputs must be an object'
+        for input_name, value in inputs.items():
+            if is_link(value) and value[0] not in data:
+                return f'node {node_id} input {input_name} is linked to missing node {value[0]}'
+    return None
+
+
+class TemplateParam:
+    """参数清单中的一个命名参数：类型、取值范围、默认值和写入的 (节点ID, 输入名) 列表"""
+
+    def __init__(self, template, name, spec):
+        where = f'Workflow {template.name} parameter {name}'
+        if not isinstance(spec, dict):
+            raise TemplateError(f'{where} must be an object')
+        self.name = name
+        self.type = spec.get('type', 'string')
+        if self.type not in PARAM_TYPES:
+            raise TemplateError(f"{where} has unknown type {self.type}, expected one of {', '.join(PARAM_TYPES)}")
+        self._check = PARAM_TYPES[self.type]
+        paths = spec['targets'] if 'targets' in spec else [spec.get('target')]
+        if not isinstance(paths, list) or not paths:
+            raise TemplateError(f'{where} needs "target" or "targets"')
+        self.targets = []
+        for path in paths:
+            node_id, _, input_name = path.partition('.') if isinstance(path, str) else ('', '', '')
+            if input_name not in template.input_kinds.get(node_id, ()):
+                raise TemplateError(f'{where} target {path!r} is not an input of the workflow, '
+                                    f'expected "node_id.input_name"')
+            self.targets.append((node_id, input_name))
+        self.description = spec.get('description')
+        self.required = bool(spec.get('required', False))
+        self.minimum = spec.get('min')
+        self.maximum = spec.get('max')
+        self.choices = spec.get('choices')
+        if self.choices is not None and not isinstance(self.choices, list):
+            raise TemplateError(f'{where} choices must be a list')
+        # 未给出默认值时请求不传该参数就保持模板中的值，has_default 决定是否写入
+        self.has_default = 'default' in spec
+        self.default = spec['default'] if self.has_default else template.input_value(*self.targets[0])
+        if self.has_default:
+            try:
+                self.validate(self.default)
+            except OverrideError as e:
+                raise TemplateError(f'{where} default is invalid: {e}')
+
+    def validate(self, value):
+        """检查取值，不符合类型、范围或可选值时抛出 OverrideError"""
+        if not self._check(value):
+            raise OverrideError(f'Parameter {self.name} must be {self.type}')
+        if self.minimum is not None and value < self.minimum:
+            raise OverrideError(f'Parameter {self.name} must be >= {self.minimum}')
+        if self.maximum is not None and value > self.maximum:
+            raise OverrideError(f'Parameter {self.name} must be <= {self.maximum}')
+        if self.choices is not None and value not in self.choices:
+            raise OverrideError(f"Parameter {self.name} must be one of {', '.join(map(str, self.choices))}")
+        return value
+
+    def describe(self):
+        info = {
+            'type': self.type,
+            'default': self.default,
+            'required': self.required,
+            'targets': [f'{node_id}.{input_name}' for node_id, input_name in self.targets],
+        }
+        for key in ('description', 'minimum', 'maximum', 'choices'):
+            value = getattr(self, key)
+            if value is not None:
+                info[{'minimum': 'min', 'maximum': 'max'}.get(key, key)] = value
+        return info
+
+
+def _copy_node(node):
+    """复制单个节点：节点字典和 inputs 字典是新的，输入值与主副本共享
+
+    请求级的修改只会整体替换 inputs 中的值，因此不需要深拷贝。
+    """
+    if isinstance(node, dict) and isinstance(node.get('inputs'), dict):
+        return {**node, 'inputs': dict(node['inputs'])}
+    return copy.deepcopy(node)
+
+
+class WorkflowTemplate:
+    """已解析的工作流模板，主副本只读，通过 instantiate() 获取可修改的副本"""
+
+    def __init__(self, name, path, data, mtime, params=None):
+        error = _check_api_format(data)
+        if error is not None:
+            raise TemplateError(f'Workflow {name} is invalid: {error}')
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self._data = data
+        # 每个节点可覆盖的输入及其类型：节点ID -> {输入名: 类型}
+        self.input_kinds = {
+            node_id: {input_name: input_kind(value) for input_name, value in node.get('inputs', {}).items()}
+            for node_id, node in data.items()
+        }
+        # 节点在文件中的顺序，以及按 class_type 建立的节点索引
+        self.node_order = {}
+        self.nodes_by_class = {}
+        for index, (node_id, node) in enumerate(data.items()):
+            if not isinstance(node, dict) or 'class_type' not in node:
+                continue
+            self.node_order[node_id] = index
+            self.nodes_by_class.setdefault(node['class_type'], []).append(node_id)
+        # 可以直接写入种子的 (节点ID, 输入名)，按文件顺序，连线输入（[node_id, slot]）不算；
+        # 第一个为响应中返回的 seed
+        self.seed_targets = sorted(
+            (
+                (node_id, input_name)
+                for class_type, input_name in SEED_INPUTS.items()
+                for node_id in self.nodes_by_class.get(class_type, ())
+                if isinstance(data[node_id].get('inputs', {}).get(input_name), int)
+            ),
+            key=lambda target: self.node_order[target[0]]
+        )
+        # 不确定性节点的 (节点ID, 种子输入名)，按文件顺序
+        self.random_nodes = sorted(
+            (
+                (node_id, input_name)
+                for class_type, input_name in NONDETERMINISTIC_NODES.items()
+                for node_id in self.nodes_by_class.get(class_type, ())
+            ),
+            key=lambda target: self.node_order[target[0]]
+        )
+        # 其中种子可以直接写入的（包括 -1 等表示随机的取值），请求级种子按顺序为它们派生各自的种子
+        self.random_seed_targets = [
+            (node_id, input_name) for node_id, input_name in self.random_nodes
+            if input_kind(data[node_id].get('inputs', {}).get(input_name)) == 'number'
+        ]
+        # 可以写入输入图片的 (节点ID, 输入名)，按文件顺序，第一个为未指定 target_node 时的默认节点
+        self.image_targets = sorted(
+            (
+                (node_id, input_name)
+                for class_type, input_name in IMAGE_INPUTS.items()
+                for node_id in self.nodes_by_class.get(class_type, ())
+                if self.input_kinds[node_id].get(input_name) == 'string'
+            ),
+            key=lambda target: self.node_order[target[0]]
+        )
+        # 可以写入提示词的文本节点（按文件顺序），第一个为未指定 target_node 时的默认节点
+        self.text_nodes = [
+            node_id for node_id in self.find_nodes(TEXT_NODE_TYPES) if 'text' in self.input_kinds[node_id]
+        ]
+        # 参数清单：参数名 -> TemplateParam，没有清单时为 None
+        self.params = None
+        if params is not None:
+            if not isinstance(params, dict):
+                raise TemplateError(f'Workflow {name} parameter manifest must be an object')
+            self.params = {param_name: TemplateParam(self, param_name, spec) for param_name, spec in params.items()}
+        # 裁剪结果：(输出节点类型, 调试节点类型) -> 可以去掉的节点ID
+        self._unreachable = {}
+
+    def input_value(self, node_id, input_name):
+        """模板中某个输入的原始值"""
+        return self._data[node_id]['inputs'][input_name]
+
+    def compile_params(self, values):
+        """按参数清单校验命名参数，返回 [(节点ID, 输入名, 值)]；未传入但有默认值的参数写入默认值"""
+        if self.params is None:
+            raise OverrideError(f'Workflow {self.name} has no parameter manifest')
+        if not isinstance(values, dict):
+            raise OverrideError('params must be an object')
+        unknown = [name for name in values if name not in self.params]
+        if unknown:
+            raise OverrideError(f"Unknown parameter {', '.join(unknown)}, expected one of {', '.join(self.params)}")
+        plan = []
+        for name, param in self.params.items():
+            if name in values:
+                value = param.validate(values[name])
+            elif param.required:
+                raise OverrideError(f'Parameter {name} is required')
+            elif param.has_default:
+                value = param.default
+            else:
+                continue
+            plan.extend((node_id, input_name, value) for node_id, input_name in param.targets)
+        return plan
+
+    def compile_updates(self, updates):
+        """校验请求中的节点更新，返回 [(节点ID, 输入名, 值)]
+
+        支持 {"节点ID": {"inputs": {...}}} 和 {"节点ID": {...}} 两种写法。节点或输入不存在、
+        值的类型与模板不一致、连线指向不存在的节点时抛出 OverrideError。
+        """
+        if not isinstance(updates, dict):
+            raise OverrideError('node updates must be an object')
+        plan = []
+        for node_id, node_data in updates.items():
+            kinds = self.input_kinds.get(node_id)
+            if kinds is None:
+                raise OverrideError(f'Node {node_id} does not exist in workflow {self.name}')
+            if not isinstance(node_data, dict):
+                raise OverrideError(f'Updates for node {node_id} must be an object')
+            inputs = node_data['inputs'] if 'inputs' in node_data else node_data
+            if not isinstance(inputs, dict):
+                raise OverrideError(f'Node {node_id} inputs must be an object')
+            for input_name, value in inputs.items():
+                kind = kinds.get(input_name)
+                if kind is None:
+                    raise OverrideError(f'Node {node_id} ({self.class_type(node_id)}) has no input {input_name}')
+                if not _accepts(kind, value):
+                    raise OverrideError(f'Node {node_id} input {input_name} expects {kind}, got {input_kind(value)}')
+                if is_link(value) and value[0] not in self._data:
+                    raise OverrideError(f'Node {node_id} input {input_name} is linked to missing node {value[0]}')
+                plan.append((node_id, input_name, value))
+        return plan
+
+    def schema(self):
+        """每个节点的类型与可覆盖输入，供客户端查询"""
+        return {
+            node_id: {'class_type': self.class_type(node_id), 'inputs': kinds}
+            for node_id, kinds in self.input_kinds.items()
+        }
+
+    def __contains__(self, node_id):
+        return node_id in self.node_order
+
+    def class_type(self, node_id):
+        """返回节点的 class_type，节点不存在时返回 None"""
+        node = self._data.get(node_id)
+        return node.get('class_type') if isinstance(node, dict) else None
+
+    def find_nodes(self, class_types):
+        """按文件顺序返回属于给定类型的节点ID列表"""
+        node_ids = [
+            node_id
+            for class_type in class_types
+            for node_id in self.nodes_by_class.get(class_type, ())
+        ]
+        return sorted(node_ids, key=self.node_order.__getitem__)
+
+    def unreachable_nodes(self, output_classes, debug_classes):
+        """按模板本身的连线计算可以裁剪的节点，结果缓存在模板上（模板文件修改后随模板一起失效）"""
+        key = (frozenset(output_classes), frozenset(debug_classes))
+        removed = self._unreachable.get(key)
+        if removed is None:
+            removed = self._unreachable[key] = tuple(find_unreachable(self._data, *key))
+        return removed
+
+    def instantiate(self):
+        """返回一份可以按请求修改的工作流副本"""
+        return {node_id: _copy_node(node) for node_id, node in self._data.items()}
+
+
+def _mtime_or_none(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _load_json(path, what):
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            return json.load(f)
+        except json.JSONDecodeError as e:
+            raise TemplateError(f'Workflow {what} is invalid: {e}')
+
+
+class WorkflowRegistry:
+    """工作流目录的内存缓存"""
+
+    def __init__(self, directory, max_entries=None):
+        self.directory = directory
+        self.max_entries = max_entries or Config.WORKFLOW_CACHE_SIZE
+        self._templates = OrderedDict()
+        # 格式错误的模板：名称 -> (文件修改时间, TemplateError)，文件未修改时不再重复解析
+        self._errors = {}
+        # errors() 校验通过、未放入缓存的模板：名称 -> 文件修改时间
+        self._valid = {}
+        self._names = None
+        self._names_mtime = None
+        self._lock = threading.Lock()
+
+    def _stat(self, name):
+        """返回 (模板路径, 参数清单路径, 修改时间)；模板不存在时清除缓存并抛出 FileNotFoundError"""
+        path = self.directory / f"{name}.json"
+        params_path = self.directory / f"{name}{PARAMS_SUFFIX}"
+        try:
+            if path.name.endswith(PARAMS_SUFFIX):
+                # 参数清单本身不是工作流
+                raise FileNotFoundError
+            # 模板或参数清单任何一个被修改都重新解析
+            mtime = (os.stat(path).st_mtime_ns, _mtime_or_none(params_path))
+        except FileNotFoundError:
+            with self._lock:
+                self._templates.pop(name, None)
+                self._errors.pop(name, None)
+                self._valid.pop(name, None)
+            raise FileNotFoundError(f"Workflow {name} not found")
+        return path, params_path, mtime
+
+    def _parse(self, name, path, params_path, mtime):
+        """解析模板，格式错误时记录到 _errors 并抛出 TemplateError"""
+        # 解析放在锁外，避免大文件阻塞其他模板的读取
+        try:
+            data = _load_json(path, name)
+            params = _load_json(params_path, f'{name} parameter manifest') if mtime[1] is not None else None
+            return WorkflowTemplate(name, path, data, mtime, params)
+        except TemplateError as e:
+            with self._lock:
+                self._templates.pop(name, None)
+                self._valid.pop(name, None)
+                self._errors[name] = (mtime, e)
+            raise
+
+    def get(self, name):
+        """获取模板，文件被修改后自动重新解析；模板格式错误时抛出 TemplateError"""
+        path, params_path, mtime = self._stat(name)
+        with self._lock:
+            template = self._templates.get(name)
+            if template is not None and template.mtime == mtime:
+                self._templates.move_to_end(name)
+                return template
+            error = self._errors.get(name)
+            if error is not None and error[0] == mtime:
+                raise error[1]
+
+        template = self._parse(name, path, params_path, mtime)
+        with self._lock:
+            self._templates[name] = template
+            self._templates.move_to_end(name)
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        return template
+
+    def load(self, name):
+        """获取模板的一份可修改副本"""
+        return self.get(name).instantiate()
+
+    def names(self):
+        """列出所有工作流名称，目录未变化时直接返回缓存结果"""
+        mtime = os.stat(self.directory).st_mtime_ns
+        with self._lock:
+            if self._names is None or self._names_mtime != mtime:
+                self._names = sorted(
+                    f.stem for f in self.directory.glob('*.json') if not f.name.endswith(PARAMS_SUFFIX)
+                )
+                self._names_mtime = mtime
+            return list(self._names)
+
+    def errors(self):
+        """检查所有模板，返回格式错误的模板及原因 {名称: 错误信息}
+
+        校验结果按文件修改时间单独记录，解析出的模板不放入缓存，不会挤掉正在使用的模板。
+        """
+        errors = {}
+        for name in self.names():
+            try:
+                path, params_path, mtime = self._stat(name)
+            except FileNotFoundError:
+                continue
+            with self._lock:
+                template = self._templates.get(name)
+                if (template is not None and template.mtime == mtime) or self._valid.get(name) == mtime:
+                    continue
+                error = self._errors.get(name)
+                if error is not None and error[0] == mtime:
+                    errors[name] = str(error[1])
+                    continue
+            try:
+                self._parse(name, path, params_path, mtime)
+            except TemplateError as e:
+                errors[name] = str(e)
+            else:
+                with self._lock:
+                    self._valid[name] = mtime
+        return errors
+
+    def invalidate(self, name=None):
+        """清除指定模板（或全部模板）的缓存"""
+        with self._lock:
+            if name is None:
+                self._templates.clear()
+                self._errors.clear()
+                self._valid.clear()
+                self._names = None
+            else:
+                self._templates.pop(name, None)
+                self._errors.pop(name, None)
+                self._valid.pop(name, None)